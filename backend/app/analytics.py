@@ -0,0 +1,219 @@
+"""Payment revenue analytics served from daily rollups.
+
+``revenue_daily`` holds one row per (creation day, currency, status) with the
+payment count and amount. ``record_payment_change()`` keeps it current from the
+same transaction that creates a payment or changes its status, so reports read a
+few hundred rows per year instead of scanning ``payments``.
+
+Amounts can be normalized to one currency through the ``exchange_rates`` table,
+which stores the USD value of each currency and is maintained by employees.
+Rollups for payments that predate this table are built once with:
+
+    python -m app.analytics rebuild
+"""
+import argparse
+import logging
+import re
+import sys
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, insert, select, text, union_all
+from sqlalchemy.orm import Session
+
+from .models import ArchivedPayment, ExchangeRate, Payment, RevenueDaily
+
+logger = logging.getLogger(__name__)
+
+BASE_CURRENCY = "USD"
+# ISO 4217 alphabetic code
+CURRENCY_CODE = re.compile(r"^[A-Z]{3}$")
+REPORT_GROUPINGS = ("day", "month", "total")
+PAYMENT_STATUSES = ("pending", "completed", "failed")
+
+class MissingExchangeRate(Exception):
+    def __init__(self, currencies: List[str]):
+        super().__init__(f"No exchange rate for {', '.join(currencies)}")
+        self.currencies = currencies
+
+def _dialect_insert(db: Session):
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return None
+    return dialect_insert
+
+def _bump(db: Session, day: date, currency: str, status: str, count: int, amount: float) -> None:
+    dialect_insert = _dialect_insert(db)
+    if dialect_insert is None:
+        row = db.query(RevenueDaily).filter_by(day=day, currency=currency, status=status).with_for_update().first()
+        if row is None:
+            db.add(RevenueDaily(day=day, currency=currency, status=status, payment_count=count, total_amount=amount))
+        else:
+            row.payment_count += count
+            row.total_amount += amount
+        return
+    stmt = dialect_insert(RevenueDaily).values(
+        day=day, currency=currency, status=status, payment_count=count, total_amount=amount
+    )
+    # Atomic increment, so concurrent payments on the same day never lose an update
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["day", "currency", "status"],
+        set_={
+            "payment_count": RevenueDaily.payment_count + stmt.excluded.payment_count,
+            "total_amount": RevenueDaily.total_amount + stmt.excluded.total_amount,
+        }
+    ))
+
+def record_payment_change(
+    db: Session,
+    created_at: datetime,
+    currency: str,
+    amount: float,
+    old_status: Optional[str],
+    new_status: str
+) -> None:
+    """Move a payment between rollup rows in the caller's transaction.
+
+    ``old_status`` is None for a new payment. Payments stay on the day they were
+    created, so a status change only moves them between rows of that day.
+    """
+    if old_status == new_status:
+        return
+    day = created_at.date()
+    if old_status is not None:
+        _bump(db, day, currency, old_status, -1, -amount)
+    _bump(db, day, currency, new_status, 1, amount)
+
+def rebuild_rollups(db: Session) -> int:
+    """Recompute every rollup row from ``payments`` and its archive and return the number of rows"""
+    if db.get_bind().dialect.name == "postgresql":
+        # Hold off payment writes and archival so no payment is counted twice or missed
+        db.execute(text("LOCK TABLE payments, payments_archive IN SHARE MODE"))
+    db.query(RevenueDaily).delete(synchronize_session=False)
+    payments = union_all(*[
+        select(model.created_at, model.currency, model.status, model.amount)
+        for model in (Payment, ArchivedPayment)
+    ]).subquery()
+    day = func.date(payments.c.created_at)
+    db.execute(insert(RevenueDaily).from_select(
+        ["day", "currency", "status", "payment_count", "total_amount"],
+        select(day, payments.c.currency, payments.c.status, func.count(), func.coalesce(func.sum(payments.c.amount), 0))
+        .group_by(day, payments.c.currency, payments.c.status)
+    ))
+    count = db.query(func.count(RevenueDaily.id)).scalar()
+    db.commit()
+    return count
+
+def exchange_rates(db: Session) -> Dict[str, float]:
+    rates = {row.currency: row.rate_to_usd for row in db.query(ExchangeRate)}
+    rates.setdefault(BASE_CURRENCY, 1.0)
+    return rates
+
+def set_exchange_rate(db: Session, currency: str, rate_to_usd: float) -> ExchangeRate:
+    row = db.query(ExchangeRate).filter(ExchangeRate.currency == currency).first()
+    if row is None:
+        row = ExchangeRate(currency=currency, rate_to_usd=rate_to_usd)
+        db.add(row)
+    else:
+        row.rate_to_usd = rate_to_usd
+    db.commit()
+    db.refresh(row)
+    return row
+
+def _summary(count: int, total: float) -> Dict[str, Any]:
+    return {
+        "count": count,
+        "total": round(total, 2),
+        "average": round(total / count, 2) if count else None,
+    }
+
+def revenue_report(
+    db: Session,
+    start: date,
+    end: date,
+    status: Optional[str] = "completed",
+    normalize_to: Optional[str] = None,
+    group_by: str = "day"
+) -> Dict[str, Any]:
+    """Count, total and average amount per period and currency between two days (inclusive).
+
+    ``status=None`` includes every status. With ``normalize_to``, all amounts are
+    converted into that currency and reported under it.
+    """
+    query = db.query(RevenueDaily).filter(
+        RevenueDaily.day >= start,
+        RevenueDaily.day <= end,
+        # Rows emptied by status changes are kept for the next increment but not reported
+        RevenueDaily.payment_count != 0
+    )
+    if status is not None:
+        query = query.filter(RevenueDaily.status == status)
+    rows = query.order_by(RevenueDaily.day).all()
+
+    convert = None
+    if normalize_to is not None:
+        rates = exchange_rates(db)
+        missing = sorted(({row.currency for row in rows} | {normalize_to}) - rates.keys())
+        if missing:
+            raise MissingExchangeRate(missing)
+        convert = lambda amount, currency: amount * rates[currency] / rates[normalize_to]
+
+    series: Dict[Tuple[str, str], List[float]] = {}
+    totals: Dict[str, List[float]] = {}
+    by_status: Dict[str, Dict[str, List[float]]] = {}
+    for row in rows:
+        currency = normalize_to or row.currency
+        amount = convert(row.total_amount, row.currency) if convert else row.total_amount
+        if group_by == "month":
+            period = row.day.strftime("%Y-%m")
+        else:
+            period = row.day.isoformat()
+        for bucket in (
+            series.setdefault((period, currency), [0, 0.0]),
+            totals.setdefault(currency, [0, 0.0]),
+            by_status.setdefault(row.status, {}).setdefault(currency, [0, 0.0]),
+        ):
+            bucket[0] += row.payment_count
+            bucket[1] += amount
+
+    report: Dict[str, Any] = {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "status": status or "all",
+        "currency": normalize_to,
+        "group_by": group_by,
+        "rollup_rows": len(rows),
+        "totals": {currency: _summary(*values) for currency, values in totals.items()},
+        "by_status": {
+            name: {currency: _summary(*values) for currency, values in currencies.items()}
+            for name, currencies in by_status.items()
+        },
+    }
+    if group_by != "total":
+        report["series"] = [
+            {"period": period, "currency": currency, **_summary(*values)}
+            for (period, currency), values in series.items()
+        ]
+    return report
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Maintain payment revenue rollups")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("rebuild", help="Recompute all rollups from the payments table")
+    parser.parse_args(argv)
+
+    from .database import SessionLocal
+    db = SessionLocal()
+    try:
+        count = rebuild_rollups(db)
+    finally:
+        db.close()
+    print(f"Rebuilt {count} revenue rollup rows")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
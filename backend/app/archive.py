@@ -0,0 +1,153 @@
+"""Hot/cold split of the payments table.
+
+Completed payments older than ``PAYMENT_ARCHIVE_AFTER_DAYS`` are moved from
+``payments`` to ``payments_archive`` by the ``payments.archive`` background job. The
+job moves ``PAYMENT_ARCHIVE_BATCH_SIZE`` rows per transaction (copy, then delete, by
+primary key), so each transaction locks only its own batch and is short. It moves at
+most ``PAYMENT_ARCHIVE_MAX_BATCHES`` batches per run, then schedules its next run:
+right away while old payments remain, otherwise after
+``PAYMENT_ARCHIVE_INTERVAL_SECONDS``. The job worker's maintenance pass starts the
+cycle when no run is queued (see ``app.tasks``).
+
+Pending and failed payments stay in ``payments``, so every status change happens
+there. Reads go through ``find_payment``, ``find_payments`` and
+``find_payments_by_reference``, which look in ``payments`` first and then in the
+archive, so lookups by ``payment_id`` and by the processor identifiers work across
+both. Revenue rollups are rebuilt from both tables.
+
+The same archive table is used on PostgreSQL and SQLite: converting an existing
+``payments`` table to declarative partitioning needs an offline migration, while the
+archive works on any database and is created at startup.
+"""
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+from sqlalchemy import DateTime, delete, func, insert, literal, select
+from sqlalchemy.orm import Session
+
+from .models import ArchivedPayment, Payment
+
+logger = logging.getLogger(__name__)
+
+# 0 disables archival
+PAYMENT_ARCHIVE_AFTER_DAYS = int(os.getenv("PAYMENT_ARCHIVE_AFTER_DAYS", "365"))
+PAYMENT_ARCHIVE_BATCH_SIZE = int(os.getenv("PAYMENT_ARCHIVE_BATCH_SIZE", "1000"))
+PAYMENT_ARCHIVE_MAX_BATCHES = int(os.getenv("PAYMENT_ARCHIVE_MAX_BATCHES", "50"))
+PAYMENT_ARCHIVE_INTERVAL_SECONDS = int(os.getenv("PAYMENT_ARCHIVE_INTERVAL_SECONDS", "3600"))
+# Pause between batches, leaving room for other writers
+PAYMENT_ARCHIVE_PAUSE_SECONDS = float(os.getenv("PAYMENT_ARCHIVE_PAUSE_SECONDS", "0.05"))
+
+# Columns copied from payments; the archive adds its own key and archived_at
+PAYMENT_COLUMNS = [column.name for column in Payment.__table__.columns]
+
+AnyPayment = Union[Payment, ArchivedPayment]
+
+def _select(db: Session, model, columns: Optional[Sequence[str]]):
+    """Whole rows, or only the named columns as ``Row`` tuples"""
+    if columns is None:
+        return db.query(model)
+    return db.query(*[getattr(model, name) for name in columns])
+
+def find_payment(db: Session, payment_id: str, user_id: Optional[int] = None,
+                 columns: Optional[Sequence[str]] = None) -> Optional[AnyPayment]:
+    """A payment by ``payment_id``, from the hot table or the archive"""
+    for model in (Payment, ArchivedPayment):
+        query = _select(db, model, columns).filter(model.payment_id == payment_id)
+        if user_id is not None:
+            query = query.filter(model.user_id == user_id)
+        payment = query.first()
+        if payment is not None:
+            return payment
+    return None
+
+def find_payments(db: Session, filters: Dict[str, Any], user_id: Optional[int] = None,
+                  limit: Optional[int] = None, columns: Optional[Sequence[str]] = None) -> List[AnyPayment]:
+    """Payments matching column values in either table, newest first"""
+    if columns is not None and "created_at" not in columns:
+        # Needed to merge the two tables in order
+        columns = [*columns, "created_at"]
+    payments: List[AnyPayment] = []
+    for model in (Payment, ArchivedPayment):
+        query = _select(db, model, columns).filter(*[getattr(model, field) == value for field, value in filters.items()])
+        if user_id is not None:
+            query = query.filter(model.user_id == user_id)
+        query = query.order_by(model.created_at.desc())
+        payments.extend(query.limit(limit).all() if limit is not None else query.all())
+    payments.sort(key=lambda payment: payment.created_at, reverse=True)
+    return payments[:limit] if limit is not None else payments
+
+def find_payments_by_reference(db: Session, references) -> List[AnyPayment]:
+    """Payments whose ``reference_id`` is one of ``references``, in either table, by ID"""
+    payments: List[AnyPayment] = []
+    for model in (Payment, ArchivedPayment):
+        payments.extend(db.query(model).filter(model.reference_id.in_(references)))
+    payments.sort(key=lambda payment: payment.id)
+    return payments
+
+def archive_cutoff(days: int = PAYMENT_ARCHIVE_AFTER_DAYS) -> datetime:
+    return datetime.utcnow() - timedelta(days=days)
+
+def archive_batch(db: Session, cutoff: datetime, batch_size: int = PAYMENT_ARCHIVE_BATCH_SIZE) -> int:
+    """Move up to ``batch_size`` completed payments created before ``cutoff``; one transaction"""
+    ids = [
+        payment_id for (payment_id,) in db.query(Payment.id)
+        .filter(Payment.status == "completed", Payment.created_at < cutoff)
+        .order_by(Payment.created_at)
+        .limit(batch_size)
+        # Rows another transaction is updating are left for the next batch (PostgreSQL)
+        .with_for_update(skip_locked=True)
+    ]
+    if not ids:
+        db.rollback()
+        return 0
+    columns = [getattr(Payment, name) for name in PAYMENT_COLUMNS]
+    db.execute(
+        insert(ArchivedPayment).from_select(
+            [*PAYMENT_COLUMNS, "archived_at"],
+            select(*columns, literal(datetime.utcnow(), DateTime()))
+            .where(Payment.id.in_(ids))
+        )
+    )
+    db.execute(delete(Payment).where(Payment.id.in_(ids)))
+    db.commit()
+    return len(ids)
+
+def archive_payments(db: Session, days: int = PAYMENT_ARCHIVE_AFTER_DAYS, batch_size: int = PAYMENT_ARCHIVE_BATCH_SIZE,
+                     max_batches: int = PAYMENT_ARCHIVE_MAX_BATCHES) -> Dict[str, Any]:
+    """Move old completed payments to the archive, batch by batch"""
+    cutoff = archive_cutoff(days)
+    started = time.perf_counter()
+    moved = 0
+    batches = 0
+    remaining = True
+    while batches < max_batches:
+        count = archive_batch(db, cutoff, batch_size)
+        if count == 0:
+            remaining = False
+            break
+        moved += count
+        batches += 1
+        if count < batch_size:
+            remaining = False
+            break
+        if PAYMENT_ARCHIVE_PAUSE_SECONDS:
+            time.sleep(PAYMENT_ARCHIVE_PAUSE_SECONDS)
+    duration = time.perf_counter() - started
+    if moved:
+        logger.info(f"Archived {moved} payments created before {cutoff.date()} in {batches} batches ({duration:.2f}s)")
+    return {"moved": moved, "batches": batches, "remaining": remaining, "cutoff": cutoff.isoformat()}
+
+def archive_stats(db: Session) -> Dict[str, Any]:
+    cutoff = archive_cutoff()
+    return {
+        "after_days": PAYMENT_ARCHIVE_AFTER_DAYS,
+        "hot": db.query(func.count(Payment.id)).scalar(),
+        "archived": db.query(func.count(ArchivedPayment.archive_id)).scalar(),
+        "due": db.query(func.count(Payment.id)).filter(
+            Payment.status == "completed", Payment.created_at < cutoff
+        ).scalar() if PAYMENT_ARCHIVE_AFTER_DAYS > 0 else 0,
+        "oldest_hot": db.query(func.min(Payment.created_at)).scalar(),
+    }
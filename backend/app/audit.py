@@ -0,0 +1,217 @@
+"""Append-only audit log of catalog and payment mutations.
+
+Handlers call ``audit_log.record`` after their own commit. Recording only appends
+to an in-memory buffer, so a mutation does not pay for an extra write. A flusher
+thread writes the buffer to ``audit_log`` in one transaction, as one bulk ``INSERT``
+(sent as multi-row ``VALUES`` pages on PostgreSQL, an ``executemany`` on SQLite),
+when it reaches ``AUDIT_FLUSH_SIZE`` events, or ``AUDIT_FLUSH_SECONDS`` after the
+last flush, whichever comes first. Shutdown flushes whatever is left.
+
+If a flush fails the events go back to the buffer and are retried after
+``AUDIT_FLUSH_SECONDS``. While the database is unavailable the buffer keeps the
+newest ``AUDIT_MAX_BUFFER`` events; older ones are dropped and counted in
+``stats()``. A worker that is killed outright loses at most the events of its
+last flush interval.
+
+Each worker has its own buffer. Event IDs are assigned when a batch is written,
+so IDs follow flush order across workers; ``occurred_at`` is when the mutation
+happened. History is read newest first, paginated by event ID.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from .database import engine
+from .middlewares.requestLogging import get_request_id
+from .models import AuditEvent
+
+logger = logging.getLogger(__name__)
+
+AUDIT_LOG_ENABLED = os.getenv("AUDIT_LOG_ENABLED", "true").lower() == "true"
+AUDIT_FLUSH_SIZE = int(os.getenv("AUDIT_FLUSH_SIZE", "100"))
+AUDIT_FLUSH_SECONDS = float(os.getenv("AUDIT_FLUSH_SECONDS", "1.0"))
+AUDIT_MAX_BUFFER = int(os.getenv("AUDIT_MAX_BUFFER", "10000"))
+
+class AuditLog:
+    def __init__(self, bind=engine, flush_size: int = AUDIT_FLUSH_SIZE, flush_seconds: float = AUDIT_FLUSH_SECONDS,
+                 max_buffer: int = AUDIT_MAX_BUFFER, enabled: bool = AUDIT_LOG_ENABLED):
+        self.bind = bind
+        self.flush_size = max(1, flush_size)
+        self.flush_seconds = flush_seconds
+        self.max_buffer = max(self.flush_size, max_buffer)
+        self.enabled = enabled
+        self._buffer: List[Dict[str, Any]] = []
+        self._condition = threading.Condition()
+        # One flush at a time, so batches are written in the order they were recorded
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.failures = 0
+        self.last_flush_at: Optional[datetime] = None
+        self.last_error: Optional[str] = None
+
+    def record(self, action: str, object_type: str, object_id: Any, user: Any = None,
+               details: Optional[Dict[str, Any]] = None) -> None:
+        """Buffer one event; ``user`` is the acting ``User``, if any"""
+        if not self.enabled:
+            return
+        event = {
+            "occurred_at": datetime.utcnow(),
+            "action": action,
+            "object_type": object_type,
+            "object_id": str(object_id),
+            "actor_id": user.id if user is not None else None,
+            "actor": user.username if user is not None else None,
+            "request_id": get_request_id(),
+            "details": details,
+        }
+        with self._condition:
+            self._buffer.append(event)
+            self.recorded += 1
+            self._trim()
+            if len(self._buffer) >= self.flush_size:
+                self._condition.notify()
+
+    def _trim(self) -> None:
+        excess = len(self._buffer) - self.max_buffer
+        if excess > 0:
+            del self._buffer[:excess]
+            self.dropped += excess
+            logger.warning(f"Audit buffer full; dropped the {excess} oldest events")
+
+    def _write(self) -> Optional[int]:
+        """Write the buffered events; the number written, or None if the write failed"""
+        with self._flush_lock:
+            with self._condition:
+                events, self._buffer = self._buffer, []
+            if not events:
+                return 0
+            started = time.perf_counter()
+            try:
+                with self.bind.begin() as conn:
+                    conn.execute(insert(AuditEvent.__table__), events)
+            except Exception as e:
+                with self._condition:
+                    # Back in front of anything recorded meanwhile, keeping the order
+                    self._buffer[:0] = events
+                    self._trim()
+                    self.failures += 1
+                    self.last_error = str(e)
+                logger.error(f"Could not write {len(events)} audit events: {str(e)}")
+                return None
+            with self._condition:
+                self.written += len(events)
+                self.flushes += 1
+                self.last_flush_at = datetime.utcnow()
+                self.last_error = None
+            logger.debug(f"Wrote {len(events)} audit events in {(time.perf_counter() - started) * 1000:.1f}ms")
+            return len(events)
+
+    def flush(self) -> int:
+        """Write the buffered events now; returns how many were written"""
+        return self._write() or 0
+
+    def _flush_due(self) -> bool:
+        return self._stopping or len(self._buffer) >= self.flush_size
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(self._flush_due, timeout=self.flush_seconds)
+                stopping = self._stopping
+            if stopping:
+                return
+            if self._write() is None:
+                # Database unavailable: wait before retrying, even if the buffer is full
+                with self._condition:
+                    self._condition.wait_for(lambda: self._stopping, timeout=self.flush_seconds)
+
+    def start(self) -> None:
+        if not self.enabled or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="audit-flusher", daemon=True)
+        self._thread.start()
+        logger.info(f"Audit log flushing every {self.flush_size} events or {self.flush_seconds}s")
+
+    def stop(self) -> None:
+        """Stop the flusher and write everything still buffered"""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
+        written = self.flush()
+        if written:
+            logger.info(f"Flushed {written} audit events at shutdown")
+        if self._buffer:
+            logger.error(f"Shutting down with {len(self._buffer)} audit events unwritten")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            return {
+                "enabled": self.enabled,
+                "pending": len(self._buffer),
+                "recorded": self.recorded,
+                "written": self.written,
+                "dropped": self.dropped,
+                "flushes": self.flushes,
+                "failures": self.failures,
+                "last_flush_at": self.last_flush_at.isoformat() if self.last_flush_at else None,
+                "last_error": self.last_error,
+                "flush_size": self.flush_size,
+                "flush_seconds": self.flush_seconds,
+            }
+
+def serialize_event(event: AuditEvent) -> Dict[str, Any]:
+    return {
+        "id": event.id,
+        "occurred_at": event.occurred_at.isoformat(),
+        "action": event.action,
+        "object_type": event.object_type,
+        "object_id": event.object_id,
+        "actor_id": event.actor_id,
+        "actor": event.actor,
+        "request_id": event.request_id,
+        "details": event.details,
+    }
+
+def audit_history(db: Session, action: Optional[str] = None, object_type: Optional[str] = None,
+                  object_id: Optional[str] = None, actor_id: Optional[int] = None,
+                  before: Optional[int] = None, limit: int = 50) -> Dict[str, Any]:
+    """Written events matching the filters, newest first.
+
+    Pass the returned ``next_before`` as ``before`` for the next page; it is ``None``
+    on the last page.
+    """
+    query = db.query(AuditEvent)
+    if action is not None:
+        query = query.filter(AuditEvent.action == action)
+    if object_type is not None:
+        query = query.filter(AuditEvent.object_type == object_type)
+    if object_id is not None:
+        query = query.filter(AuditEvent.object_id == str(object_id))
+    if actor_id is not None:
+        query = query.filter(AuditEvent.actor_id == actor_id)
+    if before is not None:
+        query = query.filter(AuditEvent.id < before)
+    events = query.order_by(AuditEvent.id.desc()).limit(limit + 1).all()
+    has_more = len(events) > limit
+    events = events[:limit]
+    return {
+        "events": [serialize_event(event) for event in events],
+        "next_before": events[-1].id if has_more else None,
+    }
+
+audit_log = AuditLog()
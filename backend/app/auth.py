@@ -1,13 +1,16 @@
+import hashlib
+import logging
+import secrets
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt
 from jose.exceptions import ExpiredSignatureError, JWTError
-from passlib.context import CryptContext
 from sqlalchemy.orm import Session
 from .database import get_db
-from .models import User
+from .hashing import pwd_context
+from .models import RefreshToken, User
 from .schemas import TokenData, UserCreate
 
 # JWT configuration
@@ -20,8 +23,10 @@ if not SECRET_KEY:
     
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
+
+logger = logging.getLogger(__name__)
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
@@ -34,6 +39,18 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
         print(f"Password verification error: {str(e)}")
         return False
 
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verify a password and return a replacement hash when the stored one is outdated.
+
+    The replacement is only produced after a successful verification, when the stored
+    hash uses a deprecated scheme or a cost other than the configured one.
+    """
+    try:
+        return pwd_context.verify_and_update(plain_password, hashed_password)
+    except Exception as e:
+        logger.error(f"Password verification error: {str(e)}")
+        return False, None
+
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
@@ -47,6 +64,105 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def hash_refresh_token(token: str) -> str:
+    # Refresh tokens are 256-bit random values, so a plain SHA-256 is enough to
+    # protect them at rest; running bcrypt here would defeat the point of refreshing.
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+def _refresh_token_error(message: str, error: str) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail={
+            "status": "error",
+            "message": message,
+            "errors": [error]
+        },
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+def _add_refresh_token(db: Session, user_id: int, family_id: str) -> Tuple[RefreshToken, str]:
+    token = secrets.token_urlsafe(32)
+    db_token = RefreshToken(
+        token_hash=hash_refresh_token(token),
+        family_id=family_id,
+        user_id=user_id,
+        expires_at=datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    )
+    db.add(db_token)
+    return db_token, token
+
+def create_refresh_token(db: Session, user: User) -> str:
+    """Start a new refresh token family for a fresh login and return the raw token."""
+    _, token = _add_refresh_token(db, user.id, secrets.token_hex(16))
+    db.commit()
+    return token
+
+def revoke_refresh_token_family(db: Session, family_id: str) -> int:
+    revoked = db.query(RefreshToken).filter(
+        RefreshToken.family_id == family_id,
+        RefreshToken.revoked_at.is_(None)
+    ).update({RefreshToken.revoked_at: datetime.utcnow()}, synchronize_session=False)
+    db.commit()
+    return revoked
+
+def revoke_user_refresh_tokens(db: Session, user_id: int) -> int:
+    revoked = db.query(RefreshToken).filter(
+        RefreshToken.user_id == user_id,
+        RefreshToken.revoked_at.is_(None)
+    ).update({RefreshToken.revoked_at: datetime.utcnow()}, synchronize_session=False)
+    db.commit()
+    return revoked
+
+def get_refresh_token(db: Session, token: str) -> Optional[RefreshToken]:
+    return db.query(RefreshToken).filter(
+        RefreshToken.token_hash == hash_refresh_token(token)
+    ).first()
+
+def rotate_refresh_token(db: Session, token: str) -> Tuple[User, str]:
+    """Exchange a refresh token for its successor.
+
+    Every token is single use. Presenting one that was already rotated or revoked
+    means it leaked, so the whole family is revoked and the user has to log in again.
+    """
+    db_token = get_refresh_token(db, token)
+    if not db_token:
+        raise _refresh_token_error("Invalid refresh token", "Please log in again to obtain a new token")
+
+    now = datetime.utcnow()
+    if db_token.revoked_at is None and db_token.expires_at <= now:
+        raise _refresh_token_error("Refresh token has expired", "Please log in again to obtain a new token")
+
+    # Claim the token with a conditional update so two concurrent refreshes
+    # cannot both succeed with the same token
+    claimed = db.query(RefreshToken).filter(
+        RefreshToken.id == db_token.id,
+        RefreshToken.revoked_at.is_(None)
+    ).update({RefreshToken.revoked_at: now}, synchronize_session=False)
+    if not claimed:
+        db.rollback()
+        revoked = revoke_refresh_token_family(db, str(db_token.family_id))
+        logger.warning(
+            f"Refresh token reuse detected for user {db_token.user_id}, "
+            f"revoked {revoked} token(s) in family {db_token.family_id}"
+        )
+        raise _refresh_token_error(
+            "Refresh token reuse detected",
+            "This session has been revoked. Please log in again."
+        )
+
+    user = db.query(User).filter(User.id == db_token.user_id).first()
+    if not user or not bool(user.is_active):
+        db.rollback()
+        raise _refresh_token_error("Invalid refresh token", "The user associated with this token is not active")
+
+    new_token, raw_token = _add_refresh_token(db, user.id, str(db_token.family_id))
+    db.flush()
+    db.query(RefreshToken).filter(RefreshToken.id == db_token.id).update(
+        {RefreshToken.replaced_by_id: new_token.id}, synchronize_session=False
+    )
+    db.commit()
+    return user, raw_token
+
 def get_user(db: Session, username: str) -> Optional[User]:
     return db.query(User).filter(User.username == username).first()
 
@@ -117,6 +233,18 @@ async def get_current_user(
                 headers={"WWW-Authenticate": "Bearer"},
             )
             
+        # Scoped tokens (e.g. profile tokens) grant only their scope, never a login
+        if payload.get("scope") is not None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail={
+                    "status": "error",
+                    "message": "Invalid token",
+                    "errors": ["This token cannot be used for authentication"]
+                },
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+            
         # Validate username in token
         username = payload.get("sub")
         if not isinstance(username, str) or not username:
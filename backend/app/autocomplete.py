@@ -0,0 +1,372 @@
+"""Per-worker prefix index for material and service name autocomplete.
+
+Each material and service is indexed under its lower-cased name and under each
+later word of it, so ``red oak`` finds "Red Oak Laminate" and so do ``oak`` and
+``lam``; ``oak lam`` is looked up by its first word and checked against the name.
+Names and word keys live in two sorted lists, searched in that order so names
+starting with the query rank first. A lookup is a ``bisect`` to the first key at
+or after the prefix and a forward scan while keys still start with it, so it costs
+microseconds regardless of catalog size. The name list holds the names themselves,
+with runs of whitespace collapsed, ordered by their lower-cased form; a lookup
+lower-cases only the names it compares, so each name is stored once. Word keys are
+shared string objects, so a word used in thousands of names is stored once.
+
+The index is built at startup and updated in place when this worker creates or
+deletes a catalog row. Writes made by other workers are picked up through the
+catalog change sequence (see ``app.catalog``): at most every
+``AUTOCOMPLETE_REFRESH_SECONDS`` a lookup compares the sequence the index was last
+synced to with the shared counter and applies only the changes since. After a bulk
+load, a rebuild runs on a background thread while lookups keep using the current
+index, and the new index replaces it on the first lookup after it is ready. Applying
+a change twice is harmless, so local updates and synced ones can overlap. An update
+shifts the lists, which takes a few milliseconds per 100k names.
+
+Memory is bounded by ``AUTOCOMPLETE_MAX_BYTES``, estimated from ``sys.getsizeof``.
+Whole names are indexed before word keys; once the budget is reached further keys
+are dropped and counted in ``stats()``.
+"""
+import logging
+import os
+import sys
+import time
+from array import array
+from bisect import bisect_left
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from .catalog import CATALOG_MODELS, CatalogResyncRequired, changes_since, current_sequence
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+AUTOCOMPLETE_ENABLED = os.getenv("AUTOCOMPLETE_ENABLED", "true").lower() == "true"
+AUTOCOMPLETE_MAX_BYTES = int(os.getenv("AUTOCOMPLETE_MAX_BYTES", str(256 * 1024 * 1024)))
+AUTOCOMPLETE_REFRESH_SECONDS = float(os.getenv("AUTOCOMPLETE_REFRESH_SECONDS", "2"))
+AUTOCOMPLETE_MAX_RESULTS = 50
+# Words of a name after the first that get their own key
+MAX_WORD_KEYS = 8
+# Keys examined for a multi-word query matched by its first word
+MAX_CANDIDATES = 5000
+# Catalog writes to catch up on beyond which a rebuild is cheaper than applying them one by one
+REBUILD_AFTER_CHANGES = 2000
+
+KINDS = tuple(CATALOG_MODELS)
+# Per-entry cost on top of the key string: a list slot and an array slot
+ENTRY_OVERHEAD = 16
+# Per-name cost on top of the name string: its dict slot and the boxed reference
+ITEM_OVERHEAD = 80
+
+def _ref(kind: str, object_id: int) -> int:
+    return object_id * len(KINDS) + KINDS.index(kind)
+
+def _unref(ref: int) -> Tuple[str, int]:
+    return KINDS[ref % len(KINDS)], ref // len(KINDS)
+
+def _normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+def _clean(name: str) -> str:
+    """The name with runs of whitespace collapsed; the same object when there are none"""
+    cleaned = " ".join(name.split())
+    return name if cleaned == name else cleaned
+
+def index_keys(name: str) -> List[str]:
+    """The whole lower-cased name, then each later word of it"""
+    words = name.lower().split()
+    if not words:
+        return []
+    keys = [" ".join(words)]
+    # A word repeated in the name needs its key only once
+    keys.extend(word for word in dict.fromkeys(words[1:MAX_WORD_KEYS + 1]) if word != keys[0])
+    return keys
+
+class SortedKeys:
+    """Strings sorted by ``key`` (the string itself by default) with the catalog reference
+    of each, equal keys by reference"""
+
+    def __init__(self, entries: Optional[List[Tuple[str, int]]] = None, key: Optional[Callable[[str], str]] = None):
+        self.key = key
+        entries = sorted(entries or (), key=(lambda entry: (key(entry[0]), entry[1])) if key else None)
+        self.keys: List[str] = [item for item, _ in entries]
+        self.refs = array("q", (ref for _, ref in entries))
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def _key(self, position: int) -> str:
+        item = self.keys[position]
+        return self.key(item) if self.key else item
+
+    def insert(self, item: str, ref: int) -> None:
+        key = self.key(item) if self.key else item
+        position = bisect_left(self.keys, key, key=self.key)
+        while position < len(self.keys) and self._key(position) == key and self.refs[position] < ref:
+            position += 1
+        self.keys.insert(position, item)
+        self.refs.insert(position, ref)
+
+    def delete(self, item: str, ref: int) -> bool:
+        key = self.key(item) if self.key else item
+        position = bisect_left(self.keys, key, key=self.key)
+        while position < len(self.keys) and self._key(position) == key:
+            if self.refs[position] == ref:
+                del self.keys[position]
+                del self.refs[position]
+                return True
+            position += 1
+        return False
+
+    def starting_with(self, prefix: str, max_keys: Optional[int] = None) -> Iterator[int]:
+        """References of the keys starting with ``prefix``, in key order"""
+        refs = self.refs
+        position = bisect_left(self.keys, prefix, key=self.key)
+        end = len(self.keys) if max_keys is None else min(len(self.keys), position + max_keys)
+        while position < end and self._key(position).startswith(prefix):
+            yield refs[position]
+            position += 1
+
+class PrefixIndex:
+    def __init__(self, max_bytes: int = AUTOCOMPLETE_MAX_BYTES, session_factory=SessionLocal):
+        self.max_bytes = max_bytes
+        self.session_factory = session_factory
+        # Names are searched before words, so names starting with the query rank first
+        self.name_keys = SortedKeys(key=str.lower)
+        self.word_keys = SortedKeys()
+        self.names: Dict[int, str] = {}
+        # One shared string per distinct word; words are never evicted
+        self.words: Dict[str, str] = {}
+        self.bytes = 0
+        self.dropped = 0
+        self.sequence = 0
+        self.checked_at = 0.0
+        self.built_at: Optional[datetime] = None
+        self.build_ms = 0.0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="autocomplete")
+        self._build: Optional[Future] = None
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def _reserve(self, size: int) -> bool:
+        if self.bytes + size > self.max_bytes:
+            self.dropped += 1
+            return False
+        self.bytes += size
+        return True
+
+    def add(self, kind: str, object_id: int, name: Optional[str]) -> None:
+        """Index a catalog row, replacing its previous name if it was indexed"""
+        self.remove(kind, object_id)
+        keys = index_keys(name or "")
+        if not keys:
+            return
+        name = _clean(name)
+        ref = _ref(kind, object_id)
+        if not self._reserve(sys.getsizeof(name) + ENTRY_OVERHEAD + ITEM_OVERHEAD):
+            return
+        self.name_keys.insert(name, ref)
+        self.names[ref] = name
+        for word in keys[1:]:
+            shared = self.words.get(word)
+            if not self._reserve(ENTRY_OVERHEAD + (0 if shared else sys.getsizeof(word) + ITEM_OVERHEAD)):
+                continue
+            if shared is None:
+                shared = self.words[word] = word
+            self.word_keys.insert(shared, ref)
+
+    def remove(self, kind: str, object_id: int) -> None:
+        ref = _ref(kind, object_id)
+        name = self.names.pop(ref, None)
+        if name is None:
+            return
+        if self.name_keys.delete(name, ref):
+            self.bytes -= sys.getsizeof(name) + ENTRY_OVERHEAD + ITEM_OVERHEAD
+        for word in index_keys(name)[1:]:
+            if self.word_keys.delete(word, ref):
+                self.bytes -= ENTRY_OVERHEAD
+
+    def _collect(self, db: Session) -> Dict[str, Any]:
+        """A new index of every material and service name; touches nothing in use"""
+        started = time.perf_counter()
+        # Read first: writes made while building are newer and get synced afterwards
+        sequence = current_sequence(db)["value"]
+        rows = [
+            (_ref(kind, object_id), name)
+            for kind, model in CATALOG_MODELS.items()
+            for object_id, name in db.query(model.id, model.name)
+            if name
+        ]
+
+        # Whole names first, then word keys, until the budget is used up
+        used, dropped = 0, 0
+        name_entries: List[Tuple[str, int]] = []
+        word_entries: List[Tuple[str, int]] = []
+        names: Dict[int, str] = {}
+        row_words: List[Tuple[int, List[str]]] = []
+        for ref, name in rows:
+            keys = index_keys(name)
+            if not keys:
+                continue
+            name = _clean(name)
+            size = sys.getsizeof(name) + ENTRY_OVERHEAD + ITEM_OVERHEAD
+            if used + size > self.max_bytes:
+                dropped += len(keys)
+                continue
+            used += size
+            name_entries.append((name, ref))
+            names[ref] = name
+            row_words.append((ref, keys[1:]))
+        words: Dict[str, str] = {}
+        for ref, row_keys in row_words:
+            for word in row_keys:
+                shared = words.get(word)
+                size = ENTRY_OVERHEAD + (0 if shared is not None else sys.getsizeof(word) + ITEM_OVERHEAD)
+                if used + size > self.max_bytes:
+                    dropped += 1
+                    continue
+                used += size
+                if shared is None:
+                    shared = words[word] = word
+                word_entries.append((shared, ref))
+
+        return {
+            "name_keys": SortedKeys(name_entries, key=str.lower),
+            "word_keys": SortedKeys(word_entries),
+            "names": names,
+            "words": words,
+            "bytes": used,
+            "dropped": dropped,
+            "sequence": sequence,
+            "build_ms": (time.perf_counter() - started) * 1000,
+        }
+
+    def _install(self, built: Dict[str, Any]) -> None:
+        self.name_keys = built["name_keys"]
+        self.word_keys = built["word_keys"]
+        self.names = built["names"]
+        self.words = built["words"]
+        self.bytes = built["bytes"]
+        self.dropped = built["dropped"]
+        self.sequence = built["sequence"]
+        self.build_ms = built["build_ms"]
+        self.checked_at = time.monotonic()
+        self.built_at = datetime.utcnow()
+        if self.dropped:
+            logger.warning(f"Autocomplete index reached AUTOCOMPLETE_MAX_BYTES; dropped {self.dropped} keys")
+        logger.info(
+            f"Built autocomplete index: {len(self.names)} names, {len(self.word_keys)} word keys, "
+            f"~{self.bytes / 1024 / 1024:.1f} MB in {self.build_ms:.0f}ms"
+        )
+
+    def build(self, db: Session) -> None:
+        """Index every material and service name, replacing the current contents"""
+        self._install(self._collect(db))
+
+    def _build_in_background(self) -> Optional[Dict[str, Any]]:
+        db = self.session_factory()
+        try:
+            return self._collect(db)
+        except Exception as e:
+            logger.error(f"Could not rebuild autocomplete index: {str(e)}", exc_info=True)
+            return None
+        finally:
+            db.close()
+
+    def schedule_build(self) -> None:
+        """Rebuild on a background thread unless a rebuild is already running or waiting"""
+        if self._build is None:
+            self._build = self._executor.submit(self._build_in_background)
+
+    def refresh(self, db: Session, force: bool = False) -> None:
+        """Apply catalog writes made by other workers since the last sync"""
+        if self._build is not None:
+            if not self._build.done():
+                # Keep answering from the current index until the new one is ready
+                return
+            built, self._build = self._build.result(), None
+            if built is not None:
+                self._install(built)
+            # Catch up on writes made while it was building
+            force = True
+        now = time.monotonic()
+        if not force and now - self.checked_at < AUTOCOMPLETE_REFRESH_SECONDS:
+            return
+        self.checked_at = now
+        sequence = current_sequence(db)["value"]
+        if sequence == self.sequence:
+            return
+        if sequence - self.sequence > REBUILD_AFTER_CHANGES:
+            logger.info(f"Catalog moved {sequence - self.sequence} writes ahead of the autocomplete index; rebuilding")
+            self.schedule_build()
+            return
+        try:
+            while True:
+                changes = changes_since(db, self.sequence)
+                for kind in KINDS:
+                    for row in changes[f"{kind}s"]:
+                        self.add(kind, row.id, row.name)
+                for tombstone in changes["deleted"]:
+                    self.remove(tombstone["kind"], tombstone["id"])
+                self.sequence = changes["next_since"]
+                if not changes["has_more"]:
+                    break
+        except CatalogResyncRequired:
+            logger.info("Autocomplete index is older than the catalog tombstones; rebuilding")
+            self.schedule_build()
+
+    def search(self, prefix: str, limit: int = 10, kind: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Up to ``limit`` rows whose name starts with ``prefix``, then rows with a later word that does"""
+        query = _normalize(prefix)
+        if not query:
+            return []
+        first_word = query.split(" ", 1)[0]
+        candidates = (
+            (self.name_keys.starting_with(query), False),
+            # A multi-word query matches words by its first word; the rest is checked on the name
+            (self.word_keys.starting_with(first_word, MAX_CANDIDATES if " " in query else None), " " in query),
+        )
+        results: List[Dict[str, Any]] = []
+        seen = set()
+        for refs, check_name in candidates:
+            for ref in refs:
+                if len(results) >= limit:
+                    return results
+                if ref in seen:
+                    continue
+                seen.add(ref)
+                row_kind, object_id = _unref(ref)
+                if kind is not None and row_kind != kind:
+                    continue
+                name = self.names[ref]
+                if check_name and f" {query}" not in f" {_normalize(name)}":
+                    continue
+                results.append({"kind": row_kind, "id": object_id, "name": name})
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": AUTOCOMPLETE_ENABLED,
+            "names": len(self.names),
+            "keys": len(self.name_keys) + len(self.word_keys),
+            "distinct_words": len(self.words),
+            "memory_bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "dropped_keys": self.dropped,
+            "catalog_sequence": self.sequence,
+            "build_ms": round(self.build_ms, 2),
+            "built_at": self.built_at.isoformat() if self.built_at else None,
+        }
+
+autocomplete_index = PrefixIndex()
+
+def index_catalog_row(kind: str, object_id: int, name: Optional[str]) -> None:
+    """Make a row this worker just committed searchable without waiting for a sync"""
+    if AUTOCOMPLETE_ENABLED:
+        autocomplete_index.add(kind, object_id, name)
+
+def unindex_catalog_row(kind: str, object_id: int) -> None:
+    if AUTOCOMPLETE_ENABLED:
+        autocomplete_index.remove(kind, object_id)
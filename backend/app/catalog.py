@@ -0,0 +1,169 @@
+"""Change tracking for the material and service catalog.
+
+Every catalog write takes the next value of one shared, monotonically increasing
+sequence and stores it on the row (``change_seq``); deletes leave a tombstone with
+their own sequence value. A client that remembers the last sequence it has seen
+asks for ``/api/catalog/changes?since=<seq>`` and gets only what changed after it.
+
+The sequence is a single counter row that each write increments with
+``UPDATE ... RETURNING`` inside its own transaction. The row lock is held until
+commit, so catalog writes commit in sequence order and a reader can never see
+sequence ``n + 1`` before ``n``.
+"""
+import logging
+import os
+import secrets
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+from sqlalchemy import insert, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .models import CatalogSequence, CatalogTombstone, Material, Service
+
+logger = logging.getLogger(__name__)
+
+CATALOG_CHANGES_MAX = int(os.getenv("CATALOG_CHANGES_MAX", "1000"))
+# Clients that have not synced for longer than this must download the full catalog
+CATALOG_TOMBSTONE_RETENTION_DAYS = int(os.getenv("CATALOG_TOMBSTONE_RETENTION_DAYS", "30"))
+
+SEQUENCE_ROW_ID = 1
+CATALOG_MODELS = {"material": Material, "service": Service}
+
+class CatalogResyncRequired(Exception):
+    """The client's sequence is older than the retained tombstones, or from another database"""
+
+def _allocate(db: Session, count: int = 1) -> int:
+    """Reserve ``count`` sequence values and return the highest one"""
+    value = db.execute(
+        update(CatalogSequence)
+        .where(CatalogSequence.id == SEQUENCE_ROW_ID)
+        .values(value=CatalogSequence.value + count)
+        .returning(CatalogSequence.value)
+    ).scalar_one_or_none()
+    if value is None:
+        db.execute(insert(CatalogSequence).values(
+            id=SEQUENCE_ROW_ID, value=count, tombstone_horizon=0, epoch=secrets.token_hex(8)
+        ))
+        value = count
+    return value
+
+def reserve_change_seqs(db: Session, count: int) -> int:
+    """Reserve ``count`` consecutive sequence values for a bulk load and return the first"""
+    return _allocate(db, count) - count + 1
+
+def next_change_seq(db: Session) -> int:
+    """Sequence value for one catalog write, part of the caller's transaction"""
+    return _allocate(db)
+
+def record_deletion(db: Session, kind: str, object_id: int) -> int:
+    """Leave a tombstone for a deleted catalog row in the caller's transaction"""
+    change_seq = _allocate(db)
+    db.add(CatalogTombstone(kind=kind, object_id=object_id, change_seq=change_seq))
+    return change_seq
+
+def initialize_catalog_sequence(db: Session) -> None:
+    """Create the counter row and number rows written before change tracking existed"""
+    if db.get(CatalogSequence, SEQUENCE_ROW_ID) is None:
+        db.add(CatalogSequence(id=SEQUENCE_ROW_ID, value=0, tombstone_horizon=0, epoch=secrets.token_hex(8)))
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another worker starting at the same time created it first
+            db.rollback()
+    # Counter rows created before the epoch column existed
+    db.query(CatalogSequence).filter(
+        CatalogSequence.id == SEQUENCE_ROW_ID,
+        CatalogSequence.epoch.is_(None)
+    ).update({CatalogSequence.epoch: secrets.token_hex(8)}, synchronize_session=False)
+    for kind, model in CATALOG_MODELS.items():
+        ids = [row_id for (row_id,) in db.query(model.id).filter(model.change_seq.is_(None)).order_by(model.id)]
+        if not ids:
+            continue
+        last = _allocate(db, len(ids))
+        first = last - len(ids) + 1
+        for offset, row_id in enumerate(ids):
+            # Guarded so a worker starting at the same time cannot renumber a row
+            db.query(model).filter(model.id == row_id, model.change_seq.is_(None)).update(
+                {model.change_seq: first + offset}, synchronize_session=False
+            )
+        logger.info(f"Assigned catalog sequence numbers to {len(ids)} existing {kind} rows")
+    db.commit()
+
+def current_sequence(db: Session) -> Dict[str, Any]:
+    row = db.get(CatalogSequence, SEQUENCE_ROW_ID)
+    if row is None:
+        return {"value": 0, "tombstone_horizon": 0, "epoch": None}
+    return {"value": row.value, "tombstone_horizon": row.tombstone_horizon, "epoch": row.epoch}
+
+def purge_tombstones(db: Session) -> int:
+    """Drop tombstones past the retention window and raise the resync horizon to match"""
+    cutoff = datetime.utcnow() - timedelta(days=CATALOG_TOMBSTONE_RETENTION_DAYS)
+    query = db.query(CatalogTombstone).filter(CatalogTombstone.deleted_at < cutoff)
+    newest = max((seq for (seq,) in query.with_entities(CatalogTombstone.change_seq)), default=None)
+    if newest is None:
+        return 0
+    deleted = query.delete(synchronize_session=False)
+    db.query(CatalogSequence).filter(
+        CatalogSequence.id == SEQUENCE_ROW_ID,
+        CatalogSequence.tombstone_horizon < newest
+    ).update({CatalogSequence.tombstone_horizon: newest}, synchronize_session=False)
+    db.commit()
+    logger.info(f"Purged {deleted} catalog tombstones")
+    return deleted
+
+def changes_since(db: Session, since: int, limit: int = CATALOG_CHANGES_MAX) -> Dict[str, Any]:
+    """Rows written and deleted after ``since``, oldest first, at most ``limit`` entries.
+
+    ``since=0`` is a full sync and returns every row without tombstones. When
+    ``has_more`` is set, call again with ``since=next_since``.
+    """
+    sequence = current_sequence(db)
+    if since > sequence["value"] or (since and since < sequence["tombstone_horizon"]):
+        raise CatalogResyncRequired()
+
+    entries: List[tuple] = []
+    for kind, model in CATALOG_MODELS.items():
+        rows = (
+            db.query(model)
+            .filter(model.change_seq > since)
+            .order_by(model.change_seq)
+            .limit(limit + 1)
+            .all()
+        )
+        entries.extend((row.change_seq, kind, row) for row in rows)
+    if since:
+        tombstones = (
+            db.query(CatalogTombstone)
+            .filter(CatalogTombstone.change_seq > since)
+            .order_by(CatalogTombstone.change_seq)
+            .limit(limit + 1)
+            .all()
+        )
+        entries.extend((tombstone.change_seq, "deleted", tombstone) for tombstone in tombstones)
+
+    entries.sort(key=lambda entry: entry[0])
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+    result: Dict[str, Any] = {
+        "since": since,
+        # Without more pages, the current value also covers sequence numbers of rows
+        # that were written and later deleted before a tombstone could be returned
+        "next_since": entries[-1][0] if has_more else max(sequence["value"], since),
+        "has_more": has_more,
+        "materials": [],
+        "services": [],
+        "deleted": [],
+    }
+    for _, kind, item in entries:
+        if kind == "deleted":
+            result["deleted"].append({
+                "kind": item.kind,
+                "id": item.object_id,
+                "change_seq": item.change_seq,
+                "deleted_at": item.deleted_at,
+            })
+        else:
+            result[f"{kind}s"].append(item)
+    return result
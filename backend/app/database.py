@@ -1,7 +1,10 @@
 import os
 import logging
+from typing import List
+
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
@@ -27,13 +30,15 @@ if DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
 # PostgreSQL connection settings
-__all__ = ['engine', 'Base', 'get_db', 'DB_POOL_SIZE', 'DB_MAX_OVERFLOW', 'DB_POOL_TIMEOUT', 'DB_POOL_RECYCLE']
+__all__ = ['engine', 'Base', 'get_db', 'add_missing_columns', 'create_tables', 'DB_POOL_SIZE', 'DB_MAX_OVERFLOW', 'DB_POOL_TIMEOUT', 'DB_POOL_RECYCLE']
 
 # Database pool configuration with environment variable fallbacks
 DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
 DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
 DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', '30'))
 DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+# Logs every statement; for local debugging only (slow statements are in the slow-query log)
+DB_ECHO = os.getenv('DB_ECHO', 'false').lower() == 'true'
 
 # Create database engine with PostgreSQL configuration
 engine = create_engine(
@@ -43,7 +48,7 @@ engine = create_engine(
     pool_timeout=DB_POOL_TIMEOUT,
     pool_recycle=DB_POOL_RECYCLE,
     pool_pre_ping=True,
-    echo=True  # Enable SQL logging for debugging
+    echo=DB_ECHO
 )
 
 # Create session factory
@@ -59,3 +64,59 @@ def get_db():
         yield db
     finally:
         db.close()
+
+def create_tables(bind=None, attempts: int = 3) -> None:
+    """``create_all`` that tolerates workers starting at the same time.
+
+    Each worker checks which tables exist and then creates the rest, so two workers
+    starting against a fresh database can both try to create the same table. The
+    loser retries, and the second check finds the table in place.
+    """
+    bind = bind or engine
+    for attempt in range(attempts):
+        try:
+            Base.metadata.create_all(bind=bind)
+            return
+        except DBAPIError:
+            if attempt == attempts - 1:
+                raise
+            logger.info("Tables were created concurrently by another worker; checking again")
+
+def add_missing_columns(bind=None) -> List[str]:
+    """Add model columns and indexes missing from existing tables.
+
+    ``create_all`` only creates whole tables, so columns added to a model later are
+    added here. New columns must be nullable; backfill them in application code.
+    Returns the ``table.column`` names this call added, so the caller knows which
+    backfills to run.
+    """
+    bind = bind or engine
+    inspector = inspect(bind)
+    existing_tables = set(inspector.get_table_names())
+    added: List[str] = []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=bind.dialect)
+            try:
+                with bind.begin() as conn:
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+            except DBAPIError:
+                # Another worker starting at the same time may have added it first
+                if column.name not in {c["name"] for c in inspect(bind).get_columns(table.name)}:
+                    raise
+                continue
+            logger.info(f"Added column {table.name}.{column.name} ({column_type})")
+            added.append(f"{table.name}.{column.name}")
+        for index in table.indexes:
+            try:
+                with bind.begin() as conn:
+                    index.create(conn, checkfirst=True)
+            except DBAPIError:
+                if index.name not in {i["name"] for i in inspect(bind).get_indexes(table.name)}:
+                    raise
+    return added
@@ -0,0 +1,165 @@
+"""Material filters, sort orders and facet counts for catalog browsing.
+
+Filters are plain column comparisons, so they can use the composite indexes on
+``materials`` (see ``Material.__table_args__``):
+
+* ``ix_materials_unit_price_stock``: unit plus a price range or price order, and the
+  facet query, which it covers;
+* ``ix_materials_unit_stock_price``: unit plus in-stock/minimum-stock or stock order,
+  and the facet query when stock is filtered;
+* ``ix_materials_price``: price range or price order across all units.
+
+Facet counts come from one query grouped by unit and price bucket. Each facet
+counts the materials matching every filter except its own, so a shopper who picked
+one unit still sees how many materials the other units would give, and likewise for
+price buckets. Grouping still reads every material that matches the search and
+stock filters, so results are cached per filter set and tagged with the catalog
+change sequence, like the inventory report.
+"""
+import os
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, case, func, or_
+from sqlalchemy.orm import Query, Session
+
+from .catalog import current_sequence
+from .models import Material
+
+# Upper bounds of the price buckets; the last bucket has no upper bound
+MATERIAL_PRICE_BUCKETS = tuple(
+    float(edge) for edge in os.getenv("MATERIAL_PRICE_BUCKETS", "2,5,10,25,50,100").split(",") if edge.strip()
+)
+MATERIAL_SORTS = {
+    "price": Material.price_per_unit,
+    "name": Material.name,
+    "stock": Material.stock,
+}
+MATERIAL_FACETS_CACHE_ENTRIES = 256
+
+_facet_cache: "OrderedDict[Tuple[Any, ...], Tuple[int, Dict[str, Any]]]" = OrderedDict()
+
+class MaterialFilters:
+    """Filter values of one catalog request; ``None`` means not filtered"""
+
+    def __init__(self, min_price: Optional[float] = None, max_price: Optional[float] = None,
+                 unit: Optional[str] = None, in_stock: bool = False, min_stock: Optional[int] = None):
+        self.min_price = min_price
+        self.max_price = max_price
+        self.unit = unit
+        # In stock is a minimum stock of one
+        self.min_stock = max(min_stock or 0, 1 if in_stock else 0) or None
+
+    def price_conditions(self) -> List[Any]:
+        conditions = []
+        if self.min_price is not None:
+            conditions.append(Material.price_per_unit >= self.min_price)
+        if self.max_price is not None:
+            conditions.append(Material.price_per_unit <= self.max_price)
+        return conditions
+
+    def unit_conditions(self) -> List[Any]:
+        return [Material.unit == self.unit] if self.unit is not None else []
+
+    def stock_conditions(self) -> List[Any]:
+        return [Material.stock >= self.min_stock] if self.min_stock is not None else []
+
+    def key(self) -> Tuple[Any, ...]:
+        return (self.min_price, self.max_price, self.unit, self.min_stock)
+
+    def apply(self, query: Query) -> Query:
+        conditions = self.unit_conditions() + self.price_conditions() + self.stock_conditions()
+        return query.filter(*conditions) if conditions else query
+
+def search_condition(search: Optional[str]) -> Any:
+    if not search:
+        return None
+    return or_(
+        Material.name.ilike(f"%{search}%"),
+        Material.description.ilike(f"%{search}%")
+    )
+
+def parse_sort(sort: Optional[str]) -> Optional[List[Any]]:
+    """ORDER BY clauses for ``price``, ``name`` or ``stock``, descending with a ``-`` prefix.
+
+    The material ID breaks ties so pages do not overlap; with no sort, materials come
+    in ID order. Returns ``None`` for an unknown sort.
+    """
+    if not sort:
+        return [Material.id]
+    descending = sort.startswith("-")
+    column = MATERIAL_SORTS.get(sort.lstrip("-"))
+    if column is None:
+        return None
+    if descending:
+        return [column.desc(), Material.id.desc()]
+    return [column, Material.id]
+
+def _bucket_bounds() -> List[Dict[str, Optional[float]]]:
+    lower: float = 0
+    bounds = []
+    for edge in MATERIAL_PRICE_BUCKETS:
+        bounds.append({"min": lower, "max": edge})
+        lower = edge
+    bounds.append({"min": lower, "max": None})
+    return bounds
+
+def _count_facets(db: Session, filters: MaterialFilters, search: Optional[str]) -> Dict[str, Any]:
+    price = Material.price_per_unit
+    bucket = case(
+        *[(price < edge, index) for index, edge in enumerate(MATERIAL_PRICE_BUCKETS)],
+        else_=len(MATERIAL_PRICE_BUCKETS)
+    ).label("bucket")
+    columns = [Material.unit, bucket]
+    price_conditions = filters.price_conditions()
+    if price_conditions:
+        # Whether the group is inside the price range; the unit facet only counts those
+        columns.append(case((and_(*price_conditions), 1), else_=0).label("in_price_range"))
+    query = db.query(*columns, func.count(Material.id)).filter(price.isnot(None))
+    if search:
+        query = query.filter(search_condition(search))
+    stock_conditions = filters.stock_conditions()
+    if stock_conditions:
+        query = query.filter(*stock_conditions)
+    query = query.group_by(*columns)
+
+    unit_counts: Dict[str, int] = {}
+    bucket_counts = [0] * (len(MATERIAL_PRICE_BUCKETS) + 1)
+    total = 0
+    for row in query:
+        count = row[-1]
+        in_price_range = bool(row.in_price_range) if price_conditions else True
+        unit_matches = filters.unit is None or row.unit == filters.unit
+        if in_price_range:
+            unit_counts[row.unit] = unit_counts.get(row.unit, 0) + count
+        if unit_matches:
+            bucket_counts[row.bucket] += count
+        if in_price_range and unit_matches:
+            total += count
+
+    return {
+        "total": total,
+        "units": [
+            {"unit": unit, "count": count}
+            for unit, count in sorted(unit_counts.items(), key=lambda item: (-item[1], item[0] or ""))
+        ],
+        "price_buckets": [
+            {**bounds, "count": count} for bounds, count in zip(_bucket_bounds(), bucket_counts)
+        ],
+    }
+
+def material_facets(db: Session, filters: MaterialFilters, search: Optional[str] = None) -> Dict[str, Any]:
+    """Counts per unit and per price bucket, and the number of materials matching every filter"""
+    sequence = current_sequence(db)["value"]
+    key = (*filters.key(), search or None)
+    cached = _facet_cache.get(key)
+    if cached is not None and cached[0] == sequence:
+        _facet_cache.move_to_end(key)
+        return {**cached[1], "catalog_sequence": sequence, "cached": True}
+
+    facets = _count_facets(db, filters, search)
+    _facet_cache[key] = (sequence, facets)
+    _facet_cache.move_to_end(key)
+    while len(_facet_cache) > MATERIAL_FACETS_CACHE_ENTRIES:
+        _facet_cache.popitem(last=False)
+    return {**facets, "catalog_sequence": sequence, "cached": False}
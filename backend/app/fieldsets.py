@@ -0,0 +1,52 @@
+"""Sparse fieldsets: ``?fields=id,name,price_per_unit`` on list and detail endpoints.
+
+Only the requested columns are selected, and only those keys are sent, so a picker
+that needs IDs, names and prices does not pay for descriptions or payment data.
+Field names are the keys of the full response, and keys come back in the same
+order as in the full response. Every response key is a column of the same name,
+``payment_data`` included.
+"""
+import json
+from typing import Any, Dict, List, Optional, Sequence
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+
+from .schemas import Material as MaterialSchema, PaymentResponse, Service as ServiceSchema
+
+def _response_keys(schema) -> tuple:
+    return tuple(field.alias or name for name, field in schema.model_fields.items())
+
+MATERIAL_FIELDS = _response_keys(MaterialSchema)
+SERVICE_FIELDS = _response_keys(ServiceSchema)
+PAYMENT_FIELDS = _response_keys(PaymentResponse)
+
+def parse_fields(fields: Optional[str], allowed: Sequence[str]) -> Optional[List[str]]:
+    """Requested fields in response order, or ``None`` for all of them.
+
+    Raises ``ValueError`` for an empty list or an unknown field.
+    """
+    if fields is None:
+        return None
+    requested = {name.strip() for name in fields.split(",") if name.strip()}
+    if not requested:
+        raise ValueError(f"Fields must be a comma-separated list of: {', '.join(allowed)}")
+    unknown = sorted(requested.difference(allowed))
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}. Choose from: {', '.join(allowed)}")
+    return [name for name in allowed if name in requested]
+
+def select_columns(model, fields: Sequence[str]) -> List[Any]:
+    return [getattr(model, name) for name in fields]
+
+def project(row: Any, fields: Sequence[str]) -> Dict[str, Any]:
+    """The requested keys of a row selected with ``select_columns``; extra trailing columns are left out"""
+    return dict(zip(fields, row))
+
+def fieldset_response(content: Any) -> Response:
+    # Encoded like JSONResponse; jsonable_encoder only sees what json cannot encode
+    # itself (datetimes), which is much faster than encoding every row with it
+    body = json.dumps(
+        content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":"), default=jsonable_encoder
+    )
+    return Response(content=body.encode("utf-8"), media_type="application/json")
@@ -0,0 +1,239 @@
+"""Password hashing configuration and cost calibration.
+
+The hash cost is read from the environment so it can be sized per machine:
+
+    PASSWORD_HASH_SCHEME=bcrypt|argon2
+    BCRYPT_ROUNDS=12
+    ARGON2_TIME_COST=3
+    ARGON2_MEMORY_COST=65536   # KiB
+    ARGON2_PARALLELISM=4
+
+Hashes created with another scheme or cost are flagged by ``needs_update`` and
+rehashed on the next successful login.
+
+Run ``python -m app.hashing --target-p99-ms 250`` on the target host to find the
+strongest parameters that keep a single hash under the latency budget.
+"""
+import argparse
+import asyncio
+import math
+import multiprocessing
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from passlib.context import CryptContext
+from passlib.hash import argon2 as argon2_hash
+
+SUPPORTED_SCHEMES = ["bcrypt", "argon2"]
+
+PASSWORD_HASH_SCHEME = os.getenv("PASSWORD_HASH_SCHEME", "bcrypt").lower()
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", "3"))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", "65536"))
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", "4"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+
+def argon2_available() -> bool:
+    """argon2 support needs the optional argon2-cffi package"""
+    return argon2_hash.has_backend()
+
+def build_crypt_context(
+    scheme: str = PASSWORD_HASH_SCHEME,
+    bcrypt_rounds: int = BCRYPT_ROUNDS,
+    argon2_time_cost: int = ARGON2_TIME_COST,
+    argon2_memory_cost: int = ARGON2_MEMORY_COST,
+    argon2_parallelism: int = ARGON2_PARALLELISM
+) -> CryptContext:
+    if scheme not in SUPPORTED_SCHEMES:
+        raise ValueError(f"PASSWORD_HASH_SCHEME must be one of: {', '.join(SUPPORTED_SCHEMES)}")
+    if scheme == "argon2" and not argon2_available():
+        raise ValueError("PASSWORD_HASH_SCHEME=argon2 requires the argon2-cffi package to be installed")
+
+    # The configured scheme hashes new passwords; the others stay listed so existing
+    # hashes still verify, and are marked deprecated so they get rehashed on login.
+    schemes = [scheme] + [s for s in SUPPORTED_SCHEMES if s != scheme]
+    settings: Dict[str, int] = {
+        # Pin min and max to the configured cost so hashes made with a different
+        # cost in either direction are upgraded to the current one
+        "bcrypt__rounds": bcrypt_rounds,
+        "bcrypt__min_rounds": bcrypt_rounds,
+        "bcrypt__max_rounds": bcrypt_rounds,
+    }
+    if argon2_available():
+        settings.update({
+            "argon2__time_cost": argon2_time_cost,
+            "argon2__memory_cost": argon2_memory_cost,
+            "argon2__parallelism": argon2_parallelism,
+        })
+    else:
+        schemes.remove("argon2")
+    return CryptContext(schemes=schemes, deprecated="auto", **settings)
+
+pwd_context = build_crypt_context()
+
+def describe_hash_settings() -> Dict[str, object]:
+    """Current hashing parameters, for startup logs and health output"""
+    if PASSWORD_HASH_SCHEME == "argon2":
+        return {
+            "scheme": "argon2",
+            "time_cost": ARGON2_TIME_COST,
+            "memory_cost_kib": ARGON2_MEMORY_COST,
+            "parallelism": ARGON2_PARALLELISM,
+        }
+    return {"scheme": "bcrypt", "rounds": BCRYPT_ROUNDS}
+
+# --- Parallel hashing for bulk operations ---------------------------------------
+
+_hash_pool: Optional[ProcessPoolExecutor] = None
+
+def _hash_chunk(passwords: List[str]) -> List[str]:
+    # Runs in a pool process, which builds its own pwd_context from the same environment
+    return [pwd_context.hash(password) for password in passwords]
+
+def get_hash_pool() -> ProcessPoolExecutor:
+    global _hash_pool
+    if _hash_pool is None:
+        # spawn, not fork: the server process has live threads and DB connections
+        _hash_pool = ProcessPoolExecutor(
+            max_workers=PASSWORD_HASH_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _hash_pool
+
+def shutdown_hash_pool() -> None:
+    global _hash_pool
+    if _hash_pool is not None:
+        _hash_pool.shutdown(wait=False, cancel_futures=True)
+        _hash_pool = None
+
+async def hash_passwords(passwords: List[str]) -> List[str]:
+    """Hash many passwords across the process pool without blocking the event loop"""
+    if not passwords:
+        return []
+    # A few chunks per worker keeps every process busy without per-password IPC
+    chunk_size = max(1, math.ceil(len(passwords) / (PASSWORD_HASH_WORKERS * 4)))
+    chunks = [passwords[i:i + chunk_size] for i in range(0, len(passwords), chunk_size)]
+    pool = get_hash_pool()
+    results = await asyncio.gather(*(asyncio.wrap_future(pool.submit(_hash_chunk, chunk)) for chunk in chunks))
+    return [hashed for chunk in results for hashed in chunk]
+
+# --- Calibration ---------------------------------------------------------------
+
+BENCHMARK_PASSWORD = "Calibrate-Hash-Cost-42!"
+BCRYPT_ROUNDS_RANGE = range(10, 17)
+ARGON2_MEMORY_LADDER = [19456, 32768, 47104, 65536, 98304, 131072, 262144]
+ARGON2_TIME_LADDER = [2, 3, 4]
+
+def _percentile(samples: List[float], pct: float) -> float:
+    # Nearest-rank percentile
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def benchmark_context(context: CryptContext, samples: int, concurrency: int) -> Dict[str, float]:
+    """Hash ``samples`` times with ``concurrency`` hashes in flight and report latency in ms"""
+    def timed_hash(_: int) -> float:
+        start = time.perf_counter()
+        context.hash(BENCHMARK_PASSWORD)
+        return (time.perf_counter() - start) * 1000
+
+    # Warm up once so backend loading is not counted
+    context.hash(BENCHMARK_PASSWORD)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        durations = list(pool.map(timed_hash, range(samples)))
+    elapsed = time.perf_counter() - started
+    return {
+        "p50_ms": statistics.median(durations),
+        "p99_ms": _percentile(durations, 99),
+        "max_ms": max(durations),
+        "hashes_per_second": samples / elapsed,
+    }
+
+def calibrate_bcrypt(target_p99_ms: float, samples: int, concurrency: int) -> Tuple[Optional[Dict], List[Dict]]:
+    best = None
+    results = []
+    for rounds in BCRYPT_ROUNDS_RANGE:
+        stats = benchmark_context(build_crypt_context("bcrypt", bcrypt_rounds=rounds), samples, concurrency)
+        result = {"params": {"BCRYPT_ROUNDS": rounds}, **stats}
+        results.append(result)
+        if stats["p99_ms"] > target_p99_ms:
+            # Each extra round doubles the cost, so nothing stronger can fit
+            break
+        best = result
+    return best, results
+
+def calibrate_argon2(target_p99_ms: float, samples: int, concurrency: int) -> Tuple[Optional[Dict], List[Dict]]:
+    best = None
+    results = []
+    for time_cost in ARGON2_TIME_LADDER:
+        for memory_cost in ARGON2_MEMORY_LADDER:
+            context = build_crypt_context(
+                "argon2",
+                argon2_time_cost=time_cost,
+                argon2_memory_cost=memory_cost,
+                argon2_parallelism=ARGON2_PARALLELISM
+            )
+            stats = benchmark_context(context, samples, concurrency)
+            result = {
+                "params": {
+                    "ARGON2_TIME_COST": time_cost,
+                    "ARGON2_MEMORY_COST": memory_cost,
+                    "ARGON2_PARALLELISM": ARGON2_PARALLELISM,
+                },
+                **stats
+            }
+            results.append(result)
+            if stats["p99_ms"] > target_p99_ms:
+                break
+            strength = time_cost * memory_cost
+            if best is None or strength > best["params"]["ARGON2_TIME_COST"] * best["params"]["ARGON2_MEMORY_COST"]:
+                best = result
+    return best, results
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Benchmark this host and pick the strongest password hash cost within a latency budget"
+    )
+    parser.add_argument("--scheme", choices=SUPPORTED_SCHEMES, default=PASSWORD_HASH_SCHEME)
+    parser.add_argument("--target-p99-ms", type=float, default=250.0,
+                        help="Latency budget for a single password hash (default: 250)")
+    parser.add_argument("--samples", type=int, default=20, help="Hashes per candidate setting (default: 20)")
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="Hashes in flight at once, e.g. the number of workers on the host (default: 1)")
+    args = parser.parse_args(argv)
+
+    if args.scheme == "argon2" and not argon2_available():
+        print("argon2 calibration requires the argon2-cffi package", file=sys.stderr)
+        return 1
+
+    print(f"Calibrating {args.scheme}: target p99 {args.target_p99_ms:.0f}ms, "
+          f"{args.samples} samples, concurrency {args.concurrency}")
+    calibrate = calibrate_argon2 if args.scheme == "argon2" else calibrate_bcrypt
+    best, results = calibrate(args.target_p99_ms, args.samples, args.concurrency)
+
+    labels = [" ".join(f"{k}={v}" for k, v in result["params"].items()) for result in results]
+    width = max(len(label) for label in labels)
+    for params, result in zip(labels, results):
+        print(f"  {params:<{width}}  p50 {result['p50_ms']:8.1f}ms  p99 {result['p99_ms']:8.1f}ms  "
+              f"{result['hashes_per_second']:7.1f} hashes/s")
+
+    if best is None:
+        print("No setting fits the latency budget; raise --target-p99-ms or use a faster machine",
+              file=sys.stderr)
+        return 1
+
+    print("\nRecommended settings:")
+    print(f"PASSWORD_HASH_SCHEME={args.scheme}")
+    for key, value in best["params"].items():
+        print(f"{key}={value}")
+    print(f"# Expect ~{best['p99_ms']:.0f}ms p99 per login and at most "
+          f"~{best['hashes_per_second']:.0f} logins/s on this host at concurrency {args.concurrency}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
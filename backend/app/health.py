@@ -0,0 +1,132 @@
+"""Background database probing for the health endpoints.
+
+Probe endpoints never touch the database themselves: a background task runs
+``SELECT 1`` every ``HEALTH_PROBE_INTERVAL`` seconds over a dedicated connection
+(outside the request pool) and the endpoints serve the cached result.
+"""
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from sqlalchemy import create_engine, text
+
+from .database import engine
+
+logger = logging.getLogger(__name__)
+
+HEALTH_PROBE_INTERVAL = float(os.getenv("HEALTH_PROBE_INTERVAL", "10"))
+HEALTH_PROBE_TIMEOUT = float(os.getenv("HEALTH_PROBE_TIMEOUT", "2"))
+# A result older than this means the prober itself is stuck
+HEALTH_PROBE_MAX_AGE = float(os.getenv("HEALTH_PROBE_MAX_AGE", str(HEALTH_PROBE_INTERVAL * 3)))
+
+# One connection reserved for probing so probes never wait on, or take, a request slot
+probe_engine = create_engine(
+    engine.url,
+    pool_size=1,
+    max_overflow=0,
+    pool_timeout=HEALTH_PROBE_TIMEOUT,
+    pool_pre_ping=False
+)
+_probe_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="health-probe")
+_probe_task: Optional[asyncio.Task] = None
+
+_state: Dict[str, Any] = {
+    "status": "unknown",
+    "last_probe_at": None,
+    "last_probe_monotonic": None,
+    "latency_ms": None,
+    "error": None,
+    "consecutive_failures": 0,
+}
+
+def _run_probe() -> float:
+    start = time.perf_counter()
+    with probe_engine.connect() as conn:
+        conn.execute(text("SELECT 1")).scalar()
+    return (time.perf_counter() - start) * 1000
+
+async def probe_database() -> None:
+    """Run one probe and record the outcome"""
+    loop = asyncio.get_running_loop()
+    try:
+        latency_ms = await asyncio.wait_for(
+            loop.run_in_executor(_probe_executor, _run_probe),
+            timeout=HEALTH_PROBE_TIMEOUT
+        )
+        if _state["status"] != "healthy":
+            logger.info(f"Database probe healthy ({latency_ms:.2f}ms)")
+        _state.update({
+            "status": "healthy",
+            "latency_ms": round(latency_ms, 2),
+            "error": None,
+            "consecutive_failures": 0,
+        })
+    except Exception as e:
+        error = "Probe timed out" if isinstance(e, asyncio.TimeoutError) else str(e)
+        logger.error(f"Database probe failed: {error}")
+        _state.update({
+            "status": "unhealthy",
+            "latency_ms": None,
+            "error": error,
+            "consecutive_failures": _state["consecutive_failures"] + 1,
+        })
+    _state["last_probe_at"] = datetime.utcnow().isoformat()
+    _state["last_probe_monotonic"] = time.monotonic()
+
+async def _probe_loop() -> None:
+    while True:
+        await asyncio.sleep(HEALTH_PROBE_INTERVAL)
+        await probe_database()
+
+async def start_health_probe() -> None:
+    """Probe once so readiness is known before serving, then keep probing in the background"""
+    global _probe_task
+    await probe_database()
+    _probe_task = asyncio.create_task(_probe_loop())
+
+async def stop_health_probe() -> None:
+    global _probe_task
+    if _probe_task is not None:
+        _probe_task.cancel()
+        try:
+            await _probe_task
+        except asyncio.CancelledError:
+            pass
+        _probe_task = None
+    probe_engine.dispose()
+
+def pool_status() -> Dict[str, Any]:
+    """Occupancy of the request connection pool, read from in-memory counters"""
+    pool = engine.pool
+    status: Dict[str, Any] = {"class": type(pool).__name__}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        counter = getattr(pool, name, None)
+        if callable(counter):
+            status[name] = counter()
+    status["max_overflow"] = getattr(pool, "_max_overflow", None)
+    status["timeout"] = getattr(pool, "_timeout", None)
+    status["recycle"] = getattr(pool, "_recycle", None)
+    return status
+
+def database_status() -> Dict[str, Any]:
+    """Cached probe result; ``ready`` is False when the last probe failed or is stale"""
+    last = _state["last_probe_monotonic"]
+    age = None if last is None else time.monotonic() - last
+    stale = age is None or age > HEALTH_PROBE_MAX_AGE
+    status = "stale" if _state["status"] == "healthy" and stale else _state["status"]
+    return {
+        "ready": status == "healthy",
+        "status": status,
+        "type": engine.dialect.name,
+        "driver": engine.dialect.driver,
+        "last_probe_at": _state["last_probe_at"],
+        "last_probe_age_seconds": None if age is None else round(age, 3),
+        "latency_ms": _state["latency_ms"],
+        "error": _state["error"],
+        "consecutive_failures": _state["consecutive_failures"],
+        "pool": pool_status(),
+    }
@@ -0,0 +1,110 @@
+"""Inventory valuation and low-stock report.
+
+Everything is aggregated in SQL: valuation per unit in one grouped query, the
+most valuable SKUs and the SKUs below the stock threshold with ``ORDER BY ...
+LIMIT``. Reports are cached in-process per parameter set and tagged with the
+catalog change sequence (see ``app.catalog``). Creating or deleting a material
+takes a new sequence number, so a cached report is served only while the
+sequence is unchanged. This also holds across workers, because the check reads
+the shared counter row rather than a per-process flag.
+
+The API has no endpoint that changes an existing material's stock or price. Such
+an update would have to set ``change_seq = next_change_seq(db)`` in its own
+transaction, as creates do, or cached reports would keep the old figures. Edits
+made directly in the database are not seen until the sequence next moves.
+"""
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from .catalog import current_sequence
+from .models import Material
+
+INVENTORY_LOW_STOCK_THRESHOLD = int(os.getenv("INVENTORY_LOW_STOCK_THRESHOLD", "10"))
+INVENTORY_REPORT_MAX_ITEMS = 100
+INVENTORY_CACHE_ENTRIES = 32
+
+_cache: "OrderedDict[Tuple[int, int], Tuple[int, Dict[str, Any]]]" = OrderedDict()
+cache_stats = {"hits": 0, "misses": 0}
+
+def _build_report(db: Session, top: int, threshold: int) -> Dict[str, Any]:
+    started = time.perf_counter()
+    value = func.coalesce(Material.stock, 0) * func.coalesce(Material.price_per_unit, 0)
+
+    by_unit = []
+    totals = {"skus": 0, "units_in_stock": 0, "valuation": 0.0}
+    for unit, skus, units_in_stock, valuation in db.query(
+        Material.unit,
+        func.count(Material.id),
+        func.coalesce(func.sum(Material.stock), 0),
+        func.coalesce(func.sum(value), 0)
+    ).group_by(Material.unit).order_by(func.coalesce(func.sum(value), 0).desc()):
+        by_unit.append({
+            "unit": unit,
+            "skus": skus,
+            "units_in_stock": int(units_in_stock),
+            "valuation": round(float(valuation), 2)
+        })
+        totals["skus"] += skus
+        totals["units_in_stock"] += int(units_in_stock)
+        totals["valuation"] += float(valuation)
+    totals["valuation"] = round(totals["valuation"], 2)
+
+    columns = (Material.id, Material.name, Material.unit, Material.stock, Material.price_per_unit, value.label("value"))
+    most_valuable = db.query(*columns).order_by(value.desc(), Material.id).limit(top).all()
+    # Plain column comparison so the stock index can be used
+    low_stock_filter = Material.stock < threshold
+    low_stock_count = db.query(func.count(Material.id)).filter(low_stock_filter).scalar()
+    low_stock = (
+        db.query(*columns)
+        .filter(low_stock_filter)
+        .order_by(Material.stock, Material.id)
+        .limit(INVENTORY_REPORT_MAX_ITEMS)
+        .all()
+    )
+
+    def item(row) -> Dict[str, Any]:
+        return {
+            "id": row.id,
+            "name": row.name,
+            "unit": row.unit,
+            "stock": row.stock,
+            "price_per_unit": row.price_per_unit,
+            "value": round(float(row.value), 2)
+        }
+
+    return {
+        "totals": totals,
+        "by_unit": by_unit,
+        "most_valuable": [item(row) for row in most_valuable],
+        "low_stock": {
+            "threshold": threshold,
+            "count": low_stock_count,
+            "items": [item(row) for row in low_stock]
+        },
+        "generated_at": datetime.utcnow().isoformat(),
+        "build_ms": round((time.perf_counter() - started) * 1000, 2)
+    }
+
+def inventory_report(db: Session, top: int = 10, threshold: int = INVENTORY_LOW_STOCK_THRESHOLD) -> Dict[str, Any]:
+    """Valuation by unit, the ``top`` most valuable SKUs and SKUs with stock below ``threshold``"""
+    sequence = current_sequence(db)["value"]
+    key = (top, threshold)
+    cached = _cache.get(key)
+    if cached is not None and cached[0] == sequence:
+        _cache.move_to_end(key)
+        cache_stats["hits"] += 1
+        return {**cached[1], "catalog_sequence": sequence, "cached": True}
+
+    cache_stats["misses"] += 1
+    report = _build_report(db, top, threshold)
+    _cache[key] = (sequence, report)
+    _cache.move_to_end(key)
+    while len(_cache) > INVENTORY_CACHE_ENTRIES:
+        _cache.popitem(last=False)
+    return {**report, "catalog_sequence": sequence, "cached": False}
@@ -0,0 +1,355 @@
+"""Durable background job queue stored in the application database.
+
+Endpoints enqueue follow-up work with ``enqueue()`` inside their own transaction,
+so a job exists if and only if the change that produced it was committed. Workers
+claim due jobs (``FOR UPDATE SKIP LOCKED`` on PostgreSQL, a conditional update on
+SQLite), run the registered handler, and retry failures with exponential backoff
+until ``max_attempts``, after which the job is dead-lettered.
+
+A worker runs inside every app process unless ``JOB_WORKER_ENABLED=false``; run
+``python -m app.jobs`` to process the queue in a separate process instead.
+"""
+import asyncio
+import logging
+import os
+import random
+import signal
+import socket
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKER_ENABLED = os.getenv("JOB_WORKER_ENABLED", "true").lower() == "true"
+JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", "2"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+JOB_RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", "5"))
+JOB_RETRY_MAX_SECONDS = float(os.getenv("JOB_RETRY_MAX_SECONDS", "3600"))
+# Running jobs whose worker has not finished within this time are handed out again
+JOB_LOCK_TIMEOUT = int(os.getenv("JOB_LOCK_TIMEOUT", "300"))
+JOB_RETENTION_HOURS = int(os.getenv("JOB_RETENTION_HOURS", "24"))
+
+JOB_STATUSES = ["queued", "running", "succeeded", "dead"]
+
+JobHandler = Callable[[Session, Dict[str, Any]], None]
+MaintenanceTask = Callable[[Session], Any]
+_handlers: Dict[str, JobHandler] = {}
+_maintenance_tasks: List[MaintenanceTask] = []
+
+def job_handler(task: str) -> Callable[[JobHandler], JobHandler]:
+    """Register a function as the handler for ``task``.
+
+    Handlers run in a worker thread with their own session, which is committed
+    when the handler returns. Raising marks the attempt as failed.
+    """
+    def register(handler: JobHandler) -> JobHandler:
+        _handlers[task] = handler
+        return handler
+    return register
+
+def maintenance_task(task: MaintenanceTask) -> MaintenanceTask:
+    """Register a function each worker runs about once a minute, next to the queue's own upkeep"""
+    _maintenance_tasks.append(task)
+    return task
+
+def enqueue(
+    db: Session,
+    task: str,
+    payload: Optional[Dict[str, Any]] = None,
+    delay_seconds: float = 0,
+    max_attempts: Optional[int] = None
+) -> Job:
+    """Add a job to the caller's transaction; it becomes visible when the caller commits"""
+    now = datetime.utcnow()
+    job = Job(
+        task=task,
+        payload=payload or {},
+        status="queued",
+        attempts=0,
+        max_attempts=max_attempts or JOB_MAX_ATTEMPTS,
+        run_at=now + timedelta(seconds=delay_seconds),
+        created_at=now
+    )
+    db.add(job)
+    return job
+
+def retry_delay(attempts: int) -> float:
+    """Exponential backoff with jitter so failing jobs do not retry in lockstep"""
+    delay = min(JOB_RETRY_MAX_SECONDS, JOB_RETRY_BASE_SECONDS * (2 ** max(0, attempts - 1)))
+    return delay * random.uniform(0.8, 1.2)
+
+def claim_jobs(db: Session, worker_id: str, limit: int) -> List[int]:
+    """Claim up to ``limit`` due jobs for this worker and return their ids"""
+    now = datetime.utcnow()
+    candidates = db.query(Job.id).filter(
+        Job.status == "queued",
+        Job.run_at <= now
+    ).order_by(Job.run_at, Job.id).limit(limit).with_for_update(skip_locked=True).all()
+
+    claimed = []
+    for (job_id,) in candidates:
+        # On PostgreSQL the row is already locked by SKIP LOCKED; on SQLite the
+        # status condition makes sure only one worker wins the job
+        updated = db.query(Job).filter(Job.id == job_id, Job.status == "queued").update({
+            Job.status: "running",
+            Job.locked_by: worker_id,
+            Job.locked_at: now,
+            Job.started_at: now,
+            Job.attempts: Job.attempts + 1
+        }, synchronize_session=False)
+        if updated:
+            claimed.append(job_id)
+    db.commit()
+    return claimed
+
+def run_job(job_id: int) -> None:
+    """Run one claimed job and record success, a scheduled retry, or dead-lettering"""
+    db = SessionLocal()
+    try:
+        job = db.query(Job).filter(Job.id == job_id).first()
+        if not job:
+            return
+        handler = _handlers.get(str(job.task))
+        try:
+            if handler is None:
+                raise LookupError(f"No handler registered for task '{job.task}'")
+            handler(db, dict(job.payload or {}))
+            job.status = "succeeded"
+            job.finished_at = datetime.utcnow()
+            job.last_error = None
+            job.locked_by = None
+            db.commit()
+            _counters["succeeded"] += 1
+        except Exception as e:
+            db.rollback()
+            job = db.query(Job).filter(Job.id == job_id).first()
+            job.last_error = f"{type(e).__name__}: {str(e)}"
+            job.locked_by = None
+            if job.attempts >= job.max_attempts:
+                job.status = "dead"
+                job.finished_at = datetime.utcnow()
+                _counters["dead"] += 1
+                logger.error(f"Job {job_id} ({job.task}) dead-lettered after {job.attempts} attempts: {job.last_error}")
+            else:
+                job.status = "queued"
+                job.run_at = datetime.utcnow() + timedelta(seconds=retry_delay(int(job.attempts)))
+                _counters["retried"] += 1
+                logger.warning(f"Job {job_id} ({job.task}) failed attempt {job.attempts}, retrying at {job.run_at}: {job.last_error}")
+            db.commit()
+    finally:
+        db.close()
+
+def requeue_stale_jobs(db: Session) -> int:
+    """Hand out again jobs whose worker died mid-run, dead-lettering exhausted ones"""
+    cutoff = datetime.utcnow() - timedelta(seconds=JOB_LOCK_TIMEOUT)
+    stale = db.query(Job).filter(Job.status == "running", Job.locked_at < cutoff)
+    dead = stale.filter(Job.attempts >= Job.max_attempts).update({
+        Job.status: "dead",
+        Job.finished_at: datetime.utcnow(),
+        Job.locked_by: None,
+        Job.last_error: "Worker did not finish the job within JOB_LOCK_TIMEOUT"
+    }, synchronize_session=False)
+    requeued = db.query(Job).filter(Job.status == "running", Job.locked_at < cutoff).update({
+        Job.status: "queued",
+        Job.locked_by: None,
+        Job.run_at: datetime.utcnow()
+    }, synchronize_session=False)
+    db.commit()
+    if dead or requeued:
+        logger.warning(f"Recovered stale jobs: {requeued} requeued, {dead} dead-lettered")
+    return requeued + dead
+
+def purge_finished_jobs(db: Session) -> int:
+    """Delete succeeded jobs past the retention window; dead jobs are kept for inspection"""
+    cutoff = datetime.utcnow() - timedelta(hours=JOB_RETENTION_HOURS)
+    deleted = db.query(Job).filter(Job.status == "succeeded", Job.finished_at < cutoff).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+def retry_dead_job(db: Session, job_id: int) -> bool:
+    """Put a dead-lettered job back on the queue with a fresh attempt budget"""
+    updated = db.query(Job).filter(Job.id == job_id, Job.status == "dead").update({
+        Job.status: "queued",
+        Job.attempts: 0,
+        Job.run_at: datetime.utcnow(),
+        Job.finished_at: None
+    }, synchronize_session=False)
+    db.commit()
+    return bool(updated)
+
+# In-process counters since this worker started
+_counters: Dict[str, int] = {"succeeded": 0, "retried": 0, "dead": 0}
+
+def _seconds(delta: Optional[timedelta]) -> Optional[float]:
+    return None if delta is None else round(delta.total_seconds(), 3)
+
+def queue_stats(db: Session, window_minutes: int = 60) -> Dict[str, Any]:
+    """Queue depth by status and task, plus wait and run latency of recently finished jobs"""
+    now = datetime.utcnow()
+    depth = {status: 0 for status in JOB_STATUSES}
+    by_task: Dict[str, Dict[str, int]] = {}
+    for task, status, count in db.query(Job.task, Job.status, func.count(Job.id)).group_by(Job.task, Job.status):
+        depth[status] = depth.get(status, 0) + count
+        by_task.setdefault(task, {})[status] = count
+
+    oldest_due = db.query(func.min(Job.run_at)).filter(Job.status == "queued", Job.run_at <= now).scalar()
+
+    recent = db.query(Job.created_at, Job.run_at, Job.started_at, Job.finished_at).filter(
+        Job.status == "succeeded",
+        Job.finished_at >= now - timedelta(minutes=window_minutes)
+    ).order_by(Job.finished_at.desc()).limit(1000).all()
+    # Wait is measured from when the job became due, so scheduled retries do not count
+    waits = [(row.started_at - row.run_at).total_seconds() * 1000 for row in recent if row.started_at]
+    runs = [(row.finished_at - row.started_at).total_seconds() * 1000 for row in recent if row.started_at]
+
+    def summarize(samples: List[float]) -> Dict[str, Optional[float]]:
+        if not samples:
+            return {"avg_ms": None, "p95_ms": None, "max_ms": None}
+        ordered = sorted(samples)
+        return {
+            "avg_ms": round(statistics.mean(ordered), 2),
+            "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 2),
+            "max_ms": round(ordered[-1], 2)
+        }
+
+    return {
+        "depth": depth,
+        "by_task": by_task,
+        "oldest_due_age_seconds": _seconds(now - oldest_due) if oldest_due else 0,
+        "recent": {
+            "window_minutes": window_minutes,
+            "completed": len(recent),
+            "wait": summarize(waits),
+            "run": summarize(runs)
+        },
+        "worker": {
+            "enabled": _worker is not None,
+            "id": _worker.worker_id if _worker else None,
+            "concurrency": JOB_WORKER_CONCURRENCY,
+            "in_flight": _worker.in_flight if _worker else 0,
+            **_counters
+        }
+    }
+
+class JobWorker:
+    """Polls for due jobs and runs them on a small thread pool"""
+
+    def __init__(self, concurrency: int = JOB_WORKER_CONCURRENCY):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.concurrency = max(1, concurrency)
+        self.in_flight = 0
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="job-worker")
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self._last_maintenance = 0.0
+
+    def _claim(self, limit: int) -> List[int]:
+        db = SessionLocal()
+        try:
+            if time.monotonic() - self._last_maintenance > 60:
+                self._last_maintenance = time.monotonic()
+                requeue_stale_jobs(db)
+                purge_finished_jobs(db)
+                for task in _maintenance_tasks:
+                    try:
+                        task(db)
+                    except Exception as e:
+                        db.rollback()
+                        logger.error(f"Maintenance task {task.__name__} failed: {str(e)}")
+            return claim_jobs(db, self.worker_id, limit)
+        finally:
+            db.close()
+
+    async def _run_one(self, job_id: int) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self._executor, run_job, job_id)
+        except Exception as e:
+            logger.error(f"Job {job_id} crashed the worker: {str(e)}", exc_info=True)
+        finally:
+            self.in_flight -= 1
+            self._wakeup.set()
+
+    async def _loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            free = self.concurrency - self.in_flight
+            claimed: List[int] = []
+            if free > 0:
+                try:
+                    claimed = await loop.run_in_executor(self._executor, self._claim, free)
+                except Exception as e:
+                    logger.error(f"Job claim failed: {str(e)}")
+            for job_id in claimed:
+                self.in_flight += 1
+                asyncio.create_task(self._run_one(job_id))
+            if len(claimed) < free or free == 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+
+    def wake(self) -> None:
+        """Poll now instead of at the next interval, e.g. right after enqueueing"""
+        self._wakeup.set()
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._loop())
+        logger.info(f"Job worker {self.worker_id} started with concurrency {self.concurrency}")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        # Let running jobs finish; anything interrupted is recovered by requeue_stale_jobs
+        await asyncio.get_running_loop().run_in_executor(None, self._executor.shutdown, True)
+        logger.info(f"Job worker {self.worker_id} stopped")
+
+_worker: Optional[JobWorker] = None
+
+def start_job_worker() -> None:
+    global _worker
+    if JOB_WORKER_ENABLED and _worker is None:
+        _worker = JobWorker()
+        _worker.start()
+
+async def stop_job_worker() -> None:
+    global _worker
+    if _worker is not None:
+        await _worker.stop()
+        _worker = None
+
+def wake_job_worker() -> None:
+    if _worker is not None:
+        _worker.wake()
+
+async def run_standalone() -> None:
+    """Process the queue until SIGINT or SIGTERM"""
+    global _worker
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    _worker = JobWorker()
+    _worker.start()
+    await stop.wait()
+    await stop_job_worker()
+
+if __name__ == "__main__":
+    # Import through the package so handlers register on the module the worker uses
+    from app import jobs, tasks  # noqa: F401
+    asyncio.run(jobs.run_standalone())
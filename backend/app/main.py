@@ -1,17 +1,21 @@
+import asyncio
+import json
 import logging
 import os
+import secrets
 import sys
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from typing import Optional, Dict, Any, List
 
-from fastapi import FastAPI, Request, HTTPException, Depends, status
+from fastapi import FastAPI, Request, HTTPException, Depends, Query, status
 from pydantic import ValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
 from sqlalchemy.orm import Session
-from sqlalchemy import text, and_, or_
-from sqlalchemy.exc import SQLAlchemyError, OperationalError
+from sqlalchemy import and_, or_, insert
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
 from typing import List, Optional
 from datetime import datetime, timedelta
 
@@ -28,30 +32,69 @@ def log_db_error(e: Exception):
         }
     )
 
-from .models import User, Material, Service, Payment
+from .models import User, Material, Service, Payment, Job
 from .schemas import (
     UserCreate, User as UserSchema,
+    BulkUserCreate, BulkUserProvisionRequest, BulkUserProvisionResponse,
     MaterialCreate, Material as MaterialSchema,
     ServiceCreate, Service as ServiceSchema,
-    Token, TokenData,
-    PaymentCreate, PaymentResponse, PaymentVerification
+    CatalogChanges,
+    Token, TokenData, RefreshTokenRequest,
+    PaymentCreate, PaymentResponse, PaymentVerification, PaymentReconcileRequest,
+    ExchangeRateUpdate
 )
 
 from .database import (
-    engine, Base, get_db, SessionLocal,
-    DB_POOL_SIZE, DB_MAX_OVERFLOW,
-    DB_POOL_TIMEOUT, DB_POOL_RECYCLE
+    engine, get_db, SessionLocal, add_missing_columns, create_tables
 )
 from .auth import (
     create_access_token,
     get_current_active_user,
     get_password_hash,
-    verify_password,
+    verify_and_update_password,
     create_user,
     get_user,
+    create_refresh_token,
+    rotate_refresh_token,
+    get_refresh_token,
+    revoke_refresh_token_family,
+    revoke_user_refresh_tokens,
     ACCESS_TOKEN_EXPIRE_MINUTES
 )
+from . import tasks  # noqa: F401  registers the background job handlers
+from .analytics import (
+    BASE_CURRENCY, CURRENCY_CODE, PAYMENT_STATUSES, REPORT_GROUPINGS, MissingExchangeRate,
+    exchange_rates, record_payment_change, revenue_report, set_exchange_rate
+)
+from .autocomplete import (
+    AUTOCOMPLETE_ENABLED, AUTOCOMPLETE_MAX_RESULTS, autocomplete_index, index_catalog_row, unindex_catalog_row
+)
+from .catalog import (
+    CATALOG_CHANGES_MAX, CATALOG_MODELS, CatalogResyncRequired,
+    changes_since, initialize_catalog_sequence, next_change_seq, record_deletion
+)
+from .fieldsets import (
+    MATERIAL_FIELDS, PAYMENT_FIELDS, SERVICE_FIELDS, fieldset_response, parse_fields, project, select_columns
+)
+from .facets import MATERIAL_SORTS, MaterialFilters, material_facets, parse_sort, search_condition
+from .inventory import INVENTORY_LOW_STOCK_THRESHOLD, INVENTORY_REPORT_MAX_ITEMS, inventory_report
+from .archive import PAYMENT_ARCHIVE_AFTER_DAYS, archive_stats, find_payment, find_payments
+from .audit import audit_history, audit_log
+from .payments import backfill_payment_references, reconcile
+from .jobs import enqueue, queue_stats, retry_dead_job, start_job_worker, stop_job_worker, wake_job_worker
+from .notifications import payment_hub
+from .snapshot import catalog_snapshot
+from .slowqueries import SLOW_QUERY_SORTS, install_slow_query_log, slow_query_log
+from .receipts import RECEIPT_FORMATS, ReceiptFileResponse, receipt_cache, receipt_fields
+from .health import database_status, start_health_probe, stop_health_probe
+from .hashing import describe_hash_settings, hash_passwords, shutdown_hash_pool
 from .middlewares.passwordValidation import validate_password
+from .middlewares.admission import AdmissionControlMiddleware, admission_stats
+from .middlewares.deadlines import DeadlineMiddleware, install_deadline_hooks
+from .middlewares.requestLogging import RequestContextMiddleware
+from .middlewares.profiling import (
+    PROFILE_TOKEN_MAX_MINUTES, PROFILING_ENABLED, ProfilingMiddleware, create_profile_token, profile_store
+)
 
 # Configure logging
 logging.basicConfig(
@@ -67,6 +110,14 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Payment status streams
+PAYMENT_TERMINAL_STATUSES = ("completed", "failed")
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+SSE_MAX_STREAM_SECONDS = float(os.getenv("SSE_MAX_STREAM_SECONDS", "300"))
+
+# Largest batch accepted by the bulk user provisioning endpoint
+BULK_PROVISION_MAX_USERS = int(os.getenv("BULK_PROVISION_MAX_USERS", "1000"))
+
 # Configure CORS with specific origins
 FRONTEND_URL = os.getenv("FRONTEND_URL", "https://flooring-crm-frontend.onrender.com")
 ALLOWED_ORIGINS = [
@@ -77,30 +128,32 @@ ALLOWED_ORIGINS = [
     FRONTEND_URL
 ]
 
+# Statements slower than SLOW_QUERY_MS, with their plans
+install_slow_query_log(engine)
+
+# Innermost, so a profile covers the handler and validation but not queueing for admission
+if PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+
+# Deadlines start once a request is admitted, and carry into every statement it runs
+install_deadline_hooks(engine)
+app.add_middleware(DeadlineMiddleware)
+
+# Inside CORS and logging, so shed requests still get CORS headers and a request ID
+app.add_middleware(AdmissionControlMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=ALLOWED_ORIGINS,
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-    allow_headers=["Content-Type", "Authorization", "Accept", "Origin"],
-    expose_headers=["Content-Type"],
+    allow_headers=["Content-Type", "Authorization", "Accept", "Origin", "X-Profile-Token"],
+    expose_headers=["Content-Type", "X-Request-ID", "X-Profile-ID"],
     max_age=3600
 )
 
-# Add request logging middleware
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    start_time = datetime.utcnow()
-    response = await call_next(request)
-    end_time = datetime.utcnow()
-    duration = (end_time - start_time).total_seconds() * 1000
-    logger.info(
-        f"Path: {request.url.path} "
-        f"Method: {request.method} "
-        f"Status: {response.status_code} "
-        f"Duration: {duration:.2f}ms"
-    )
-    return response
+# Request IDs, timing and access logging; added last so it wraps CORS and times every request
+app.add_middleware(RequestContextMiddleware)
 
 @app.on_event("startup")
 async def startup_event():
@@ -125,12 +178,39 @@ async def startup_event():
         logger.info(f"Process ID: {os.getpid()}")
         logger.info(f"Python Version: {sys.version}")
         logger.info(f"CORS origins: {ALLOWED_ORIGINS}")
+        logger.info(f"Password hashing: {describe_hash_settings()}")
         logger.info(f"Database URL: {os.getenv('DATABASE_URL', 'sqlite:///./flooring.db')}")
         
         # Create database tables
-        Base.metadata.create_all(bind=engine)
+        create_tables(engine)
+        added_columns = add_missing_columns(engine)
         logger.info("Database tables created successfully")
         
+        db = SessionLocal()
+        try:
+            # Number catalog rows written before change tracking existed
+            initialize_catalog_sequence(db)
+            if AUTOCOMPLETE_ENABLED:
+                autocomplete_index.build(db)
+            # Written by whichever worker gets there first; the others map it
+            catalog_snapshot.schedule_build()
+            if "payments.reference_id" in added_columns:
+                backfill_payment_references(db)
+        finally:
+            db.close()
+        
+        # Start background database probing for the health endpoints
+        await start_health_probe()
+        
+        # Start processing background jobs in this worker
+        start_job_worker()
+        
+        # Write audit events in batches
+        audit_log.start()
+        
+        # Receive payment status changes published by the other workers
+        payment_hub.start()
+        
         # Log deployment URLs
         logger.info("\n=== Deployment URLs ===")
         logger.info(f"Frontend URL: {FRONTEND_URL}")
@@ -149,6 +229,15 @@ async def startup_event():
         logger.error("Application startup failed - check configuration")
         raise
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    logger.info("=== Application Shutdown ===")
+    payment_hub.stop()
+    await stop_job_worker()
+    await stop_health_probe()
+    audit_log.stop()
+    shutdown_hash_pool()
+
 @app.get("/")
 async def root():
     """Root endpoint"""
@@ -159,14 +248,33 @@ async def root():
         "timestamp": datetime.utcnow().isoformat()
     }
 
+@app.get("/livez")
+async def liveness_check():
+    """Liveness probe: the process is up and serving; no I/O"""
+    return {"status": "alive"}
+
+@app.get("/readyz")
+async def readiness_check():
+    """Readiness probe served from the cached background database probe"""
+    database = database_status()
+    return JSONResponse(
+        status_code=200 if database["ready"] else 503,
+        content={
+            "status": "ready" if database["ready"] else "not_ready",
+            "database": {
+                "status": database["status"],
+                "last_probe_at": database["last_probe_at"],
+                "latency_ms": database["latency_ms"]
+            }
+        }
+    )
+
 @app.get("/healthz")
 @app.get("/health")
-def health_check(db: Session = Depends(get_db)):
-    """Health check endpoint for monitoring"""
-    try:
-        # Simple database connection test
-        result = db.execute(text("SELECT 1")).scalar()
-        
+async def health_check():
+    """Health check endpoint for monitoring, served from the cached database probe"""
+    database = database_status()
+    if database["ready"]:
         return JSONResponse(
             status_code=200,
             content={
@@ -175,31 +283,24 @@ def health_check(db: Session = Depends(get_db)):
                 "version": "1.0.0",
                 "environment": os.getenv("ENV", "production"),
                 "timestamp": datetime.utcnow().isoformat(),
-                "database": {
-                    "status": "healthy",
-                    "type": "postgresql",
-                    "pool": {
-                        "size": DB_POOL_SIZE,
-                        "max_overflow": DB_MAX_OVERFLOW,
-                        "timeout": DB_POOL_TIMEOUT,
-                        "recycle": DB_POOL_RECYCLE
-                    }
-                }
+                "database": database,
+                "admission": admission_stats()
             }
         )
-    except Exception as e:
-        logger.error(f"Health check failed: {str(e)}", exc_info=True)
-        return JSONResponse(
-            status_code=200,
-            content={
-                "status": "degraded",
-                "message": "Service is experiencing issues",
-                "error": str(e),
-                "timestamp": datetime.utcnow().isoformat()
-            }
-        )
-
-
+    
+    return JSONResponse(
+        status_code=503,
+        content={
+            "status": "degraded",
+            "message": "Service is experiencing issues",
+            "error": database["error"] or f"Database probe is {database['status']}",
+            "version": "1.0.0",
+            "environment": os.getenv("ENV", "production"),
+            "timestamp": datetime.utcnow().isoformat(),
+            "database": database,
+            "admission": admission_stats()
+        }
+    )
 
 @app.post("/api/auth/register", response_model=Token)
 async def register(user: UserCreate, db: Session = Depends(get_db)):
@@ -294,7 +395,8 @@ async def register(user: UserCreate, db: Session = Depends(get_db)):
         
         return {
             "access_token": access_token,
-            "token_type": "bearer"
+            "token_type": "bearer",
+            "refresh_token": create_refresh_token(db, db_user)
         }
         
     except ValidationError as e:
@@ -371,7 +473,8 @@ async def login(
             )
         
         # Verify password
-        if not verify_password(form_data.password, str(user.hashed_password)):
+        verified, new_hash = verify_and_update_password(form_data.password, str(user.hashed_password))
+        if not verified:
             raise HTTPException(
                 status_code=401,
                 detail={
@@ -381,6 +484,12 @@ async def login(
                 }
             )
         
+        # Upgrade hashes made with an old scheme or cost while we have the plain password
+        if new_hash:
+            user.hashed_password = new_hash
+            db.commit()
+            logger.info(f"Rehashed password for user {user.id} with current hash settings")
+        
         # Create access token
         access_token = create_access_token(
             data={"sub": user.username},
@@ -389,7 +498,8 @@ async def login(
         
         return {
             "access_token": access_token,
-            "token_type": "bearer"
+            "token_type": "bearer",
+            "refresh_token": create_refresh_token(db, user)
         }
         
     except HTTPException:
@@ -405,28 +515,265 @@ async def login(
             }
         )
 
+@app.post("/api/auth/refresh", response_model=Token)
+async def refresh_access_token(request: RefreshTokenRequest, db: Session = Depends(get_db)):
+    """Exchange a refresh token for a new access token without re-checking the password"""
+    try:
+        user, refresh_token = rotate_refresh_token(db, request.refresh_token)
+        
+        access_token = create_access_token(
+            data={"sub": user.username},
+            expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        )
+        
+        return {
+            "access_token": access_token,
+            "token_type": "bearer",
+            "refresh_token": refresh_token
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Token refresh error: {str(e)}", exc_info=True)
+        db.rollback()
+        raise HTTPException(
+            status_code=500,
+            detail={
+                "status": "error",
+                "message": "An unexpected error occurred while refreshing the session",
+                "errors": ["Please log in again. If the problem persists, contact support."]
+            }
+        )
+
+@app.post("/api/auth/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(request: RefreshTokenRequest, db: Session = Depends(get_db)):
+    """Revoke a refresh token's session, or every session of its user"""
+    db_token = get_refresh_token(db, request.refresh_token)
+    if not db_token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail={
+                "status": "error",
+                "message": "Invalid refresh token",
+                "errors": ["The session has already ended or never existed"]
+            }
+        )
+    
+    if request.all_sessions:
+        revoke_user_refresh_tokens(db, int(db_token.user_id))
+    else:
+        revoke_refresh_token_family(db, str(db_token.family_id))
+    return None
+
 @app.get("/api/auth/me", response_model=UserSchema)
 async def read_users_me(current_user: User = Depends(get_current_active_user)):
     """Get current user info"""
     return current_user
 
+@app.post("/api/users/bulk", response_model=BulkUserProvisionResponse)
+async def bulk_provision_users(
+    request: BulkUserProvisionRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Create many users at once (employee only), reporting a result per user"""
+    if str(current_user.role) != "employee":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail={
+                "status": "error",
+                "message": "Permission denied",
+                "errors": ["Only employees can provision users. Please contact your administrator for access."]
+            }
+        )
+    
+    if len(request.users) > BULK_PROVISION_MAX_USERS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={
+                "status": "error",
+                "message": "Batch too large",
+                "errors": [f"At most {BULK_PROVISION_MAX_USERS} users can be provisioned per request"]
+            }
+        )
+    
+    results: List[Dict[str, Any]] = []
+    candidates: Dict[int, BulkUserCreate] = {}
+    seen_usernames = set()
+    seen_emails = set()
+    
+    # Validate every entry and catch duplicates inside the batch
+    for index, raw_user in enumerate(request.users):
+        # Echoed only when it is a string, so a malformed entry fails its own result, not the response
+        username = raw_user.get("username")
+        result = {
+            "index": index, "username": username if isinstance(username, str) else None,
+            "status": "error", "id": None, "errors": []
+        }
+        results.append(result)
+        try:
+            user = BulkUserCreate.model_validate(raw_user)
+        except ValidationError as e:
+            result["errors"] = [
+                f"{'.'.join(str(loc) for loc in error['loc'])}: {error['msg'].replace('Value error, ', '')}"
+                for error in e.errors()
+            ]
+            continue
+        
+        errors = validate_password(user.password)
+        if user.username in seen_usernames:
+            errors.append("Username appears more than once in this batch")
+        if user.email in seen_emails:
+            errors.append("Email appears more than once in this batch")
+        seen_usernames.add(user.username)
+        seen_emails.add(user.email)
+        if errors:
+            result["errors"] = errors
+            continue
+        candidates[index] = user
+    
+    # One query for uniqueness against existing accounts
+    if candidates:
+        existing = db.query(User.username, User.email).filter(or_(
+            User.username.in_([u.username for u in candidates.values()]),
+            User.email.in_([u.email for u in candidates.values()])
+        )).all()
+        taken_usernames = {row.username for row in existing}
+        taken_emails = {row.email for row in existing}
+        for index, user in list(candidates.items()):
+            errors = []
+            if user.username in taken_usernames:
+                errors.append("Username is already registered")
+            if user.email in taken_emails:
+                errors.append("Email is already registered")
+            if errors:
+                results[index]["errors"] = errors
+                del candidates[index]
+    
+    if candidates:
+        indexes = list(candidates.keys())
+        hashed_passwords = await hash_passwords([candidates[i].password for i in indexes])
+        rows = [
+            {
+                "username": candidates[i].username,
+                "email": candidates[i].email,
+                "hashed_password": hashed,
+                "role": candidates[i].role,
+                "phone": candidates[i].phone,
+                "address": candidates[i].address,
+                "is_active": True
+            }
+            for i, hashed in zip(indexes, hashed_passwords)
+        ]
+        try:
+            inserted = db.execute(
+                insert(User).returning(User.id, sort_by_parameter_order=True),
+                rows
+            ).scalars().all()
+            db.commit()
+        except IntegrityError as e:
+            db.rollback()
+            logger.warning(f"Bulk provisioning conflicted with concurrent registrations: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail={
+                    "status": "error",
+                    "message": "Batch conflicts with concurrent registrations",
+                    "errors": ["No users were created. Retry the batch; existing accounts will be reported per user."]
+                }
+            )
+        for index, user_id in zip(indexes, inserted):
+            results[index].update({"status": "created", "id": user_id})
+    
+    created = sum(1 for result in results if result["status"] == "created")
+    logger.info(f"Bulk provisioning by {current_user.username}: {created} created, {len(results) - created} failed")
+    return {
+        "created": created,
+        "failed": len(results) - created,
+        "results": results
+    }
+
+def material_filters(
+    min_price: Optional[float] = Query(None, ge=0, description="Lowest price per unit"),
+    max_price: Optional[float] = Query(None, ge=0, description="Highest price per unit"),
+    unit: Optional[str] = Query(None, description="Unit of measurement, e.g. sqft"),
+    in_stock: bool = Query(False, description="Only materials with stock"),
+    min_stock: Optional[int] = Query(None, ge=0, description="Only materials with at least this much stock")
+) -> MaterialFilters:
+    if min_price is not None and max_price is not None and min_price > max_price:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={
+                "status": "error",
+                "message": "Invalid price range",
+                "errors": ["min_price cannot be greater than max_price"]
+            }
+        )
+    return MaterialFilters(min_price=min_price, max_price=max_price, unit=unit, in_stock=in_stock, min_stock=min_stock)
+
+def fieldset(allowed):
+    """Dependency parsing ``?fields=`` against the keys of one response schema"""
+    def requested_fields(
+        fields: Optional[str] = Query(None, description=f"Comma-separated subset of: {', '.join(allowed)}")
+    ) -> Optional[List[str]]:
+        try:
+            return parse_fields(fields, allowed)
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail={
+                    "status": "error",
+                    "message": "Invalid fields",
+                    "errors": [str(e)]
+                }
+            )
+    return requested_fields
+
 @app.get("/api/materials", response_model=List[MaterialSchema])
 async def list_materials(
     skip: int = 0,
     limit: int = 100,
     search: Optional[str] = None,
+    sort: Optional[str] = Query(None, description="price, name or stock; prefix with - for descending"),
+    filters: MaterialFilters = Depends(material_filters),
+    fields: Optional[List[str]] = Depends(fieldset(MATERIAL_FIELDS)),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    """List all materials with optional search and pagination"""
-    query = db.query(Material)
-    if search:
-        search_filter = or_(
-            Material.name.ilike(f"%{search}%"),
-            Material.description.ilike(f"%{search}%")
+    """List materials with optional search, filters, sorting and pagination"""
+    order_by = parse_sort(sort)
+    if order_by is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={
+                "status": "error",
+                "message": "Invalid sort",
+                "errors": [f"Sort must be one of: {', '.join(MATERIAL_SORTS)}, optionally prefixed with -"]
+            }
         )
-        query = query.filter(search_filter)
-    return query.offset(skip).limit(limit).all()
+    if not search and not sort and not fields and all(value is None for value in filters.key()):
+        # Plain listing: a slice of the shared pre-serialized catalog while it is current
+        snapshot_response = catalog_snapshot.response(db, "materials", skip, limit)
+        if snapshot_response is not None:
+            return snapshot_response
+    query = filters.apply(db.query(*select_columns(Material, fields)) if fields else db.query(Material))
+    if search:
+        query = query.filter(search_condition(search))
+    materials = query.order_by(*order_by).offset(skip).limit(limit).all()
+    if fields:
+        return fieldset_response([project(row, fields) for row in materials])
+    return materials
+
+@app.get("/api/materials/facets")
+async def get_material_facets(
+    search: Optional[str] = None,
+    filters: MaterialFilters = Depends(material_filters),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Material counts per unit and price bucket for the given search and filters"""
+    return material_facets(db, filters, search)
 
 @app.post("/api/materials", response_model=MaterialSchema)
 async def create_material(
@@ -491,12 +838,20 @@ async def create_material(
             description=material.description,
             price_per_unit=material.price_per_unit,
             unit=material.unit,
-            stock=material.stock
+            stock=material.stock,
+            change_seq=next_change_seq(db)
         )
         
         db.add(db_material)
         db.commit()
         db.refresh(db_material)
+        index_catalog_row("material", db_material.id, db_material.name)
+        audit_log.record("material.create", "material", db_material.id, current_user, {
+            "name": db_material.name,
+            "price_per_unit": db_material.price_per_unit,
+            "unit": db_material.unit,
+            "stock": db_material.stock
+        })
         return db_material
         
     except HTTPException:
@@ -513,18 +868,76 @@ async def list_services(
     skip: int = 0,
     limit: int = 100,
     search: Optional[str] = None,
+    fields: Optional[List[str]] = Depends(fieldset(SERVICE_FIELDS)),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """List all services with optional search and pagination"""
-    query = db.query(Service)
+    if not search and not fields:
+        snapshot_response = catalog_snapshot.response(db, "services", skip, limit)
+        if snapshot_response is not None:
+            return snapshot_response
+    query = db.query(*select_columns(Service, fields)) if fields else db.query(Service)
     if search:
         search_filter = or_(
             Service.name.ilike(f"%{search}%"),
             Service.description.ilike(f"%{search}%")
         )
         query = query.filter(search_filter)
-    return query.offset(skip).limit(limit).all()
+    services = query.order_by(Service.id).offset(skip).limit(limit).all()
+    if fields:
+        return fieldset_response([project(row, fields) for row in services])
+    return services
+
+@app.get("/api/catalog/changes", response_model=CatalogChanges)
+async def catalog_changes(
+    since: int = Query(0, ge=0, description="Last sequence number the client has seen; 0 for a full sync"),
+    limit: int = Query(CATALOG_CHANGES_MAX, ge=1, le=CATALOG_CHANGES_MAX),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Materials and services written, and ids deleted, after a catalog sequence number"""
+    try:
+        return changes_since(db, since, limit)
+    except CatalogResyncRequired:
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail={
+                "status": "error",
+                "message": "Catalog sync expired",
+                "errors": ["Changes since this sequence number are no longer available. Sync again with since=0."]
+            }
+        )
+
+@app.get("/api/catalog/autocomplete")
+async def catalog_autocomplete(
+    q: str = Query(..., min_length=1, max_length=100, description="What the user has typed so far"),
+    limit: int = Query(10, ge=1, le=AUTOCOMPLETE_MAX_RESULTS),
+    kind: Optional[str] = Query(None, description="material or service; both when omitted"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Materials and services whose name, or a word in it, starts with ``q``"""
+    if not AUTOCOMPLETE_ENABLED:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail={
+                "status": "error",
+                "message": "Autocomplete is disabled",
+                "errors": ["Use search on /api/materials or /api/services instead"]
+            }
+        )
+    if kind is not None and kind not in CATALOG_MODELS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={
+                "status": "error",
+                "message": "Invalid kind",
+                "errors": [f"Kind must be one of: {', '.join(CATALOG_MODELS)}"]
+            }
+        )
+    autocomplete_index.refresh(db)
+    return {"query": q, "results": autocomplete_index.search(q, limit=limit, kind=kind)}
 
 @app.post("/api/services", response_model=ServiceSchema)
 async def create_service(
@@ -581,12 +994,18 @@ async def create_service(
         db_service = Service(
             name=service.name,
             description=service.description,
-            base_price=service.base_price
+            base_price=service.base_price,
+            change_seq=next_change_seq(db)
         )
         
         db.add(db_service)
         db.commit()
         db.refresh(db_service)
+        index_catalog_row("service", db_service.id, db_service.name)
+        audit_log.record("service.create", "service", db_service.id, current_user, {
+            "name": db_service.name,
+            "base_price": db_service.base_price
+        })
         return db_service
         
     except HTTPException:
@@ -763,8 +1182,12 @@ async def delete_material(
             detail="Material not found"
         )
     
+    name = material.name
     db.delete(material)
+    record_deletion(db, "material", material_id)
     db.commit()
+    unindex_catalog_row("material", material_id)
+    audit_log.record("material.delete", "material", material_id, current_user, {"name": name})
     return None
 
 @app.delete("/api/services/{service_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -787,8 +1210,12 @@ async def delete_service(
             detail="Service not found"
         )
     
+    name = service.name
     db.delete(service)
+    record_deletion(db, "service", service_id)
     db.commit()
+    unindex_catalog_row("service", service_id)
+    audit_log.record("service.delete", "service", service_id, current_user, {"name": name})
     return None
 
 @app.post("/api/payments/process", response_model=PaymentResponse)
@@ -806,8 +1233,8 @@ async def process_payment(
                 detail="Payment amount must be greater than 0"
             )
         
-        # Generate unique payment ID
-        payment_id = f"pay_{int(datetime.utcnow().timestamp())}_{current_user.id}"
+        # Generate unique payment ID (random suffix: a user can pay twice in one second)
+        payment_id = f"pay_{int(datetime.utcnow().timestamp())}_{current_user.id}_{secrets.token_hex(4)}"
         
         try:
             # Create payment record
@@ -817,6 +1244,9 @@ async def process_payment(
                 currency=payment.currency,
                 status="pending",
                 user_id=current_user.id,
+                source_id=payment.source_id,
+                customer_id=payment.customer_id,
+                reference_id=payment.reference_id,
                 payment_data={
                     "source_id": payment.source_id,
                     "customer_id": payment.customer_id,
@@ -827,6 +1257,8 @@ async def process_payment(
             )
             
             db.add(db_payment)
+            db.flush()
+            record_payment_change(db, db_payment.created_at, payment.currency, payment.amount, None, "pending")
             db.commit()
             db.refresh(db_payment)
             
@@ -835,11 +1267,25 @@ async def process_payment(
             # Update payment record with new values
             db.query(Payment).filter(Payment.id == db_payment.id).update({
                 Payment.status: "completed",
-                Payment.receipt_url: f"https://receipts.example.com/{payment_id}",
+                Payment.receipt_url: f"{os.getenv('BACKEND_URL', '')}/api/payments/{payment_id}/receipt",
                 Payment.updated_at: datetime.utcnow()
             })
+            record_payment_change(db, db_payment.created_at, db_payment.currency, db_payment.amount, "pending", "completed")
+            # Follow-up work runs in the background, committed with the status change
+            enqueue(db, "payments.completed", {"payment_id": payment_id})
             db.commit()
             db.refresh(db_payment)
+            wake_job_worker()
+            payment_hub.publish(payment_id, {
+                "status": db_payment.status,
+                "updated_at": db_payment.updated_at.isoformat()
+            })
+            
+            audit_log.record("payment.process", "payment", payment_id, current_user, {
+                "amount": db_payment.amount,
+                "currency": db_payment.currency,
+                "status": db_payment.status
+            })
             
             logger.info(f"Payment processed successfully: {payment_id}")
             return db_payment
@@ -869,17 +1315,83 @@ async def process_payment(
             detail="An error occurred while processing the payment. Please try again later."
         )
 
+@app.get("/api/payments/lookup", response_model=List[PaymentResponse])
+async def lookup_payments(
+    reference_id: Optional[str] = None,
+    customer_id: Optional[str] = None,
+    source_id: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    fields: Optional[List[str]] = Depends(fieldset(PAYMENT_FIELDS)),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Find payments by processor identifiers; customers only see their own payments"""
+    filters = {"reference_id": reference_id, "customer_id": customer_id, "source_id": source_id}
+    filters = {field: value for field, value in filters.items() if value is not None}
+    if not filters:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={
+                "status": "error",
+                "message": "Invalid lookup",
+                "errors": ["Provide at least one of reference_id, customer_id or source_id"]
+            }
+        )
+    user_id = None if str(current_user.role) == "employee" else current_user.id
+    payments = find_payments(db, filters, user_id=user_id, limit=limit, columns=fields)
+    if fields:
+        return fieldset_response([project(row, fields) for row in payments])
+    return payments
+
+@app.post("/api/payments/reconcile")
+async def reconcile_payments(
+    request: PaymentReconcileRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Match processor statement lines to payments by reference_id (employee only)"""
+    _require_employee(current_user, "reconcile payments")
+    return reconcile(db, [item.model_dump() for item in request.items])
+
+@app.get("/api/payments/archive")
+async def get_payment_archive_stats(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Payments in the hot table and the archive, and how many are due to move (employee only)"""
+    _require_employee(current_user, "view the payment archive")
+    return archive_stats(db)
+
+@app.post("/api/payments/archive", status_code=status.HTTP_202_ACCEPTED)
+async def run_payment_archival(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Queue an archival run now instead of at the next interval (employee only)"""
+    _require_employee(current_user, "archive payments")
+    if PAYMENT_ARCHIVE_AFTER_DAYS <= 0:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={
+                "status": "error",
+                "message": "Payment archival is disabled",
+                "errors": ["Set PAYMENT_ARCHIVE_AFTER_DAYS above 0 to archive payments"]
+            }
+        )
+    job = tasks.queue_payment_archival(db)
+    db.commit()
+    wake_job_worker()
+    return {"job_id": job.id, "status": job.status}
+
 @app.get("/api/payments/{payment_id}", response_model=PaymentResponse)
 async def get_payment_status(
     payment_id: str,
+    fields: Optional[List[str]] = Depends(fieldset(PAYMENT_FIELDS)),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """Get payment status"""
-    payment = db.query(Payment).filter(
-        Payment.payment_id == payment_id,
-        Payment.user_id == current_user.id
-    ).first()
+    payment = find_payment(db, payment_id, user_id=current_user.id, columns=fields)
     
     if not payment:
         raise HTTPException(
@@ -887,8 +1399,102 @@ async def get_payment_status(
             detail="Payment not found"
         )
     
+    if fields:
+        return fieldset_response(project(payment, fields))
     return payment
 
+def _sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.get("/api/payments/{payment_id}/events")
+async def stream_payment_status(
+    payment_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Server-Sent Events stream of a payment's status until it completes or fails"""
+    # Subscribe before reading the status so a change in between is not missed
+    queue = payment_hub.subscribe(payment_id)
+    try:
+        payment = find_payment(db, payment_id, user_id=current_user.id)
+        if not payment:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Payment not found"
+            )
+        initial = {
+            "payment_id": payment_id,
+            "status": payment.status,
+            "updated_at": payment.updated_at.isoformat()
+        }
+    except BaseException:
+        payment_hub.unsubscribe(payment_id, queue)
+        raise
+    finally:
+        # Waiting must not hold a pool connection
+        db.close()
+    
+    async def event_stream():
+        yield "retry: 3000\n"
+        yield _sse_event("status", initial)
+        if initial["status"] in PAYMENT_TERMINAL_STATUSES:
+            return
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + SSE_MAX_STREAM_SECONDS
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                # Bound stream lifetime; EventSource reconnects on its own
+                yield _sse_event("timeout", {"payment_id": payment_id})
+                return
+            try:
+                message = await asyncio.wait_for(queue.get(), timeout=min(SSE_HEARTBEAT_SECONDS, remaining))
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            yield _sse_event("status", message)
+            if message.get("status") in PAYMENT_TERMINAL_STATUSES:
+                return
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Runs after the stream ends, including when the client disconnects
+        background=BackgroundTask(payment_hub.unsubscribe, payment_id, queue)
+    )
+
+@app.get("/api/payments/{payment_id}/receipt")
+async def get_payment_receipt(
+    payment_id: str,
+    format: str = "html",
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Download a payment receipt as HTML or PDF, rendered once and then served from cache"""
+    if format not in RECEIPT_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={
+                "status": "error",
+                "message": "Invalid receipt format",
+                "errors": [f"Format must be one of: {', '.join(RECEIPT_FORMATS)}"]
+            }
+        )
+    
+    payment = find_payment(db, payment_id, user_id=current_user.id)
+    
+    if not payment:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Payment not found"
+        )
+    
+    fields = receipt_fields(payment, current_user)
+    path, key = await receipt_cache.get_or_render(fields, format)
+    extension, media_type = RECEIPT_FORMATS[format]
+    return ReceiptFileResponse(path, key, media_type, f"receipt-{payment_id}.{extension}")
+
 @app.post("/api/payments/verify", response_model=PaymentResponse)
 async def verify_payment(
     verification: PaymentVerification,
@@ -896,10 +1502,7 @@ async def verify_payment(
     current_user: User = Depends(get_current_active_user)
 ):
     """Verify a payment"""
-    payment = db.query(Payment).filter(
-        Payment.payment_id == verification.payment_id,
-        Payment.user_id == current_user.id
-    ).first()
+    payment = find_payment(db, verification.payment_id, user_id=current_user.id)
     
     if not payment:
         raise HTTPException(
@@ -909,15 +1512,279 @@ async def verify_payment(
     
     # In a real application, verify the payment with the payment processor
     # For now, we'll simulate verification
-    db.query(Payment).filter(Payment.id == payment.id).update({
+    previous_status = payment.status
+    # Conditional on the status we read, so concurrent verifications count the change once
+    newly_completed = previous_status != "completed" and db.query(Payment).filter(
+        Payment.id == payment.id,
+        Payment.status == previous_status
+    ).update({
         Payment.status: "completed",
         Payment.updated_at: datetime.utcnow()
-    })
+    }, synchronize_session=False) == 1
+    if newly_completed:
+        record_payment_change(db, payment.created_at, payment.currency, payment.amount, previous_status, "completed")
+        enqueue(db, "payments.completed", {"payment_id": payment.payment_id})
     db.commit()
     db.refresh(payment)
+    audit_log.record("payment.verify", "payment", payment.payment_id, current_user, {
+        "previous_status": previous_status,
+        "status": payment.status,
+        "changed": newly_completed
+    })
+    if newly_completed:
+        wake_job_worker()
+        payment_hub.publish(str(payment.payment_id), {
+            "status": payment.status,
+            "updated_at": payment.updated_at.isoformat()
+        })
     
     return payment
 
+def _require_employee(current_user: User, action: str) -> None:
+    if str(current_user.role) != "employee":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail={
+                "status": "error",
+                "message": "Permission denied",
+                "errors": [f"Only employees can {action}. Please contact your administrator for access."]
+            }
+        )
+
+@app.get("/api/analytics/revenue")
+async def get_revenue_report(
+    start: date,
+    end: date,
+    status_filter: str = Query("completed", alias="status", description="Payment status, or 'all'"),
+    currency: Optional[str] = Query(None, description="Convert all amounts into this currency"),
+    group_by: str = Query("day", description="day, month or total"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Payment count, total and average per period from the daily rollups (employee only)"""
+    _require_employee(current_user, "view revenue analytics")
+    errors = []
+    if end < start:
+        errors.append("End date must not be before start date")
+    if status_filter != "all" and status_filter not in PAYMENT_STATUSES:
+        errors.append(f"Status must be 'all' or one of: {', '.join(PAYMENT_STATUSES)}")
+    if group_by not in REPORT_GROUPINGS:
+        errors.append(f"group_by must be one of: {', '.join(REPORT_GROUPINGS)}")
+    if errors:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={"status": "error", "message": "Invalid report parameters", "errors": errors}
+        )
+    try:
+        return revenue_report(
+            db,
+            start,
+            end,
+            status=None if status_filter == "all" else status_filter,
+            normalize_to=currency.upper() if currency else None,
+            group_by=group_by
+        )
+    except MissingExchangeRate as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={
+                "status": "error",
+                "message": "Missing exchange rate",
+                "errors": [f"Set an exchange rate for {code} before converting amounts" for code in e.currencies]
+            }
+        )
+
+@app.get("/api/inventory/report")
+async def get_inventory_report(
+    top: int = Query(10, ge=1, le=INVENTORY_REPORT_MAX_ITEMS, description="Number of most valuable SKUs"),
+    low_stock_threshold: int = Query(INVENTORY_LOW_STOCK_THRESHOLD, ge=0, description="Report SKUs with less stock than this"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Inventory valuation by unit, most valuable SKUs and low-stock SKUs (employee only)"""
+    _require_employee(current_user, "view the inventory report")
+    return inventory_report(db, top=top, threshold=low_stock_threshold)
+
+@app.get("/api/analytics/exchange-rates")
+async def list_exchange_rates(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """USD value of one unit of each currency used for normalization (employee only)"""
+    _require_employee(current_user, "view exchange rates")
+    return exchange_rates(db)
+
+@app.put("/api/analytics/exchange-rates/{currency}")
+async def update_exchange_rate(
+    currency: str,
+    rate: ExchangeRateUpdate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Set the USD value of one unit of a currency (employee only)"""
+    _require_employee(current_user, "update exchange rates")
+    currency = currency.upper()
+    if not CURRENCY_CODE.match(currency):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={
+                "status": "error",
+                "message": "Invalid currency",
+                "errors": ["Currency must be a three-letter ISO 4217 code, e.g. EUR"]
+            }
+        )
+    if currency == BASE_CURRENCY:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={
+                "status": "error",
+                "message": "Invalid currency",
+                "errors": [f"{BASE_CURRENCY} is the base currency; its rate is always 1"]
+            }
+        )
+    row = set_exchange_rate(db, currency, rate.rate_to_usd)
+    return {"currency": row.currency, "rate_to_usd": row.rate_to_usd, "updated_at": row.updated_at.isoformat()}
+
+@app.post("/api/profiles/token")
+async def create_profiling_token(
+    minutes: int = Query(10, ge=1, le=PROFILE_TOKEN_MAX_MINUTES, description="How long the token stays valid"),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Token that profiles every request sent with it in X-Profile-Token (employee only)"""
+    _require_employee(current_user, "profile requests")
+    token, expires_at = create_profile_token(current_user.username, minutes)
+    return {"token": token, "header": "X-Profile-Token", "expires_at": expires_at.isoformat()}
+
+@app.get("/api/profiles")
+async def list_profiles(current_user: User = Depends(get_current_active_user)):
+    """Stored request profiles, newest first (employee only)"""
+    _require_employee(current_user, "view request profiles")
+    return {"profiles": profile_store.list(), "max_files": profile_store.max_files}
+
+@app.get("/api/profiles/{profile_id}")
+async def get_profile(profile_id: str, current_user: User = Depends(get_current_active_user)):
+    """Download a request profile in speedscope format (employee only)"""
+    _require_employee(current_user, "view request profiles")
+    path = profile_store.profile_path(profile_id)
+    if path is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profile not found"
+        )
+    return FileResponse(path, media_type="application/json", filename=f"{profile_id}.speedscope.json")
+
+@app.get("/api/diagnostics/slow-queries")
+async def get_slow_queries(
+    limit: int = Query(20, ge=1, le=200, description="Number of query fingerprints to return"),
+    sort: str = Query("total", description="Rank fingerprints by total, max or count"),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Slowest statements seen by this worker, grouped by fingerprint (employee only)"""
+    _require_employee(current_user, "view slow queries")
+    if sort not in SLOW_QUERY_SORTS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={
+                "status": "error",
+                "message": "Invalid sort",
+                "errors": [f"Sort must be one of: {', '.join(SLOW_QUERY_SORTS)}"]
+            }
+        )
+    return slow_query_log.report(limit=limit, sort=sort)
+
+@app.get("/api/audit")
+async def get_audit_history(
+    action: Optional[str] = Query(None, description="e.g. material.create or payment.verify"),
+    object_type: Optional[str] = Query(None, description="material, service or payment"),
+    object_id: Optional[str] = None,
+    actor_id: Optional[int] = None,
+    before: Optional[int] = Query(None, description="next_before from the previous page"),
+    limit: int = Query(50, ge=1, le=500),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Audit events, newest first, paginated by event ID (employee only)"""
+    _require_employee(current_user, "view the audit log")
+    # Include this worker's buffered events; other workers flush within AUDIT_FLUSH_SECONDS
+    audit_log.flush()
+    return audit_history(
+        db, action=action, object_type=object_type, object_id=object_id,
+        actor_id=actor_id, before=before, limit=limit
+    )
+
+@app.get("/api/diagnostics/audit")
+async def get_audit_stats(
+    current_user: User = Depends(get_current_active_user)
+):
+    """Buffer and flush counters of this worker's audit log (employee only)"""
+    _require_employee(current_user, "view audit log statistics")
+    return audit_log.stats()
+
+@app.get("/api/diagnostics/catalog-snapshot")
+async def get_catalog_snapshot_stats(
+    current_user: User = Depends(get_current_active_user)
+):
+    """Version, size and hit counts of the shared catalog snapshot in this worker (employee only)"""
+    _require_employee(current_user, "view catalog snapshot statistics")
+    return catalog_snapshot.stats()
+
+@app.get("/api/diagnostics/autocomplete")
+async def get_autocomplete_stats(
+    current_user: User = Depends(get_current_active_user)
+):
+    """Size and memory use of this worker's autocomplete index (employee only)"""
+    _require_employee(current_user, "view autocomplete statistics")
+    return autocomplete_index.stats()
+
+@app.get("/api/jobs/stats")
+async def get_job_stats(
+    window_minutes: int = 60,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Background job queue depth and latency (employee only)"""
+    _require_employee(current_user, "view background jobs")
+    return queue_stats(db, window_minutes=max(1, min(window_minutes, 24 * 60)))
+
+@app.get("/api/jobs/dead")
+async def list_dead_jobs(
+    skip: int = 0,
+    limit: int = 50,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Dead-lettered background jobs, newest first (employee only)"""
+    _require_employee(current_user, "view background jobs")
+    jobs = db.query(Job).filter(Job.status == "dead").order_by(Job.finished_at.desc()).offset(skip).limit(min(limit, 500)).all()
+    return [
+        {
+            "id": job.id,
+            "task": job.task,
+            "payload": job.payload,
+            "attempts": job.attempts,
+            "created_at": job.created_at.isoformat(),
+            "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+            "last_error": job.last_error
+        }
+        for job in jobs
+    ]
+
+@app.post("/api/jobs/{job_id}/retry")
+async def retry_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Requeue a dead-lettered job (employee only)"""
+    _require_employee(current_user, "retry background jobs")
+    if not retry_dead_job(db, job_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Dead job not found"
+        )
+    wake_job_worker()
+    return {"status": "success", "message": f"Job {job_id} requeued"}
+
 
 
 @app.exception_handler(Exception)
@@ -0,0 +1,177 @@
+"""Admission control: per-route-class concurrency limits with bounded, deadline-aware queues.
+
+Without a limit, every request a worker accepts competes for the same database pool,
+and under overload all of them slow down until ``DB_POOL_TIMEOUT`` fails them. Here
+each route class (see ``routeClasses``) admits at most ``concurrency`` requests at a
+time. Up to ``queue`` more wait, first come first served, for at most
+``max_wait_ms``. A request is shed immediately with ``503`` when the queue is full
+or when the expected wait already exceeds the budget. The expected wait comes from
+the class's recent service times. Admitted requests therefore keep close to their
+normal latency, and the excess is rejected quickly so clients can retry elsewhere.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+from .routeClasses import classify_request, route_class_settings
+
+logger = logging.getLogger(__name__)
+
+ADMISSION_CONTROL_ENABLED = os.getenv("ADMISSION_CONTROL_ENABLED", "true").lower() == "true"
+ADMISSION_DEFAULTS: Dict[str, Dict[str, float]] = {
+    "auth":         {"concurrency": 4, "queue": 8,  "max_wait_ms": 2000.0},
+    "catalog_read": {"concurrency": 8, "queue": 16, "max_wait_ms": 500.0},
+    "write":        {"concurrency": 4, "queue": 8,  "max_wait_ms": 1000.0},
+    "payments":     {"concurrency": 4, "queue": 8,  "max_wait_ms": 2000.0},
+    "bulk":         {"concurrency": 1, "queue": 2,  "max_wait_ms": 5000.0},
+    "other":        {"concurrency": 4, "queue": 8,  "max_wait_ms": 1000.0},
+}
+RETRY_AFTER_SECONDS = 1
+# Weight of the newest sample in the moving average of service time
+SERVICE_TIME_SMOOTHING = 0.2
+
+class Overloaded(Exception):
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+class ConcurrencyLimiter:
+    """Counting semaphore with a bounded FIFO queue and a wait deadline"""
+
+    def __init__(self, name: str, concurrency: int, queue: int, max_wait_ms: float):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.queue_size = max(0, queue)
+        self.max_wait = max_wait_ms / 1000
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self.service_time = 0.0
+        self.admitted = 0
+        self.shed = 0
+        self.timed_out = 0
+
+    def expected_wait(self) -> float:
+        """Rough time until a newly queued request would be admitted"""
+        return (len(self._waiters) + 1) * self.service_time / self.concurrency
+
+    async def acquire(self) -> None:
+        if self.active < self.concurrency and not self._waiters:
+            self.active += 1
+            self.admitted += 1
+            return
+        if len(self._waiters) >= self.queue_size:
+            self.shed += 1
+            raise Overloaded("queue full")
+        if self.expected_wait() > self.max_wait:
+            self.shed += 1
+            raise Overloaded("expected wait exceeds budget")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as the wait expired; keep it
+                self.admitted += 1
+                return
+            waiter.cancel()
+            self.timed_out += 1
+            raise Overloaded("wait exceeded budget")
+        except asyncio.CancelledError:
+            # Client went away while queued; pass on a slot that was already handed over
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            else:
+                waiter.cancel()
+            raise
+        finally:
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                pass
+        self.admitted += 1
+
+    def release(self, service_time: Optional[float] = None) -> None:
+        if service_time is not None:
+            self.service_time += SERVICE_TIME_SMOOTHING * (service_time - self.service_time)
+        # Hand the slot straight to the oldest live waiter, so it cannot be overtaken
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "concurrency": self.concurrency,
+            "active": self.active,
+            "queued": len(self._waiters),
+            "queue_size": self.queue_size,
+            "max_wait_ms": round(self.max_wait * 1000),
+            "service_time_ms": round(self.service_time * 1000, 2),
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "timed_out": self.timed_out,
+        }
+
+limiters: Dict[str, ConcurrencyLimiter] = {
+    name: ConcurrencyLimiter(name, int(settings["concurrency"]), int(settings["queue"]), settings["max_wait_ms"])
+    for name, settings in route_class_settings("admission", ADMISSION_DEFAULTS).items()
+}
+
+def admission_stats() -> Dict[str, Any]:
+    return {
+        "enabled": ADMISSION_CONTROL_ENABLED,
+        "classes": {name: limiter.stats() for name, limiter in limiters.items()},
+    }
+
+class AdmissionControlMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ADMISSION_CONTROL_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        route_class = classify_request(scope["method"], scope["path"])
+        if route_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        limiter = limiters[route_class]
+        try:
+            await limiter.acquire()
+        except Overloaded as e:
+            logger.warning(f"Shed {scope['method']} {scope['path']} ({route_class}): {e.reason}")
+            await _send_overloaded(send, route_class)
+            return
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release(time.perf_counter() - start)
+
+async def _send_overloaded(send, route_class: str) -> None:
+    body = json.dumps({
+        "status": "error",
+        "message": "Service overloaded",
+        "errors": ["The server is too busy to handle this request right now. Please retry shortly."],
+        "route_class": route_class,
+    }).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": 503,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode("ascii")),
+            (b"retry-after", str(RETRY_AFTER_SECONDS).encode("ascii")),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
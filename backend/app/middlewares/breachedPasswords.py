@@ -0,0 +1,164 @@
+"""Offline breached-password check backed by a memory-mapped Bloom filter.
+
+Build the filter once from a password list (one password per line):
+
+    python -m app.middlewares.breachedPasswords build passwords.txt data/breached.bloom --fp-rate 0.001
+
+and point ``BREACHED_PASSWORDS_FILTER`` at the output file. The file is opened with
+``mmap`` so every gunicorn worker shares the same page-cached copy, and no network
+access is ever needed. When the variable is unset the check is skipped.
+"""
+import argparse
+import hashlib
+import logging
+import math
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+from typing import Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+BREACHED_PASSWORDS_FILTER = os.getenv("BREACHED_PASSWORDS_FILTER", "")
+BREACHED_PASSWORDS_FP_RATE = float(os.getenv("BREACHED_PASSWORDS_FP_RATE", "0.001"))
+
+MAGIC = b"FCBLOOM1"
+# magic, number of bits, number of hash functions, items inserted, target false-positive rate
+HEADER = struct.Struct("<8sQIQd")
+HEADER_SIZE = 64
+
+def _hash_pair(password: bytes):
+    digest = hashlib.blake2b(password, digest_size=16).digest()
+    # Double hashing (Kirsch-Mitzenmacher): k positions from two 64-bit halves
+    return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+
+def optimal_parameters(item_count: int, fp_rate: float):
+    """Bit count and hash count that reach ``fp_rate`` for ``item_count`` items"""
+    if not 0 < fp_rate < 1:
+        raise ValueError("False-positive rate must be between 0 and 1")
+    item_count = max(item_count, 1)
+    num_bits = max(8, math.ceil(-item_count * math.log(fp_rate) / (math.log(2) ** 2)))
+    num_hashes = max(1, round(num_bits / item_count * math.log(2)))
+    return num_bits, num_hashes
+
+class BloomFilter:
+    """Read-only view of a filter file; lookups touch at most ``num_hashes`` bytes"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size < HEADER_SIZE:
+                raise ValueError(f"{path} is too short to be a breached-password filter")
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.num_bits, self.num_hashes, self.item_count, self.fp_rate = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a breached-password filter")
+        if len(self._mmap) < HEADER_SIZE + (self.num_bits + 7) // 8:
+            self._mmap.close()
+            raise ValueError(f"{path} is truncated")
+
+    def __contains__(self, password: str) -> bool:
+        bits = self._mmap
+        num_bits = self.num_bits
+        h1, h2 = _hash_pair(password.encode("utf-8"))
+        for i in range(self.num_hashes):
+            position = (h1 + i * h2) % num_bits
+            if not bits[HEADER_SIZE + (position >> 3)] & (1 << (position & 7)):
+                return False
+        return True
+
+    def close(self) -> None:
+        self._mmap.close()
+
+def _read_passwords(path: str) -> Iterator[bytes]:
+    # Work on raw bytes: public lists mix encodings and must not fail on bad UTF-8
+    with open(path, "rb") as f:
+        for line in f:
+            password = line.rstrip(b"\r\n")
+            if password:
+                yield password
+
+def build_filter(source_path: str, output_path: str, fp_rate: float = BREACHED_PASSWORDS_FP_RATE) -> int:
+    """Build a filter file from a password list and return the number of passwords added"""
+    item_count = sum(1 for _ in _read_passwords(source_path))
+    num_bits, num_hashes = optimal_parameters(item_count, fp_rate)
+    bits = bytearray((num_bits + 7) // 8)
+    for password in _read_passwords(source_path):
+        h1, h2 = _hash_pair(password)
+        for i in range(num_hashes):
+            position = (h1 + i * h2) % num_bits
+            bits[position >> 3] |= 1 << (position & 7)
+
+    # Write next to the target and rename so running workers never map a partial file
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+    os.makedirs(output_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=output_dir, prefix=".bloom-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(HEADER.pack(MAGIC, num_bits, num_hashes, item_count, fp_rate).ljust(HEADER_SIZE, b"\0"))
+            f.write(bits)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return item_count
+
+_filter: Optional[BloomFilter] = None
+_filter_loaded = False
+_filter_lock = threading.Lock()
+
+def get_breached_password_filter() -> Optional[BloomFilter]:
+    """Open the configured filter once per process; None when the check is disabled"""
+    global _filter, _filter_loaded
+    if _filter_loaded:
+        return _filter
+    with _filter_lock:
+        if not _filter_loaded:
+            if BREACHED_PASSWORDS_FILTER:
+                try:
+                    _filter = BloomFilter(BREACHED_PASSWORDS_FILTER)
+                    logger.info(
+                        f"Loaded breached-password filter {BREACHED_PASSWORDS_FILTER} "
+                        f"({_filter.item_count} passwords, fp rate {_filter.fp_rate})"
+                    )
+                except (OSError, ValueError) as e:
+                    logger.error(f"Breached-password check disabled: {str(e)}")
+            _filter_loaded = True
+    return _filter
+
+def is_breached_password(password: str) -> bool:
+    bloom = get_breached_password_filter()
+    return bloom is not None and password in bloom
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Build or query the offline breached-password filter")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="Build a filter from a password list")
+    build.add_argument("source", help="Password list, one password per line")
+    build.add_argument("output", help="Filter file to write")
+    build.add_argument("--fp-rate", type=float, default=BREACHED_PASSWORDS_FP_RATE,
+                       help=f"Target false-positive rate (default: {BREACHED_PASSWORDS_FP_RATE})")
+
+    check = commands.add_parser("check", help="Check passwords against a filter")
+    check.add_argument("filter", help="Filter file to read")
+    check.add_argument("passwords", nargs="+")
+
+    args = parser.parse_args(argv)
+    if args.command == "build":
+        count = build_filter(args.source, args.output, args.fp_rate)
+        size = os.path.getsize(args.output)
+        print(f"Wrote {args.output}: {count} passwords, {size} bytes, fp rate {args.fp_rate}")
+        return 0
+
+    bloom = BloomFilter(args.filter)
+    for password in args.passwords:
+        print(f"{password}: {'breached' if password in bloom else 'not found'}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,236 @@
+"""Per-route-class request deadlines, enforced inside the database.
+
+``DeadlineMiddleware`` gives each request a deadline from its route class (see
+``routeClasses``). The engine hooks installed by ``install_deadline_hooks``
+carry the remaining budget into every statement the request runs:
+
+* PostgreSQL: ``SET LOCAL statement_timeout``, so the server cancels a slow query
+  or a lock wait itself. It is sent again only once the remaining budget has shrunk
+  by more than ``STATEMENT_TIMEOUT_SLACK_MS`` since the last one in the transaction,
+  so most statements cost no extra round trip;
+* SQLite: a progress handler that interrupts the running statement once the
+  deadline has passed.
+
+A statement that starts after the deadline is refused before it reaches the
+database. When the client disconnects, the request's remaining statements are
+refused and, on SQLite, the running one is interrupted. If a request fails because
+its deadline expired, whatever error response the handler produced is replaced with
+a consistent ``504`` response.
+
+Handlers call the database synchronously on the event loop, so a disconnect is
+noticed between statements; the statement timeout is what bounds a single slow
+query.
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+
+from .routeClasses import classify_request, route_class_settings
+
+logger = logging.getLogger(__name__)
+
+REQUEST_DEADLINES_ENABLED = os.getenv("REQUEST_DEADLINES_ENABLED", "true").lower() == "true"
+DEADLINE_DEFAULTS = {
+    "auth":         {"ms": 5000},
+    "catalog_read": {"ms": 3000},
+    "write":        {"ms": 5000},
+    "payments":     {"ms": 10000},
+    # A full batch of BULK_PROVISION_MAX_USERS hashes at the strongest tuned cost
+    "bulk":         {"ms": 600000},
+    "other":        {"ms": 10000},
+}
+DEADLINES_MS = {
+    route_class: settings["ms"]
+    for route_class, settings in route_class_settings("deadline", DEADLINE_DEFAULTS).items()
+}
+# SQLite calls the progress handler every this many virtual machine instructions
+SQLITE_PROGRESS_INTERVAL = 1000
+POSTGRES_QUERY_CANCELED = "57014"
+# A statement may run this much past its deadline in exchange for reusing the timeout already set
+STATEMENT_TIMEOUT_SLACK_MS = 250
+# Connection info key of the (request deadline, ms) last sent with SET LOCAL in this transaction
+_TIMEOUT_SET = "deadline_statement_timeout"
+
+class DeadlineExceeded(Exception):
+    """A statement was refused because its request ran out of time or was abandoned"""
+
+class RequestDeadline:
+    __slots__ = ("route_class", "budget_ms", "deadline", "expired", "disconnected")
+
+    def __init__(self, route_class: str, budget_ms: int):
+        self.route_class = route_class
+        self.budget_ms = budget_ms
+        self.deadline = time.monotonic() + budget_ms / 1000
+        self.expired = False
+        self.disconnected = False
+
+    def remaining(self) -> float:
+        return self.deadline - time.monotonic()
+
+    def check(self) -> float:
+        """Remaining seconds; raises once the deadline passed or the client left"""
+        if self.disconnected:
+            raise DeadlineExceeded("Client disconnected")
+        remaining = self.remaining()
+        if remaining <= 0:
+            self.expired = True
+            raise DeadlineExceeded(f"Deadline of {self.budget_ms}ms exceeded")
+        return remaining
+
+_current: ContextVar[Optional[RequestDeadline]] = ContextVar("request_deadline", default=None)
+
+def current_deadline() -> Optional[RequestDeadline]:
+    return _current.get()
+
+def _sqlite_progress() -> int:
+    state = _current.get()
+    if state is None:
+        return 0
+    if state.disconnected:
+        return 1
+    if state.remaining() <= 0:
+        state.expired = True
+        return 1
+    return 0
+
+def _statement_timeout_ms(info: dict, state: RequestDeadline, remaining: float) -> Optional[int]:
+    """Timeout to send before the next statement, or None if the one set earlier in the
+    transaction is still within ``STATEMENT_TIMEOUT_SLACK_MS`` of the remaining budget"""
+    timeout_ms = max(1, int(remaining * 1000))
+    last = info.get(_TIMEOUT_SET)
+    if last is not None and last[0] is state and last[1] - timeout_ms <= STATEMENT_TIMEOUT_SLACK_MS:
+        return None
+    info[_TIMEOUT_SET] = (state, timeout_ms)
+    return timeout_ms
+
+def install_deadline_hooks(engine) -> None:
+    """Propagate request deadlines into statements run on ``engine``"""
+    dialect = engine.dialect.name
+
+    if dialect == "sqlite":
+        @event.listens_for(engine, "connect")
+        def set_progress_handler(dbapi_connection, connection_record):
+            if isinstance(dbapi_connection, sqlite3.Connection):
+                dbapi_connection.set_progress_handler(_sqlite_progress, SQLITE_PROGRESS_INTERVAL)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def apply_deadline(conn, cursor, statement, parameters, context, executemany):
+        state = _current.get()
+        if state is None:
+            return
+        remaining = state.check()
+        if dialect == "postgresql":
+            timeout_ms = _statement_timeout_ms(conn.info, state, remaining)
+            if timeout_ms is not None:
+                cursor.execute(f"SET LOCAL statement_timeout = {timeout_ms}")
+
+    if dialect == "postgresql":
+        # SET LOCAL ends with the transaction, or with a savepoint rolled back after it
+        def forget_timeout(conn, *args):
+            conn.info.pop(_TIMEOUT_SET, None)
+
+        for name in ("commit", "rollback", "rollback_savepoint"):
+            event.listen(engine, name, forget_timeout)
+
+        @event.listens_for(engine, "checkin")
+        def forget_timeout_on_checkin(dbapi_connection, connection_record):
+            # The pool rolls back whatever the connection left open
+            connection_record.info.pop(_TIMEOUT_SET, None)
+
+    @event.listens_for(engine, "handle_error")
+    def record_timeout(context):
+        state = _current.get()
+        if state is None:
+            return
+        original = context.original_exception
+        if getattr(original, "pgcode", None) == POSTGRES_QUERY_CANCELED or state.remaining() <= 0:
+            state.expired = True
+
+class DeadlineMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not REQUEST_DEADLINES_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        route_class = classify_request(scope["method"], scope["path"])
+        if route_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        state = RequestDeadline(route_class, DEADLINES_MS[route_class])
+        token = _current.set(state)
+        # Read the client's messages from a separate task, so a disconnect is seen even
+        # while the handler is not reading; the handler gets the same messages in order
+        messages: asyncio.Queue = asyncio.Queue()
+        response_started = False
+        response_complete = False
+        replaced = False
+
+        async def pump():
+            while True:
+                message = await receive()
+                await messages.put(message)
+                if message["type"] == "http.disconnect":
+                    # Servers also report a disconnect once the response has been sent
+                    state.disconnected = not response_complete
+                    return
+
+        pump_task = asyncio.create_task(pump())
+
+        async def send_wrapper(message):
+            nonlocal response_started, response_complete, replaced
+            if replaced:
+                return
+            if message["type"] == "http.response.start":
+                # Handlers and dependencies turn database errors into assorted 4xx/5xx
+                # responses; once the deadline tripped, none of them is meaningful
+                if state.expired and message["status"] >= 400:
+                    replaced = True
+                    await _send_timeout(send, state)
+                    return
+                response_started = True
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                response_complete = True
+            await send(message)
+
+        try:
+            await self.app(scope, messages.get, send_wrapper)
+        except Exception:
+            if not state.expired or response_started:
+                raise
+            if not replaced:
+                replaced = True
+                await _send_timeout(send, state)
+        finally:
+            pump_task.cancel()
+            _current.reset(token)
+            if state.expired:
+                logger.warning(f"{scope['method']} {scope['path']} ({route_class}) exceeded its {state.budget_ms}ms deadline")
+            elif state.disconnected:
+                logger.info(f"{scope['method']} {scope['path']} abandoned by the client")
+
+async def _send_timeout(send, state: RequestDeadline) -> None:
+    body = json.dumps({
+        "status": "error",
+        "message": "Request timed out",
+        "errors": [f"The request did not complete within {state.budget_ms}ms. Please retry or narrow the request."],
+        "route_class": state.route_class,
+    }).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": 504,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode("ascii")),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
@@ -1,6 +1,8 @@
 from fastapi import HTTPException, Request
 from typing import List
 
+from .breachedPasswords import is_breached_password
+
 SPECIAL_CHARS = "!@#$%^&*(),.?\":{}|<>"
 
 def validate_password(password: str) -> List[str]:
@@ -38,6 +40,9 @@ def validate_password(password: str) -> List[str]:
     if password.isdigit():
         errors.append('Password cannot consist of only numbers - mix in letters and special characters')
     
+    if is_breached_password(password):
+        errors.append('Password has appeared in a known data breach - please choose a different password')
+    
     return errors
 
 async def passwordValidation(request: Request):
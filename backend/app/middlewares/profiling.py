@@ -0,0 +1,294 @@
+"""On-demand statistical profiling of single requests.
+
+A request is profiled when it carries a valid ``X-Profile-Token`` (a short-lived
+token employees get from ``POST /api/profiles/token``) or, with
+``PROFILE_SAMPLE_RATE`` above zero, when it is picked at random. While it runs, a
+sampler thread records the event loop thread's Python stack every
+``PROFILE_INTERVAL_MS``, keeping only samples taken while the request's own task was
+running, so concurrent requests on the same worker do not leak into its profile.
+That covers the handler, dependencies, Pydantic validation and the exception
+handlers; work handed to the thread pool (sync dependencies) is not sampled.
+
+Profiles are written in speedscope's format (open them at https://www.speedscope.app)
+to ``PROFILE_DIR``, which keeps at most ``PROFILE_MAX_FILES`` profiles. The response
+of a profiled request carries ``X-Profile-ID``.
+
+Requests that are not profiled only pay for a header lookup; with
+``PROFILING_ENABLED=false`` the middleware is not installed at all.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import secrets
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from jose import jwt
+from jose.exceptions import JWTError
+
+from ..auth import ALGORITHM, SECRET_KEY
+from .requestLogging import get_request_id
+from .routeClasses import classify_request
+
+logger = logging.getLogger(__name__)
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "true").lower() == "true"
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "1"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/flooring-crm-profiles")
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "50"))
+# Requests profiled at once per worker; further requests run unprofiled
+PROFILE_MAX_CONCURRENT = int(os.getenv("PROFILE_MAX_CONCURRENT", "2"))
+# Sampling stops after this many samples, which bounds the size of one profile
+PROFILE_MAX_SAMPLES = int(os.getenv("PROFILE_MAX_SAMPLES", "50000"))
+PROFILE_TOKEN_MAX_MINUTES = 60
+PROFILE_TOKEN_HEADER = b"x-profile-token"
+PROFILE_ID_HEADER = b"x-profile-id"
+PROFILE_TOKEN_SCOPE = "profile"
+MAX_STACK_DEPTH = 256
+
+_VALID_PROFILE_ID = re.compile(r"^[0-9]{13}-[0-9a-f]{8}$")
+
+def create_profile_token(username: str, minutes: int) -> Tuple[str, datetime]:
+    """Token that makes requests carrying it in ``X-Profile-Token`` get profiled"""
+    expires_at = datetime.utcnow() + timedelta(minutes=minutes)
+    token = jwt.encode(
+        {"sub": username, "scope": PROFILE_TOKEN_SCOPE, "exp": expires_at},
+        SECRET_KEY,
+        algorithm=ALGORITHM,
+    )
+    return token, expires_at
+
+def _verify_profile_token(token: bytes) -> Optional[str]:
+    try:
+        payload = jwt.decode(token.decode("ascii"), SECRET_KEY, algorithms=[ALGORITHM])
+    except (JWTError, UnicodeDecodeError):
+        return None
+    if payload.get("scope") != PROFILE_TOKEN_SCOPE:
+        return None
+    return payload.get("sub")
+
+class ProfileStore:
+    """Directory of speedscope profiles, each with a small metadata file, oldest evicted first"""
+
+    def __init__(self, directory: str, max_files: int):
+        self.directory = directory
+        self.max_files = max(1, max_files)
+
+    def _path(self, profile_id: str, suffix: str) -> str:
+        return os.path.join(self.directory, f"{profile_id}.{suffix}.json")
+
+    def profile_path(self, profile_id: str) -> Optional[str]:
+        if not _VALID_PROFILE_ID.match(profile_id):
+            return None
+        path = self._path(profile_id, "speedscope")
+        return path if os.path.exists(path) else None
+
+    def _write(self, path: str, document: Dict[str, Any]) -> None:
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(document, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    def save(self, profile_id: str, profile: Dict[str, Any], meta: Dict[str, Any]) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        self._write(self._path(profile_id, "speedscope"), profile)
+        # Written last: a profile is listed only once both files are complete
+        self._write(self._path(profile_id, "meta"), meta)
+        self.prune()
+
+    def _ids(self) -> List[str]:
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        # Profile IDs start with a millisecond timestamp, so they sort oldest first
+        return sorted(name[:-len(".meta.json")] for name in names if name.endswith(".meta.json"))
+
+    def prune(self) -> int:
+        ids = self._ids()
+        removed = 0
+        for profile_id in ids[:max(0, len(ids) - self.max_files)]:
+            for suffix in ("meta", "speedscope"):
+                try:
+                    os.remove(self._path(profile_id, suffix))
+                except FileNotFoundError:
+                    pass
+            removed += 1
+        return removed
+
+    def list(self) -> List[Dict[str, Any]]:
+        profiles = []
+        for profile_id in reversed(self._ids()):
+            try:
+                with open(self._path(profile_id, "meta")) as f:
+                    profiles.append(json.load(f))
+            except (FileNotFoundError, ValueError):
+                # Evicted by another worker while listing
+                continue
+        return profiles
+
+profile_store = ProfileStore(PROFILE_DIR, PROFILE_MAX_FILES)
+
+class RequestSampler(threading.Thread):
+    """Samples the event loop thread's stack while a given task is the one running"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, task: asyncio.Task, interval: float):
+        super().__init__(name="request-profiler", daemon=True)
+        self.loop = loop
+        self.task = task
+        self.interval = interval
+        self.target_thread = threading.get_ident()
+        self.frames: Dict[Tuple[str, str, int], int] = {}
+        self.samples: List[List[int]] = []
+        self.weights: List[float] = []
+        self._stop_event = threading.Event()
+
+    def _stack(self, frame) -> List[int]:
+        stack = []
+        while frame is not None and len(stack) < MAX_STACK_DEPTH:
+            code = frame.f_code
+            key = (getattr(code, "co_qualname", code.co_name), code.co_filename, code.co_firstlineno)
+            index = self.frames.get(key)
+            if index is None:
+                index = self.frames[key] = len(self.frames)
+            stack.append(index)
+            frame = frame.f_back
+        stack.reverse()
+        return stack
+
+    def run(self) -> None:
+        last = time.perf_counter()
+        while not self._stop_event.wait(self.interval):
+            now = time.perf_counter()
+            elapsed, last = now - last, now
+            # Other requests' tasks share the loop thread; their time is not this request's
+            if asyncio.current_task(self.loop) is not self.task:
+                continue
+            frame = sys._current_frames().get(self.target_thread)
+            # Stopping happens on the loop thread too; don't record the stop itself
+            if frame is None or self._stop_event.is_set():
+                continue
+            self.samples.append(self._stack(frame))
+            self.weights.append(elapsed * 1000)
+            if len(self.samples) >= PROFILE_MAX_SAMPLES:
+                return
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join()
+
+    def speedscope(self, name: str, duration_ms: float) -> Dict[str, Any]:
+        frames = [{"name": key[0], "file": key[1], "line": key[2]} for key in self.frames]
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "flooring-crm",
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": round(duration_ms, 3),
+                "samples": self.samples,
+                "weights": [round(weight, 3) for weight in self.weights],
+            }],
+        }
+
+_active_profiles = 0
+_saved_switch_interval: Optional[float] = None
+
+def _begin_profile(interval: float) -> None:
+    global _active_profiles, _saved_switch_interval
+    if _active_profiles == 0:
+        # The sampler can only run when the loop thread gives up the GIL, which by
+        # default happens every 5ms; switch more often while a profile is running
+        _saved_switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(_saved_switch_interval, interval))
+    _active_profiles += 1
+
+def _end_profile() -> None:
+    global _active_profiles
+    _active_profiles -= 1
+    if _active_profiles == 0 and _saved_switch_interval is not None:
+        sys.setswitchinterval(_saved_switch_interval)
+
+class ProfilingMiddleware:
+    def __init__(self, app, store: ProfileStore = profile_store):
+        self.app = app
+        self.store = store
+
+    def _trigger(self, scope) -> Optional[Tuple[str, Optional[str]]]:
+        for name, value in scope["headers"]:
+            if name == PROFILE_TOKEN_HEADER:
+                requested_by = _verify_profile_token(value)
+                if requested_by is None:
+                    logger.warning(f"Ignoring invalid profile token on {scope['method']} {scope['path']}")
+                    return None
+                return "token", requested_by
+        if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+            # Long-lived streams and probes are never sampled
+            if classify_request(scope["method"], scope["path"]) is not None:
+                return "sampled", None
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        trigger = self._trigger(scope)
+        if trigger is None or _active_profiles >= PROFILE_MAX_CONCURRENT:
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = f"{int(time.time() * 1000):013d}-{secrets.token_hex(4)}"
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message = {**message, "headers": [*message.get("headers", ()), (PROFILE_ID_HEADER, profile_id.encode("ascii"))]}
+            await send(message)
+
+        interval = PROFILE_INTERVAL_MS / 1000
+        sampler = RequestSampler(asyncio.get_running_loop(), asyncio.current_task(), interval)
+        _begin_profile(interval)
+        started_at = datetime.utcnow()
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampler.stop()
+            _end_profile()
+            duration_ms = (time.perf_counter() - start) * 1000
+            name = f"{scope['method']} {scope['path']}"
+            meta = {
+                "id": profile_id,
+                "method": scope["method"],
+                "path": scope["path"],
+                "status_code": status_code,
+                "duration_ms": round(duration_ms, 2),
+                "sampled_ms": round(sum(sampler.weights), 2),
+                "samples": len(sampler.samples),
+                "trigger": trigger[0],
+                "requested_by": trigger[1],
+                "request_id": get_request_id(),
+                "created_at": started_at.isoformat(),
+            }
+            try:
+                await asyncio.get_running_loop().run_in_executor(
+                    None, self.store.save, profile_id, sampler.speedscope(name, duration_ms), meta
+                )
+                logger.info(f"Profiled {name} ({duration_ms:.1f}ms, {len(sampler.samples)} samples) as {profile_id}")
+            except OSError as e:
+                logger.error(f"Could not store profile {profile_id}: {str(e)}")
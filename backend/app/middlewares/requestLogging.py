@@ -0,0 +1,85 @@
+"""Request IDs, timing and access logging as a plain ASGI middleware.
+
+Unlike ``@app.middleware("http")`` (Starlette's ``BaseHTTPMiddleware``), this never
+wraps the response in a new task or stream: messages pass straight through to the
+server, so streaming responses (receipts, payment status events) are not buffered.
+"""
+import logging
+import re
+import secrets
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+REQUEST_ID_HEADER = b"x-request-id"
+# Accept a caller-supplied ID only if it is short and safe to put in logs and headers
+_VALID_REQUEST_ID = re.compile(rb"^[A-Za-z0-9._:-]{1,128}$")
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+request_scope_var: ContextVar[Optional[dict]] = ContextVar("request_scope", default=None)
+
+def get_request_id() -> Optional[str]:
+    """ID of the request being handled, or None outside a request"""
+    return request_id_var.get()
+
+def get_request_route() -> Optional[str]:
+    """Method and route template of the request being handled, e.g. ``GET /api/materials/{material_id}``.
+
+    Falls back to the raw path before routing has matched, and is None outside a request.
+    """
+    scope = request_scope_var.get()
+    if scope is None:
+        return None
+    route = scope.get("route")
+    return f"{scope['method']} {getattr(route, 'path', scope['path'])}"
+
+class RequestContextMiddleware:
+    """Assigns a request ID, echoes it in ``X-Request-ID`` and logs one line per request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter_ns()
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == REQUEST_ID_HEADER:
+                if _VALID_REQUEST_ID.match(value):
+                    request_id = value.decode("ascii")
+                break
+        if request_id is None:
+            request_id = secrets.token_hex(8)
+        token = request_id_var.set(request_id)
+        # The router adds the matched route to this same scope dict
+        scope_token = request_scope_var.set(scope)
+        scope.setdefault("state", {})["request_id"] = request_id
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = list(message.get("headers", ()))
+                headers.append((REQUEST_ID_HEADER, request_id.encode("ascii")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = (time.perf_counter_ns() - start) / 1_000_000
+            logger.info(
+                f"Path: {scope['path']} "
+                f"Method: {scope['method']} "
+                f"Status: {status_code} "
+                f"Duration: {duration:.2f}ms "
+                f"Request-ID: {request_id}"
+            )
+            request_id_var.reset(token)
+            request_scope_var.reset(scope_token)
@@ -0,0 +1,47 @@
+"""Route classes shared by admission control and request deadlines.
+
+Requests are grouped by the resources they compete for rather than by endpoint, so
+limits and budgets can be set per group: password hashing for ``auth``, cheap
+indexed reads for ``catalog_read``, row locks and fsyncs for ``write``, the
+payment flow, which must stay available when everything else is saturated, and
+``bulk`` user provisioning, which hashes a password per account and so runs for
+minutes rather than seconds.
+"""
+import os
+from typing import Dict, Optional
+
+ROUTE_CLASSES = ("auth", "catalog_read", "write", "payments", "bulk", "other")
+
+# Probes, docs and long-lived streams are never limited or timed out
+EXEMPT_PATHS = frozenset(("/", "/livez", "/readyz", "/healthz", "/health", "/docs", "/redoc", "/openapi.json"))
+CATALOG_PREFIXES = ("/api/materials", "/api/services", "/api/catalog", "/api/inventory")
+READ_METHODS = frozenset(("GET", "HEAD"))
+BULK_PATHS = frozenset(("/api/users/bulk",))
+
+def classify_request(method: str, path: str) -> Optional[str]:
+    """Route class of a request, or None when it is exempt"""
+    if method == "OPTIONS" or path in EXEMPT_PATHS:
+        return None
+    if path.startswith("/api/payments/"):
+        if path.endswith("/events"):
+            return None
+        return "payments"
+    if path.startswith("/api/auth/"):
+        return "auth"
+    if path in BULK_PATHS and method == "POST":
+        return "bulk"
+    if method in READ_METHODS:
+        if path.startswith(CATALOG_PREFIXES):
+            return "catalog_read"
+        return "other"
+    return "write"
+
+def route_class_settings(name: str, defaults: Dict[str, Dict[str, float]]) -> Dict[str, Dict[str, float]]:
+    """Per-class settings from ``<NAME>_<CLASS>`` environment variables, e.g. ``ADMISSION_CONCURRENCY_AUTH``"""
+    settings: Dict[str, Dict[str, float]] = {}
+    for route_class in ROUTE_CLASSES:
+        settings[route_class] = {}
+        for key, default in defaults[route_class].items():
+            variable = f"{name}_{key}_{route_class}".upper()
+            settings[route_class][key] = type(default)(os.getenv(variable, str(default)))
+    return settings
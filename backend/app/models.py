@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Float, Text, Boolean, DateTime, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, Float, Text, Boolean, Date, DateTime, ForeignKey, JSON, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from .database import Base
 
@@ -17,6 +17,7 @@ class User(Base):
 
     # Relationships
     payments = relationship("Payment", back_populates="user", cascade="all, delete-orphan")
+    refresh_tokens = relationship("RefreshToken", back_populates="user", cascade="all, delete-orphan")
 
 class Material(Base):
     __tablename__ = "materials"
@@ -26,7 +27,16 @@ class Material(Base):
     description = Column(Text)
     price_per_unit = Column(Float)
     unit = Column(String)
-    stock = Column(Integer)
+    stock = Column(Integer, index=True)  # low-stock report
+    updated_at = Column(DateTime, nullable=True, default=datetime.utcnow, onupdate=datetime.utcnow)
+    change_seq = Column(Integer, nullable=True, index=True)  # catalog sequence of the last write
+
+    __table_args__ = (
+        # Catalog filters and sorts (see app.facets); the first two also cover the facet counts
+        Index("ix_materials_unit_price_stock", "unit", "price_per_unit", "stock"),
+        Index("ix_materials_unit_stock_price", "unit", "stock", "price_per_unit"),
+        Index("ix_materials_price", "price_per_unit"),
+    )
 
 class Service(Base):
     __tablename__ = "services"
@@ -35,6 +45,26 @@ class Service(Base):
     name = Column(String, index=True)
     description = Column(Text)
     base_price = Column(Float)
+    updated_at = Column(DateTime, nullable=True, default=datetime.utcnow, onupdate=datetime.utcnow)
+    change_seq = Column(Integer, nullable=True, index=True)  # catalog sequence of the last write
+
+class CatalogSequence(Base):
+    """Single-row counter behind the catalog change sequence"""
+    __tablename__ = "catalog_sequence"
+
+    id = Column(Integer, primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+    tombstone_horizon = Column(Integer, nullable=False, default=0)  # highest sequence of a purged tombstone
+    epoch = Column(String(16), nullable=True)  # random per database, so a recreated database never matches old state
+
+class CatalogTombstone(Base):
+    __tablename__ = "catalog_tombstones"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False)  # material or service
+    object_id = Column(Integer, nullable=False)
+    change_seq = Column(Integer, nullable=False, index=True)
+    deleted_at = Column(DateTime, nullable=False, default=datetime.utcnow)
 
 class Payment(Base):
     __tablename__ = "payments"
@@ -49,11 +79,121 @@ class Payment(Base):
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     receipt_url = Column(String, nullable=True)
     payment_data = Column(JSON, nullable=True)
+    # Copied out of payment_data so reconciliation can use indexes
+    source_id = Column(String, nullable=True, index=True)
+    customer_id = Column(String, nullable=True, index=True)
+    reference_id = Column(String, nullable=True, index=True)
 
     # Relationships
     user = relationship("User", back_populates="payments", passive_deletes=True)
 
+    __table_args__ = (
+        # Archival picks old completed payments in batches (see app.archive)
+        Index("ix_payments_status_created_at", "status", "created_at"),
+    )
+
     def __init__(self, **kwargs):
         if 'status' in kwargs and kwargs['status'] not in ['pending', 'completed', 'failed']:
             raise ValueError("Status must be one of: pending, completed, failed")
         super().__init__(**kwargs)
+
+class ArchivedPayment(Base):
+    """Completed payments moved out of ``payments`` once they are old, with the same columns"""
+    __tablename__ = "payments_archive"
+
+    archive_id = Column(Integer, primary_key=True)
+    id = Column(Integer, nullable=False, index=True)  # ID the payment had in payments
+    payment_id = Column(String, unique=True, index=True)
+    amount = Column(Float)
+    currency = Column(String, default="USD")
+    status = Column(String, nullable=False)
+    created_at = Column(DateTime, nullable=False, index=True)
+    updated_at = Column(DateTime, nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    receipt_url = Column(String, nullable=True)
+    payment_data = Column(JSON, nullable=True)
+    source_id = Column(String, nullable=True, index=True)
+    customer_id = Column(String, nullable=True, index=True)
+    reference_id = Column(String, nullable=True, index=True)
+    archived_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+class RevenueDaily(Base):
+    """Payment count and amount per creation day, currency and status, kept current on every status change"""
+    __tablename__ = "revenue_daily"
+
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(Date, nullable=False)
+    currency = Column(String, nullable=False)
+    status = Column(String, nullable=False)
+    payment_count = Column(Integer, nullable=False, default=0)
+    total_amount = Column(Float, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("day", "currency", "status", name="uq_revenue_daily_day_currency_status"),
+    )
+
+class ExchangeRate(Base):
+    __tablename__ = "exchange_rates"
+
+    id = Column(Integer, primary_key=True, index=True)
+    currency = Column(String, unique=True, nullable=False)
+    rate_to_usd = Column(Float, nullable=False)  # value of one unit in USD
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+
+    id = Column(Integer, primary_key=True, index=True)
+    token_hash = Column(String(64), unique=True, index=True, nullable=False)  # SHA-256 hex digest
+    family_id = Column(String(32), index=True, nullable=False)  # shared by every rotation of one login
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False)
+    revoked_at = Column(DateTime, nullable=True)
+    replaced_by_id = Column(Integer, nullable=True)
+
+    # Relationships
+    user = relationship("User", back_populates="refresh_tokens", passive_deletes=True)
+
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    task = Column(String, nullable=False, index=True)
+    payload = Column(JSON, nullable=True)
+    status = Column(String, nullable=False, default="queued")  # queued, running, succeeded or dead
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=5)
+    run_at = Column(DateTime, nullable=False, default=datetime.utcnow)  # not claimed before this time
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    locked_by = Column(String, nullable=True)
+    locked_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+
+    __table_args__ = (
+        # Claim query: next due job in a given state
+        Index("ix_jobs_status_run_at", "status", "run_at"),
+    )
+
+class AuditEvent(Base):
+    """Append-only record of one catalog or payment mutation, written in batches by ``app.audit``"""
+    __tablename__ = "audit_log"
+
+    id = Column(Integer, primary_key=True, index=True)
+    occurred_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    action = Column(String, nullable=False)  # e.g. material.create, payment.verify
+    object_type = Column(String, nullable=False)
+    object_id = Column(String, nullable=False)
+    actor_id = Column(Integer, nullable=True)  # no foreign key: history outlives the user
+    actor = Column(String, nullable=True)
+    request_id = Column(String, nullable=True)
+    details = Column(JSON, nullable=True)
+
+    __table_args__ = (
+        # History of one material, service or payment
+        Index("ix_audit_log_object", "object_type", "object_id", "id"),
+        Index("ix_audit_log_action_id", "action", "id"),
+        Index("ix_audit_log_actor_id", "actor_id", "id"),
+    )
@@ -0,0 +1,149 @@
+"""In-process notification hub for payment status changes.
+
+Clients waiting on a payment (see the ``/events`` endpoint) subscribe here instead
+of polling the database. A change published in one gunicorn worker reaches waiters
+in the others through Unix datagram sockets: every worker binds one socket in
+``NOTIFY_SOCKET_DIR`` and a publish sends the event to each peer socket. This covers
+all workers on one machine; waiters connected to another machine are not woken.
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import threading
+from typing import Any, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_SOCKET_DIR = os.getenv("NOTIFY_SOCKET_DIR", "/tmp/flooring-crm-notify")
+# Per-waiter buffer; a waiter this far behind only needs the latest status anyway
+NOTIFY_QUEUE_SIZE = 16
+MAX_DATAGRAM_SIZE = 4096
+
+class PaymentStatusHub:
+    def __init__(self, socket_dir: str = NOTIFY_SOCKET_DIR):
+        self.socket_dir = socket_dir
+        self._waiters: Dict[str, Set[asyncio.Queue]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._sock: Optional[socket.socket] = None
+        self._sock_path: Optional[str] = None
+        self._lock = threading.Lock()
+        self.published = 0
+        self.delivered = 0
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(queues) for queues in self._waiters.values())
+
+    def start(self) -> None:
+        """Bind this worker's socket and start receiving events from the other workers"""
+        self._loop = asyncio.get_running_loop()
+        if not hasattr(socket, "AF_UNIX"):
+            logger.warning("Unix sockets unavailable; payment notifications stay within this worker")
+            return
+        os.makedirs(self.socket_dir, exist_ok=True)
+        self._sock_path = os.path.join(self.socket_dir, f"{os.getpid()}.sock")
+        try:
+            os.unlink(self._sock_path)
+        except FileNotFoundError:
+            pass
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.setblocking(False)
+        sock.bind(self._sock_path)
+        self._sock = sock
+        self._loop.add_reader(sock.fileno(), self._on_datagram)
+        logger.info(f"Payment notification hub listening on {self._sock_path}")
+
+    def stop(self) -> None:
+        if self._sock is not None and self._loop is not None:
+            self._loop.remove_reader(self._sock.fileno())
+            self._sock.close()
+            self._sock = None
+        if self._sock_path:
+            try:
+                os.unlink(self._sock_path)
+            except FileNotFoundError:
+                pass
+            self._sock_path = None
+
+    def subscribe(self, payment_id: str) -> asyncio.Queue:
+        """Queue receiving every event published for the payment until unsubscribed"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=NOTIFY_QUEUE_SIZE)
+        self._waiters.setdefault(payment_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, payment_id: str, queue: asyncio.Queue) -> None:
+        queues = self._waiters.get(payment_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._waiters[payment_id]
+
+    def publish(self, payment_id: str, event: Dict[str, Any]) -> None:
+        """Wake local waiters for the payment and forward the event to the other workers"""
+        message = {"payment_id": payment_id, **event}
+        self.published += 1
+        self._deliver_threadsafe(message)
+        if self._sock is not None:
+            self._broadcast(json.dumps(message).encode("utf-8"))
+
+    def _deliver_threadsafe(self, message: Dict[str, Any]) -> None:
+        loop = self._loop
+        if loop is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._deliver(message)
+        else:
+            loop.call_soon_threadsafe(self._deliver, message)
+
+    def _deliver(self, message: Dict[str, Any]) -> None:
+        for queue in list(self._waiters.get(message["payment_id"], ())):
+            if queue.full():
+                # Drop the oldest event; only the latest status matters to a waiter
+                queue.get_nowait()
+            queue.put_nowait(message)
+            self.delivered += 1
+
+    def _broadcast(self, data: bytes) -> None:
+        if len(data) > MAX_DATAGRAM_SIZE:
+            logger.warning("Payment notification too large to forward to other workers")
+            return
+        with self._lock:
+            try:
+                entries = list(os.scandir(self.socket_dir))
+            except FileNotFoundError:
+                return
+            for entry in entries:
+                if not entry.name.endswith(".sock") or entry.path == self._sock_path:
+                    continue
+                try:
+                    self._sock.sendto(data, entry.path)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # Socket left behind by a worker that exited
+                    try:
+                        os.unlink(entry.path)
+                    except FileNotFoundError:
+                        pass
+                except BlockingIOError:
+                    logger.warning(f"Notification dropped: peer {entry.name} is not keeping up")
+                except OSError as e:
+                    logger.warning(f"Notification to {entry.name} failed: {str(e)}")
+
+    def _on_datagram(self) -> None:
+        while self._sock is not None:
+            try:
+                data = self._sock.recv(MAX_DATAGRAM_SIZE)
+            except BlockingIOError:
+                return
+            try:
+                message = json.loads(data)
+            except ValueError:
+                continue
+            self._deliver(message)
+
+payment_hub = PaymentStatusHub()
@@ -0,0 +1,94 @@
+"""Payment lookup and reconciliation by processor identifiers.
+
+``source_id``, ``customer_id`` and ``reference_id`` are stored as indexed columns
+next to ``payment_data`` (which keeps the original request for reference), so
+lookups and statement reconciliation never scan or deserialize the JSON.
+"""
+import logging
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from .archive import AnyPayment, find_payments_by_reference
+from .models import Payment
+
+logger = logging.getLogger(__name__)
+
+PAYMENT_REFERENCE_FIELDS = ("source_id", "customer_id", "reference_id")
+RECONCILE_MAX_ITEMS = 5000
+# Amounts are stored as floats; differences below a cent are not mismatches
+AMOUNT_TOLERANCE = 0.005
+
+def backfill_payment_references(db: Session) -> int:
+    """Copy the identifiers of existing payments out of ``payment_data``, in one UPDATE"""
+    updated = db.query(Payment).filter(Payment.payment_data.isnot(None)).update({
+        getattr(Payment, field): Payment.payment_data[field].as_string()
+        for field in PAYMENT_REFERENCE_FIELDS
+    }, synchronize_session=False)
+    db.commit()
+    logger.info(f"Copied payment identifiers out of payment_data for {updated} payments")
+    return updated
+
+def payment_summary(payment: AnyPayment) -> Dict[str, Any]:
+    return {
+        "payment_id": payment.payment_id,
+        "amount": payment.amount,
+        "currency": payment.currency,
+        "status": payment.status,
+        "created_at": payment.created_at.isoformat(),
+        "user_id": payment.user_id,
+        "source_id": payment.source_id,
+        "customer_id": payment.customer_id,
+        "reference_id": payment.reference_id,
+    }
+
+def reconcile(db: Session, items: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Match statement lines to payments by ``reference_id``, with one query per payments table.
+
+    A line is ``matched`` when exactly one payment carries its reference and the
+    amount and currency (when given) agree and the payment is completed;
+    ``mismatch`` when payments exist but disagree, or more than one does; and
+    ``missing`` when no payment has the reference.
+    """
+    references = {item["reference_id"] for item in items}
+    by_reference: Dict[str, List[AnyPayment]] = {}
+    if references:
+        for payment in find_payments_by_reference(db, references):
+            by_reference.setdefault(payment.reference_id, []).append(payment)
+
+    counts = {"matched": 0, "mismatch": 0, "missing": 0}
+    results = []
+    for item in items:
+        payments = by_reference.get(item["reference_id"], [])
+        problems = _problems(item, payments)
+        if not payments:
+            outcome = "missing"
+        elif problems:
+            outcome = "mismatch"
+        else:
+            outcome = "matched"
+        counts[outcome] += 1
+        results.append({
+            "reference_id": item["reference_id"],
+            "status": outcome,
+            "problems": problems,
+            "payments": [payment_summary(payment) for payment in payments],
+        })
+    return {**counts, "results": results}
+
+def _problems(item: Dict[str, Any], payments: List[AnyPayment]) -> List[str]:
+    if not payments:
+        return []
+    if len(payments) > 1:
+        return [f"{len(payments)} payments share this reference"]
+    payment = payments[0]
+    problems = []
+    amount: Optional[float] = item.get("amount")
+    if amount is not None and abs(payment.amount - amount) > AMOUNT_TOLERANCE:
+        problems.append(f"Amount {payment.amount:.2f} does not match statement amount {amount:.2f}")
+    currency: Optional[str] = item.get("currency")
+    if currency is not None and payment.currency != currency:
+        problems.append(f"Currency {payment.currency} does not match statement currency {currency}")
+    if payment.status != "completed":
+        problems.append(f"Payment is {payment.status}")
+    return problems
@@ -0,0 +1,348 @@
+"""Payment receipts rendered on first request and cached on disk.
+
+A receipt's cache key is the SHA-256 of everything that appears on it (plus the
+template version and format), so a payment whose details change gets a new file
+and repeated downloads of an unchanged receipt never render again. The cache
+directory is bounded by ``RECEIPT_CACHE_MAX_BYTES``; files are evicted least
+recently used first, using the file mtime (touched on every hit) as access time.
+"""
+import asyncio
+import hashlib
+import html
+import json
+import logging
+import os
+import tempfile
+import threading
+from email.utils import formatdate
+from typing import Any, Dict, List, Optional, Tuple
+
+import anyio
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from .models import Payment, User
+
+logger = logging.getLogger(__name__)
+
+RECEIPT_CACHE_DIR = os.getenv("RECEIPT_CACHE_DIR", "/tmp/flooring-crm-receipts")
+RECEIPT_CACHE_MAX_BYTES = int(os.getenv("RECEIPT_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+# Bump when the layout changes so cached receipts are rendered again
+RECEIPT_TEMPLATE_VERSION = "1"
+
+RECEIPT_FORMATS = {
+    "html": ("html", "text/html; charset=utf-8"),
+    "pdf": ("pdf", "application/pdf"),
+}
+COMPANY_NAME = "Flooring CRM"
+CHUNK_SIZE = 64 * 1024
+
+def receipt_fields(payment: Payment, user: Optional[User]) -> Dict[str, Any]:
+    """Everything printed on a receipt; the cache key is derived from this"""
+    payment_data = payment.payment_data or {}
+    billing = payment_data.get("billing_contact") or {}
+    return {
+        "payment_id": payment.payment_id,
+        "amount": f"{payment.amount:.2f}",
+        "currency": payment.currency,
+        "status": payment.status,
+        "created_at": payment.created_at.strftime("%Y-%m-%d %H:%M:%S UTC"),
+        "updated_at": payment.updated_at.strftime("%Y-%m-%d %H:%M:%S UTC"),
+        "customer": user.username if user else None,
+        "email": user.email if user else None,
+        "billing_name": billing.get("name") if isinstance(billing, dict) else None,
+        "reference_id": payment_data.get("reference_id"),
+    }
+
+def receipt_key(fields: Dict[str, Any], receipt_format: str) -> str:
+    canonical = json.dumps(
+        {"template": RECEIPT_TEMPLATE_VERSION, "format": receipt_format, "fields": fields},
+        sort_keys=True,
+        separators=(",", ":")
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def _receipt_lines(fields: Dict[str, Any]) -> List[Tuple[str, str]]:
+    lines = [
+        ("Receipt", fields["payment_id"]),
+        ("Amount", f"{fields['amount']} {fields['currency']}"),
+        ("Status", fields["status"].title()),
+        ("Date", fields["created_at"]),
+        ("Last updated", fields["updated_at"]),
+        ("Customer", fields["customer"] or ""),
+        ("Email", fields["email"] or ""),
+    ]
+    if fields["billing_name"]:
+        lines.append(("Billed to", fields["billing_name"]))
+    if fields["reference_id"]:
+        lines.append(("Reference", fields["reference_id"]))
+    return lines
+
+def render_html(fields: Dict[str, Any]) -> bytes:
+    rows = "\n".join(
+        f"      <tr><th>{html.escape(label)}</th><td>{html.escape(str(value))}</td></tr>"
+        for label, value in _receipt_lines(fields)
+    )
+    document = f"""<!DOCTYPE html>
+<html lang="en">
+<head>
+  <meta charset="utf-8">
+  <title>{html.escape(COMPANY_NAME)} receipt {html.escape(fields['payment_id'])}</title>
+  <style>
+    body {{ font-family: Helvetica, Arial, sans-serif; margin: 2rem auto; max-width: 36rem; color: #1f2937; }}
+    h1 {{ font-size: 1.5rem; }}
+    table {{ border-collapse: collapse; width: 100%; }}
+    th, td {{ text-align: left; padding: 0.4rem 0.6rem; border-bottom: 1px solid #e5e7eb; }}
+    th {{ width: 40%; color: #6b7280; font-weight: normal; }}
+  </style>
+</head>
+<body>
+  <h1>{html.escape(COMPANY_NAME)}</h1>
+  <table>
+{rows}
+  </table>
+  <p>Thank you for your business.</p>
+</body>
+</html>
+"""
+    return document.encode("utf-8")
+
+def _pdf_text(value: str) -> str:
+    # Standard Type1 fonts use Latin-1; replace anything else rather than fail
+    text = value.encode("latin-1", "replace").decode("latin-1")
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def render_pdf(fields: Dict[str, Any]) -> bytes:
+    """Single-page PDF using only the built-in Helvetica fonts, so no rendering dependency"""
+    commands = ["BT", "/F2 20 Tf", "72 720 Td", f"({_pdf_text(COMPANY_NAME)}) Tj", "0 -36 Td"]
+    for label, value in _receipt_lines(fields):
+        commands.append(f"/F2 11 Tf ({_pdf_text(label)}) Tj")
+        commands.append(f"160 0 Td /F1 11 Tf ({_pdf_text(str(value))}) Tj -160 -20 Td")
+    commands += ["0 -16 Td", f"/F1 11 Tf ({_pdf_text('Thank you for your business.')}) Tj", "ET"]
+    stream = "\n".join(commands).encode("latin-1")
+
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+        b"/Resources << /Font << /F1 4 0 R /F2 5 0 R >> >> /Contents 6 0 R >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>",
+        b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream",
+    ]
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref_offset = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+    return bytes(out)
+
+RENDERERS = {"html": render_html, "pdf": render_pdf}
+
+class ReceiptCache:
+    """Size-bounded directory of rendered receipts shared by all workers"""
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # Bytes this process believes are on disk; corrected by a rescan on eviction
+        self._estimated_bytes: Optional[int] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.renders = 0
+
+    def path_for(self, key: str, extension: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.{extension}")
+
+    def _scan(self) -> List[Tuple[float, int, str]]:
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.startswith("."):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _evict(self) -> None:
+        entries = sorted(self._scan())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+        self._estimated_bytes = total
+
+    def lookup(self, key: str, extension: str) -> Optional[str]:
+        path = self.path_for(key, extension)
+        try:
+            # Touch on hit so mtime tracks last access for LRU eviction
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        self.hits += 1
+        return path
+
+    def store(self, key: str, extension: str, content: bytes) -> str:
+        path = self.path_for(key, extension)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".receipt-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        with self._lock:
+            if self._estimated_bytes is None:
+                self._estimated_bytes = sum(size for _, size, _ in self._scan())
+            else:
+                self._estimated_bytes += len(content)
+            if self._estimated_bytes > self.max_bytes:
+                self._evict()
+        return path
+
+    def _render_and_store(self, key: str, receipt_format: str, fields: Dict[str, Any]) -> str:
+        extension, _ = RECEIPT_FORMATS[receipt_format]
+        # Another worker may have rendered it while we waited for a thread
+        path = self.lookup(key, extension)
+        if path:
+            return path
+        content = RENDERERS[receipt_format](fields)
+        self.renders += 1
+        return self.store(key, extension, content)
+
+    async def get_or_render(self, fields: Dict[str, Any], receipt_format: str) -> Tuple[str, str]:
+        """Return (path, key) of the receipt, rendering it off the event loop on a miss"""
+        key = receipt_key(fields, receipt_format)
+        extension, _ = RECEIPT_FORMATS[receipt_format]
+        path = self.lookup(key, extension)
+        if path:
+            return path, key
+
+        # Concurrent requests for the same receipt share one render
+        pending = self._inflight.get(key)
+        if pending is None:
+            pending = asyncio.ensure_future(run_in_threadpool(self._render_and_store, key, receipt_format, fields))
+            self._inflight[key] = pending
+            pending.add_done_callback(lambda _: self._inflight.pop(key, None))
+        path = await asyncio.shield(pending)
+        return path, key
+
+receipt_cache = ReceiptCache(RECEIPT_CACHE_DIR, RECEIPT_CACHE_MAX_BYTES)
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single ``bytes=`` range into inclusive offsets; raise ValueError if unsatisfiable"""
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        # Multiple ranges are optional to support; serve the full file instead
+        return None
+    start_text, _, end_text = spec.strip().partition("-")
+    if not start_text:
+        length = int(end_text)
+        if length <= 0:
+            raise ValueError("Empty suffix range")
+        return max(0, size - length), size - 1
+    start = int(start_text)
+    end = int(end_text) if end_text else size - 1
+    if start >= size or end < start:
+        raise ValueError("Range not satisfiable")
+    return start, min(end, size - 1)
+
+class ReceiptFileResponse(Response):
+    """File response with strong ETags, conditional GET and single byte ranges.
+
+    When the server offers the ASGI ``http.response.zerocopy`` extension the body is
+    handed over as a file descriptor (sendfile); otherwise it is streamed in chunks.
+    """
+
+    def __init__(self, path: str, etag: str, media_type: str, filename: str):
+        super().__init__(media_type=media_type)
+        self.path = path
+        self.etag = f'"{etag}"'
+        self.media_type = media_type
+        self.filename = filename
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        request_headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope["headers"]}
+        stat = await anyio.to_thread.run_sync(os.stat, self.path)
+        size = stat.st_size
+        headers = {
+            "etag": self.etag,
+            "last-modified": formatdate(stat.st_mtime, usegmt=True),
+            "accept-ranges": "bytes",
+            # Content-addressed, so revalidation is a cheap 304
+            "cache-control": "private, no-cache",
+            "content-disposition": f'inline; filename="{self.filename}"',
+        }
+
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match and (if_none_match.strip() == "*" or self.etag in [t.strip() for t in if_none_match.split(",")]):
+            await self._send_head(send, 304, headers)
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        status_code, start, end = 200, 0, size - 1
+        range_header = request_headers.get("range")
+        if_range = request_headers.get("if-range")
+        if range_header and size and (not if_range or if_range.strip() == self.etag):
+            try:
+                byte_range = _parse_range(range_header, size)
+            except ValueError:
+                headers["content-range"] = f"bytes */{size}"
+                await self._send_head(send, 416, headers)
+                await send({"type": "http.response.body", "body": b""})
+                return
+            if byte_range:
+                status_code, (start, end) = 206, byte_range
+                headers["content-range"] = f"bytes {start}-{end}/{size}"
+
+        count = end - start + 1 if size else 0
+        headers["content-type"] = self.media_type
+        headers["content-length"] = str(count)
+        await self._send_head(send, status_code, headers)
+
+        if scope.get("method") == "HEAD" or count == 0:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        if "http.response.zerocopy" in scope.get("extensions", {}):
+            with open(self.path, "rb") as f:
+                await send({"type": "http.response.zerocopy", "file": f, "offset": start, "count": count})
+            return
+
+        async with await anyio.open_file(self.path, "rb") as f:
+            await f.seek(start)
+            remaining = count
+            while remaining > 0:
+                chunk = await f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                await send({"type": "http.response.body", "body": b""})
+
+    @staticmethod
+    async def _send_head(send: Send, status_code: int, headers: Dict[str, str]) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": status_code,
+            "headers": [(k.encode("latin-1"), v.encode("latin-1")) for k, v in headers.items()],
+        })
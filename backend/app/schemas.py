@@ -1,11 +1,18 @@
 from datetime import datetime
 from pydantic import BaseModel, Field, EmailStr, ConfigDict, field_validator, ValidationError
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Any
 from fastapi import HTTPException, status
 
+from .payments import RECONCILE_MAX_ITEMS
+
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+
+class RefreshTokenRequest(BaseModel):
+    refresh_token: str = Field(..., min_length=1, description="Refresh token issued at login")
+    all_sessions: bool = Field(default=False, description="Revoke every session of the user (logout only)")
 
 class TokenData(BaseModel):
     username: Optional[str] = None
@@ -82,6 +89,26 @@ class User(UserBase):
 
     model_config = ConfigDict(from_attributes=True)
 
+class BulkUserCreate(UserBase):
+    # Password rules are applied once by the bulk endpoint so that a weak password
+    # fails only its own entry instead of the whole batch
+    password: str = Field(..., min_length=8, max_length=100)
+
+class BulkUserProvisionRequest(BaseModel):
+    users: List[Dict[str, Any]] = Field(..., min_length=1, description="Users to create, in UserCreate format")
+
+class BulkUserResult(BaseModel):
+    index: int
+    username: Optional[str] = None
+    status: str
+    id: Optional[int] = None
+    errors: List[str] = []
+
+class BulkUserProvisionResponse(BaseModel):
+    created: int
+    failed: int
+    results: List[BulkUserResult]
+
 class MaterialBase(BaseModel):
     name: str = Field(
         ..., 
@@ -195,6 +222,29 @@ class Service(ServiceBase):
 
     model_config = ConfigDict(from_attributes=True)
 
+class MaterialChange(Material):
+    change_seq: int
+
+class ServiceChange(Service):
+    change_seq: int
+
+class CatalogTombstone(BaseModel):
+    kind: str
+    id: int
+    change_seq: int
+    deleted_at: datetime
+
+class CatalogChanges(BaseModel):
+    since: int
+    next_since: int
+    has_more: bool
+    materials: List[MaterialChange]
+    services: List[ServiceChange]
+    deleted: List[CatalogTombstone]
+
+class ExchangeRateUpdate(BaseModel):
+    rate_to_usd: float = Field(gt=0, description="Value of one unit of the currency in USD")
+
 class PaymentBase(BaseModel):
     amount: float = Field(gt=0, description="Payment amount must be greater than 0")
     currency: str = Field(default="USD", pattern="^(USD|EUR|GBP|CAD)$", description="Currency must be one of: USD, EUR, GBP, CAD")
@@ -219,10 +269,21 @@ class PaymentResponse(PaymentBase):
     created_at: datetime
     updated_at: datetime
     receipt_url: Optional[str] = None
+    source_id: Optional[str] = None
+    customer_id: Optional[str] = None
+    reference_id: Optional[str] = None
     payment_metadata: Optional[Dict] = Field(None, alias="payment_data")
 
     model_config = ConfigDict(from_attributes=True, populate_by_name=True)
 
+class PaymentReconcileItem(BaseModel):
+    reference_id: str = Field(..., min_length=1, description="Reference identifier from the processor statement")
+    amount: Optional[float] = Field(None, description="Statement amount, compared when given")
+    currency: Optional[str] = Field(None, description="Statement currency, compared when given")
+
+class PaymentReconcileRequest(BaseModel):
+    items: List[PaymentReconcileItem] = Field(..., min_length=1, max_length=RECONCILE_MAX_ITEMS)
+
 class PaymentVerification(BaseModel):
     payment_id: str
     verification_token: str
@@ -0,0 +1,425 @@
+"""Synthetic data at production scale, for load and query-plan testing.
+
+    python -m app.seed --materials 2000000 --users 200000 --payments 20000000 --seed 7
+
+Rows are appended to the tables of ``DATABASE_URL`` (created if missing) with
+explicit IDs after the current maximum:
+
+* users: varied names, emails, phones and addresses, about 2% employees. Every
+  seeded user's password is ``--password``, and each user gets one of
+  ``--password-hashes`` pre-computed hashes, so hashing does not dominate the
+  load time;
+* materials and services: names and descriptions built from flooring vocabulary,
+  with prices, units and stock levels that vary by product type;
+* payments: spread over the ``--days`` before ``--end-date`` in ID order, across
+  currencies and statuses, with the processor identifiers filled in.
+
+The data depends only on the seed, the counts, ``--days`` and ``--end-date``, so the
+same arguments always produce the same rows. PostgreSQL is loaded with ``COPY``;
+SQLite with batched ``executemany`` inside one transaction. The catalog sequence
+moves in that transaction too, so it never runs ahead of the rows; revenue rollups
+and exchange rates are brought up to date afterwards.
+"""
+import argparse
+import csv
+import io
+import logging
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+from itertools import islice
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy.orm import Session
+
+from .analytics import rebuild_rollups, set_exchange_rate
+from .catalog import reserve_change_seqs
+from .models import ExchangeRate
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 50_000
+DEFAULT_PASSWORD = "SeedUser123!"
+
+USER_COLUMNS = ("id", "username", "email", "hashed_password", "role", "phone", "address", "is_active")
+MATERIAL_COLUMNS = ("id", "name", "description", "price_per_unit", "unit", "stock", "updated_at", "change_seq")
+SERVICE_COLUMNS = ("id", "name", "description", "base_price", "updated_at", "change_seq")
+PAYMENT_COLUMNS = (
+    "id", "payment_id", "amount", "currency", "status", "created_at", "updated_at", "user_id",
+    "receipt_url", "payment_data", "source_id", "customer_id", "reference_id",
+)
+
+FIRST_NAMES = (
+    "James", "Mary", "Robert", "Patricia", "John", "Jennifer", "Michael", "Linda", "David", "Elizabeth",
+    "William", "Barbara", "Richard", "Susan", "Joseph", "Jessica", "Thomas", "Sarah", "Carlos", "Karen",
+    "Daniel", "Lisa", "Matthew", "Nancy", "Anthony", "Sandra", "Mark", "Ashley", "Wei", "Priya",
+    "Ahmed", "Fatima", "Hiroshi", "Yuki", "Olga", "Ivan", "Lucia", "Mateo", "Amara", "Kwame",
+)
+LAST_NAMES = (
+    "Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Rodriguez", "Martinez",
+    "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson", "Thomas", "Taylor", "Moore", "Jackson", "Martin",
+    "Lee", "Perez", "Thompson", "White", "Harris", "Clark", "Lewis", "Walker", "Chen", "Patel",
+    "Nguyen", "Kim", "Singh", "Okafor", "Novak", "Kowalski", "Rossi", "Muller", "Tanaka", "Silva",
+)
+EMAIL_DOMAINS = ("example.com", "example.net", "example.org", "mail.example.com", "contractors.example.com")
+STREETS = (
+    "Oak", "Maple", "Cedar", "Pine", "Elm", "Lake", "Hill", "Park", "Washington", "Sunset",
+    "Highland", "River", "Mill", "Church", "Main", "Spring", "Valley", "Forest", "Meadow", "Ridge",
+)
+STREET_SUFFIXES = ("St", "Ave", "Blvd", "Rd", "Ln", "Dr", "Ct", "Way")
+CITIES = (
+    "Springfield", "Riverside", "Franklin", "Greenville", "Bristol", "Clinton", "Fairview", "Salem",
+    "Madison", "Georgetown", "Arlington", "Ashland", "Dover", "Oxford", "Jackson", "Burlington",
+)
+
+SPECIES = (
+    "White Oak", "Red Oak", "Maple", "Hickory", "Walnut", "Cherry", "Ash", "Birch", "Acacia", "Teak",
+    "Bamboo", "Cork", "Brazilian Cherry", "Heart Pine", "Beech", "Mahogany", "Slate", "Travertine",
+    "Marble", "Granite", "Porcelain", "Ceramic", "Terracotta", "Concrete", "Limestone",
+)
+FINISHES = (
+    "Hand-scraped", "Wire-brushed", "Smooth", "Distressed", "Matte", "Satin", "Semi-gloss", "High-gloss",
+    "Oiled", "Lacquered", "Honed", "Polished", "Tumbled", "Textured", "Reclaimed",
+)
+GRADES = ("Select", "Premium", "Character", "Rustic", "Clear", "Builder")
+# kind, units, price range per unit, thicknesses in mm
+PRODUCT_KINDS: Tuple[Tuple[str, Tuple[str, ...], Tuple[float, float], Tuple[int, ...]], ...] = (
+    ("Solid Hardwood", ("sqft",), (4.5, 14.0), (18, 19, 20)),
+    ("Engineered Hardwood", ("sqft", "box"), (3.0, 11.0), (9, 12, 14, 15)),
+    ("Laminate", ("sqft", "box"), (1.0, 4.5), (7, 8, 10, 12)),
+    ("Luxury Vinyl Plank", ("sqft", "box"), (2.0, 7.0), (4, 5, 6, 8)),
+    ("Tile", ("sqft", "box", "piece"), (1.5, 22.0), (8, 10, 12)),
+    ("Carpet", ("sqyd", "roll"), (12.0, 65.0), (10, 12, 15)),
+    ("Stair Tread", ("piece",), (25.0, 140.0), (20, 25)),
+    ("Trim Molding", ("linear ft", "piece"), (0.8, 9.0), (12, 15, 18)),
+    ("Underlayment", ("roll", "sqft"), (0.2, 1.8), (2, 3, 6)),
+    ("Adhesive", ("bucket", "tube"), (15.0, 180.0), (0,)),
+)
+SERVICE_KINDS: Tuple[Tuple[str, Tuple[float, float]], ...] = (
+    ("Installation", (250.0, 6000.0)),
+    ("Refinishing", (400.0, 4500.0)),
+    ("Removal and Disposal", (150.0, 2500.0)),
+    ("Subfloor Repair", (200.0, 3500.0)),
+    ("Moisture Testing", (90.0, 450.0)),
+    ("Stair Installation", (600.0, 7000.0)),
+    ("Grout Sealing", (120.0, 900.0)),
+    ("Deep Cleaning", (90.0, 600.0)),
+)
+ROOMS = ("kitchen", "living room", "basement", "bathroom", "hallway", "stairs", "bedroom", "whole home", "office", "patio")
+
+# currency -> (share of payments, USD value of one unit)
+CURRENCIES = {"USD": (0.70, 1.0), "EUR": (0.12, 1.08), "GBP": (0.08, 1.27), "CAD": (0.06, 0.74), "AUD": (0.04, 0.66)}
+STATUSES = {"completed": 0.85, "pending": 0.08, "failed": 0.07}
+EMPLOYEE_SHARE = 0.02
+INACTIVE_SHARE = 0.03
+OUT_OF_STOCK_SHARE = 0.08
+
+def _collections(rng: random.Random, count: int = 2000) -> List[str]:
+    """Pronounceable product-line names, e.g. ``Corvella`` or ``Brandon Ridge``"""
+    onsets = ("b", "br", "c", "cl", "d", "f", "g", "h", "k", "l", "m", "n", "p", "r", "s", "st", "t", "v", "w")
+    vowels = ("a", "e", "i", "o", "u", "ai", "ea", "io")
+    endings = ("n", "r", "l", "ck", "ss", "ton", "ford", "wood", "more", "dale", "ville", "ella")
+    names = set()
+    while len(names) < count:
+        word = "".join(rng.choice(onsets) + rng.choice(vowels) for _ in range(rng.randint(1, 2)))
+        word = (word + rng.choice(endings)).capitalize()
+        if rng.random() < 0.3:
+            word = f"{word} {rng.choice(('Ridge', 'Coast', 'Estate', 'Heritage', 'Valley', 'Harbor', 'Grove'))}"
+        names.add(word)
+    return sorted(names)
+
+def _timestamp(value: datetime) -> str:
+    return value.isoformat(sep=" ")
+
+def _weighted(rng: random.Random, weights: Dict[str, Any]) -> Callable[[], str]:
+    choices = list(weights)
+    cumulative = []
+    total = 0.0
+    for name in choices:
+        share = weights[name][0] if isinstance(weights[name], tuple) else weights[name]
+        total += share
+        cumulative.append(total)
+    return lambda: rng.choices(choices, cum_weights=cumulative)[0]
+
+def generate_users(rng: random.Random, first_id: int, count: int, password_hashes: Sequence[str]) -> Iterator[tuple]:
+    for offset in range(count):
+        user_id = first_id + offset
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        username = f"{first.lower()}.{last.lower()}{user_id}"
+        yield (
+            user_id,
+            username,
+            f"{username}@{rng.choice(EMAIL_DOMAINS)}",
+            password_hashes[user_id % len(password_hashes)],
+            "employee" if rng.random() < EMPLOYEE_SHARE else "customer",
+            f"+1-{rng.randint(201, 989)}-555-{rng.randint(0, 9999):04d}" if rng.random() < 0.8 else None,
+            f"{rng.randint(1, 9999)} {rng.choice(STREETS)} {rng.choice(STREET_SUFFIXES)}, {rng.choice(CITIES)}"
+            if rng.random() < 0.7 else None,
+            rng.random() >= INACTIVE_SHARE,
+        )
+
+def generate_materials(rng: random.Random, first_id: int, count: int, first_seq: int, end: datetime,
+                       days: int) -> Iterator[tuple]:
+    collections = _collections(rng)
+    for offset in range(count):
+        kind, units, (low, high), thicknesses = rng.choice(PRODUCT_KINDS)
+        species, finish, collection = rng.choice(SPECIES), rng.choice(FINISHES), rng.choice(collections)
+        width = rng.choice((3, 4, 5, 6, 7, 8, 9, 12, 18, 24))
+        thickness = rng.choice(thicknesses)
+        description = (
+            f"{finish} {species.lower()} {kind.lower()} from the {collection} collection, "
+            f"{rng.choice(GRADES).lower()} grade. {width}in wide"
+            + (f", {thickness}mm thick." if thickness else ".")
+            + f" Suited to {rng.choice(ROOMS)} and {rng.choice(ROOMS)} installations."
+        )
+        stock = 0 if rng.random() < OUT_OF_STOCK_SHARE else int(rng.lognormvariate(5, 1.2))
+        yield (
+            first_id + offset,
+            f"{species} {kind} {collection} {finish} {width}in",
+            description,
+            round(rng.uniform(low, high), 2),
+            rng.choice(units),
+            stock,
+            _timestamp(end - timedelta(seconds=rng.randrange(days * 86400))),
+            first_seq + offset,
+        )
+
+def generate_services(rng: random.Random, first_id: int, count: int, first_seq: int, end: datetime,
+                      days: int) -> Iterator[tuple]:
+    for offset in range(count):
+        kind, (low, high) = rng.choice(SERVICE_KINDS)
+        room, material = rng.choice(ROOMS), rng.choice(PRODUCT_KINDS)[0]
+        yield (
+            first_id + offset,
+            f"{material} {kind} - {room.title()}",
+            f"{kind} of {material.lower()} flooring for a {room}, priced per project. "
+            f"Includes {rng.choice(('site visit', 'materials handling', 'cleanup', 'furniture moving'))}.",
+            round(rng.uniform(low, high), 2),
+            _timestamp(end - timedelta(seconds=rng.randrange(days * 86400))),
+            first_seq + offset,
+        )
+
+def _utc_text(epoch_seconds: float) -> str:
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(epoch_seconds))
+
+def generate_payments(rng: random.Random, first_id: int, count: int, user_ids: Tuple[int, int], end: datetime,
+                      days: int) -> Iterator[tuple]:
+    # The hot loop of a tens-of-millions row load: plain epoch arithmetic and string
+    # templates instead of datetime objects and json.dumps
+    currency = _weighted(rng, CURRENCIES)
+    status = _weighted(rng, STATUSES)
+    first_user, user_count = user_ids
+    backend_url = os.getenv("BACKEND_URL", "")
+    end_epoch = (end - datetime(1970, 1, 1)).total_seconds()
+    start_epoch = end_epoch - days * 86400
+    step = days * 86400 / max(count, 1)
+    for offset in range(count):
+        payment_row_id = first_id + offset
+        # In ID order, like a table that has been written to for ``days``
+        created = start_epoch + (offset + rng.random()) * step
+        created_at = _utc_text(created)
+        # Repeat customers: low user IDs pay more often than high ones
+        user_id = first_user + int(user_count * rng.random() ** 2)
+        payment_status = status()
+        payment_id = f"pay_{int(created)}_{user_id}_{rng.getrandbits(32):08x}"
+        source_id = f"cnon:{rng.getrandbits(96):024x}"
+        customer_id = f"cust_{user_id:08d}"
+        reference_id = f"INV-{created_at[:4]}-{payment_row_id:09d}"
+        yield (
+            payment_row_id,
+            payment_id,
+            round(rng.lognormvariate(6.5, 1.0), 2),
+            currency(),
+            payment_status,
+            created_at,
+            _utc_text(created + rng.randint(1, 30)),
+            user_id,
+            f"{backend_url}/api/payments/{payment_id}/receipt" if payment_status == "completed" else None,
+            # Same document process_payment stores; the values need no JSON escaping
+            f'{{"source_id": "{source_id}", "customer_id": "{customer_id}", "reference_id": "{reference_id}", '
+            f'"billing_contact": null, "verification_details": null}}',
+            source_id,
+            customer_id,
+            reference_id,
+        )
+
+class BulkLoader:
+    """Appends rows over one raw DBAPI connection: ``COPY`` on PostgreSQL, ``executemany`` elsewhere.
+
+    Everything loaded, and the catalog sequence values reserved with ``reserve_change_seqs``,
+    is committed together by ``commit``.
+    """
+
+    def __init__(self, engine, batch_size: int = DEFAULT_BATCH_SIZE):
+        self.dialect = engine.dialect.name
+        self.batch_size = max(1, batch_size)
+        self._connection = engine.connect()
+        self._transaction = self._connection.begin()
+        self.connection = self._connection.connection
+
+    def reserve_change_seqs(self, count: int) -> int:
+        """First of ``count`` catalog sequence values, reserved in the load's transaction.
+
+        The sequence only moves when the rows carrying these values become visible, so
+        ``changes_since`` clients cannot move past them before they are committed.
+        """
+        with Session(bind=self._connection) as db:
+            return reserve_change_seqs(db, count)
+
+    def max_id(self, table: str) -> int:
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}")
+            return int(cursor.fetchone()[0])
+        finally:
+            cursor.close()
+
+    def load(self, table: str, columns: Sequence[str], rows: Iterator[tuple], total: int) -> int:
+        cursor = self.connection.cursor()
+        loaded = 0
+        start = time.perf_counter()
+        try:
+            while True:
+                batch = list(islice(rows, self.batch_size))
+                if not batch:
+                    break
+                if self.dialect == "postgresql":
+                    self._copy(cursor, table, columns, batch)
+                else:
+                    placeholders = ", ".join("?" for _ in columns)
+                    cursor.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})", batch)
+                loaded += len(batch)
+                elapsed = time.perf_counter() - start
+                logger.info(f"{table}: {loaded}/{total} rows ({loaded / max(elapsed, 1e-9):,.0f} rows/s)")
+            if self.dialect == "postgresql" and loaded:
+                # Explicit IDs bypass the sequence; move it past them
+                cursor.execute(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT MAX(id) FROM {table}))"
+                )
+        finally:
+            cursor.close()
+        return loaded
+
+    def _copy(self, cursor, table: str, columns: Sequence[str], batch: List[tuple]) -> None:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in batch:
+            # Unquoted empty fields are NULL in COPY's CSV format
+            writer.writerow(["" if value is None else ("t" if value is True else "f" if value is False else value)
+                             for value in row])
+        buffer.seek(0)
+        sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+        if hasattr(cursor, "copy_expert"):
+            cursor.copy_expert(sql, buffer)  # psycopg2
+        else:
+            with cursor.copy(sql) as copy:  # psycopg 3
+                copy.write(buffer.getvalue())
+
+    def commit(self) -> None:
+        self._transaction.commit()
+
+    def close(self) -> None:
+        # Rolls back whatever was not committed
+        self._connection.close()
+
+def seed(engine, session_factory, *, seed: int = 0, users: int = 0, materials: int = 0, services: int = 0,
+         payments: int = 0, days: int = 730, end_date: Optional[date] = None, password: str = DEFAULT_PASSWORD,
+         password_hashes: int = 16, batch_size: int = DEFAULT_BATCH_SIZE, rollups: bool = True) -> Dict[str, int]:
+    """Append generated rows and return how many were loaded per table"""
+    from .hashing import pwd_context
+
+    end = datetime.combine(end_date or date.today(), datetime.min.time())
+    days = max(1, days)
+    # One generator per table, so changing one count leaves the other tables' rows unchanged
+    rngs = {table: random.Random(f"{seed}:{table}") for table in ("users", "materials", "services", "payments")}
+
+    loader = BulkLoader(engine, batch_size)
+    loaded: Dict[str, int] = {}
+    try:
+        first_user = loader.max_id("users") + 1
+        if users:
+            logger.info(f"Hashing {password_hashes} copies of the seed password")
+            hashes = [pwd_context.hash(password) for _ in range(max(1, password_hashes))]
+            loaded["users"] = loader.load(
+                "users", USER_COLUMNS, generate_users(rngs["users"], first_user, users, hashes), users
+            )
+        material_seq = loader.reserve_change_seqs(materials) if materials else 0
+        service_seq = loader.reserve_change_seqs(services) if services else 0
+        if materials:
+            loaded["materials"] = loader.load(
+                "materials", MATERIAL_COLUMNS,
+                generate_materials(rngs["materials"], loader.max_id("materials") + 1, materials, material_seq, end, days),
+                materials,
+            )
+        if services:
+            loaded["services"] = loader.load(
+                "services", SERVICE_COLUMNS,
+                generate_services(rngs["services"], loader.max_id("services") + 1, services, service_seq, end, days),
+                services,
+            )
+        if payments:
+            # Payments belong to the users seeded in this run, or to existing ones
+            user_range = (first_user, users) if users else (1, loader.max_id("users"))
+            if user_range[1] == 0:
+                raise ValueError("Payments need users; seed some with --users")
+            loaded["payments"] = loader.load(
+                "payments", PAYMENT_COLUMNS,
+                generate_payments(rngs["payments"], loader.max_id("payments") + 1, payments, user_range, end, days),
+                payments,
+            )
+        loader.commit()
+    finally:
+        loader.close()
+
+    if payments:
+        db = session_factory()
+        try:
+            known = {row.currency for row in db.query(ExchangeRate)}
+            for currency, (_, rate) in CURRENCIES.items():
+                if currency not in known and currency != "USD":
+                    set_exchange_rate(db, currency, rate)
+            if rollups:
+                logger.info(f"Rebuilt {rebuild_rollups(db)} revenue rollup rows")
+        finally:
+            db.close()
+    return loaded
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Load reproducible synthetic data at production scale")
+    parser.add_argument("--seed", type=int, default=0, help="Same seed and counts give the same rows (default: 0)")
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument("--materials", type=int, default=10_000)
+    parser.add_argument("--services", type=int, default=500)
+    parser.add_argument("--payments", type=int, default=100_000)
+    parser.add_argument("--days", type=int, default=730, help="Payments are spread over this many days")
+    parser.add_argument("--end-date", type=date.fromisoformat, default=None,
+                        help="Last day of generated history, YYYY-MM-DD (default: today)")
+    parser.add_argument("--password", default=DEFAULT_PASSWORD, help="Password of every seeded user")
+    parser.add_argument("--password-hashes", type=int, default=16,
+                        help="Distinct hashes of the password to spread across users (default: 16)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--skip-rollups", action="store_true", help="Do not rebuild revenue rollups afterwards")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    from .database import SessionLocal, add_missing_columns, create_tables, engine
+    create_tables(engine)
+    add_missing_columns(engine)
+
+    start = time.perf_counter()
+    loaded = seed(
+        engine, SessionLocal,
+        seed=args.seed, users=args.users, materials=args.materials, services=args.services,
+        payments=args.payments, days=args.days, end_date=args.end_date, password=args.password,
+        password_hashes=args.password_hashes, batch_size=args.batch_size, rollups=not args.skip_rollups,
+    )
+    elapsed = time.perf_counter() - start
+    for table, count in loaded.items():
+        print(f"{table}: {count:,} rows")
+    print(f"Loaded {sum(loaded.values()):,} rows in {elapsed:.1f}s; seeded users log in with password {args.password!r}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
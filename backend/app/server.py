@@ -0,0 +1,110 @@
+"""Production server entry point: gunicorn managing uvicorn workers.
+
+    python -m app.server                      # settings from the environment
+    python -m app.server --workers 2 --loop asyncio --http h11
+
+Every option can be set by an environment variable (shown in ``--help``), so the
+Dockerfile and fly.toml only need to change configuration, not the command.
+Benchmarks comparing the settings are in ``benchmarks/README.md``.
+"""
+import argparse
+import logging
+import os
+import sys
+from typing import Any, Dict, Optional
+
+from gunicorn.app.base import BaseApplication
+from uvicorn.workers import UvicornWorker
+
+logger = logging.getLogger(__name__)
+
+SERVER_LOOPS = ("auto", "uvloop", "asyncio")
+SERVER_HTTP_PARSERS = ("auto", "httptools", "h11")
+
+def _env_bool(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+def default_workers() -> int:
+    # Handlers block on the database, so one worker per core plus one keeps the CPU busy
+    # while a request waits; memory, not CPU, usually caps this on small machines
+    return (os.cpu_count() or 1) + 1
+
+class TunedUvicornWorker(UvicornWorker):
+    """Uvicorn worker whose event loop and HTTP parser are chosen at startup"""
+    CONFIG_KWARGS: Dict[str, Any] = {"loop": "auto", "http": "auto", "access_log": False}
+
+class FlooringServer(BaseApplication):
+    def __init__(self, options: Dict[str, Any], app_uri: str = "app.main:app"):
+        self.options = options
+        self.app_uri = app_uri
+        super().__init__()
+
+    def load_config(self) -> None:
+        for key, value in self.options.items():
+            if value is not None:
+                self.cfg.set(key, value)
+
+    def load(self):
+        from gunicorn.util import import_app
+        return import_app(self.app_uri)
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Run the Flooring CRM API under gunicorn with uvicorn workers")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"), help="HOST")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8080")), help="PORT")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", str(default_workers()))),
+                        help="WEB_CONCURRENCY (default: CPU count + 1)")
+    parser.add_argument("--loop", choices=SERVER_LOOPS, default=os.getenv("SERVER_LOOP", "auto"),
+                        help="SERVER_LOOP; auto picks uvloop when installed")
+    parser.add_argument("--http", choices=SERVER_HTTP_PARSERS, default=os.getenv("SERVER_HTTP", "auto"),
+                        help="SERVER_HTTP; auto picks httptools when installed")
+    parser.add_argument("--backlog", type=int, default=int(os.getenv("SERVER_BACKLOG", "2048")),
+                        help="SERVER_BACKLOG: pending connections the kernel queues per listener")
+    parser.add_argument("--keepalive", type=int, default=int(os.getenv("SERVER_KEEPALIVE", "5")),
+                        help="SERVER_KEEPALIVE: seconds an idle connection is kept open")
+    parser.add_argument("--timeout", type=int, default=int(os.getenv("SERVER_TIMEOUT", "60")),
+                        help="SERVER_TIMEOUT: seconds before a silent worker is restarted")
+    parser.add_argument("--graceful-timeout", type=int, default=int(os.getenv("SERVER_GRACEFUL_TIMEOUT", "30")),
+                        help="SERVER_GRACEFUL_TIMEOUT: seconds workers get to finish requests on restart")
+    parser.add_argument("--max-requests", type=int, default=int(os.getenv("SERVER_MAX_REQUESTS", "0")),
+                        help="SERVER_MAX_REQUESTS: recycle a worker after this many requests (0 disables)")
+    parser.add_argument("--max-requests-jitter", type=int, default=int(os.getenv("SERVER_MAX_REQUESTS_JITTER", "0")),
+                        help="SERVER_MAX_REQUESTS_JITTER: random extra requests so workers do not recycle together")
+    parser.add_argument("--preload", action=argparse.BooleanOptionalAction, default=_env_bool("SERVER_PRELOAD", "false"),
+                        help="SERVER_PRELOAD: import the app once in the master and fork workers from it")
+    parser.add_argument("--log-level", default=os.getenv("SERVER_LOG_LEVEL", "info"), help="SERVER_LOG_LEVEL")
+    return parser
+
+def server_options(args: argparse.Namespace) -> Dict[str, Any]:
+    return {
+        "bind": f"{args.host}:{args.port}",
+        "workers": max(1, args.workers),
+        "worker_class": TunedUvicornWorker,
+        "backlog": args.backlog,
+        "keepalive": args.keepalive,
+        "timeout": args.timeout,
+        "graceful_timeout": args.graceful_timeout,
+        "max_requests": args.max_requests,
+        "max_requests_jitter": args.max_requests_jitter,
+        "preload_app": args.preload,
+        "loglevel": args.log_level,
+        # Requests are logged by the app's own middleware, with request IDs
+        "accesslog": None,
+        "errorlog": "-",
+    }
+
+def main(argv: Optional[list] = None) -> int:
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    TunedUvicornWorker.CONFIG_KWARGS = {**TunedUvicornWorker.CONFIG_KWARGS, "loop": args.loop, "http": args.http}
+    options = server_options(args)
+    logger.info(
+        f"Starting {options['workers']} workers on {options['bind']} "
+        f"(loop={args.loop}, http={args.http}, keepalive={args.keepalive}s, "
+        f"max_requests={args.max_requests}, preload={args.preload})"
+    )
+    FlooringServer(options).run()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,215 @@
+"""Slow-query log built on SQLAlchemy cursor events.
+
+Every statement is timed between ``before_cursor_execute`` and
+``after_cursor_execute``. Statements slower than ``SLOW_QUERY_MS`` are kept in a
+ring buffer of the last ``SLOW_QUERY_LOG_SIZE`` entries, with:
+
+* a fingerprint of the SQL, with literals and placeholders replaced by ``?`` and
+  ``IN``/``VALUES`` lists collapsed, so the same query with different
+  arguments groups together;
+* the route that ran it and its request ID;
+* the shape of the bound parameters (types and list lengths, never values).
+
+The first time a fingerprint is slow, its plan is captured with ``EXPLAIN``
+(``EXPLAIN QUERY PLAN`` on SQLite), using the same parameters on the same
+connection. Plans are kept for the most recent ``SLOW_QUERY_MAX_FINGERPRINTS``
+fingerprints.
+
+Each worker keeps its own log; ``GET /api/diagnostics/slow-queries`` reports the
+worker that serves it.
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional
+
+from sqlalchemy import event
+
+from .middlewares.requestLogging import get_request_id, get_request_route
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_LOG_ENABLED = os.getenv("SLOW_QUERY_LOG_ENABLED", "true").lower() == "true"
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+SLOW_QUERY_LOG_SIZE = int(os.getenv("SLOW_QUERY_LOG_SIZE", "500"))
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "true").lower() == "true"
+SLOW_QUERY_MAX_FINGERPRINTS = int(os.getenv("SLOW_QUERY_MAX_FINGERPRINTS", "1000"))
+SLOW_QUERY_SORTS = ("total", "max", "count")
+EXPLAINABLE = ("select", "insert", "update", "delete", "with")
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|(?<!:):\w+|\$\d+|\?")
+_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_ROWS = re.compile(r"\(\?\)(?:\s*,\s*\(\?\))+")
+_WHITESPACE = re.compile(r"\s+")
+
+def fingerprint_sql(statement: str) -> str:
+    """Statement text with every value replaced by ``?``, e.g. ``... WHERE id IN (?)``"""
+    sql = _STRING_LITERAL.sub("?", statement)
+    sql = _PLACEHOLDER.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _LIST.sub("(?)", sql)
+    sql = _ROWS.sub("(?)", sql)
+    return _WHITESPACE.sub(" ", sql).strip()
+
+def _shape(value: Any) -> Any:
+    if isinstance(value, (list, tuple)):
+        return f"{type(value).__name__}[{len(value)}]"
+    return type(value).__name__
+
+def parameter_shapes(parameters: Any, executemany: bool) -> Any:
+    """Types of the bound parameters, without their values"""
+    if executemany:
+        rows = list(parameters or ())
+        return {"rows": len(rows), "row": parameter_shapes(rows[0], False) if rows else None}
+    if isinstance(parameters, dict):
+        return {key: _shape(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [_shape(value) for value in parameters]
+    return None if parameters is None else _shape(parameters)
+
+class SlowQueryLog:
+    def __init__(self, threshold_ms: float = SLOW_QUERY_MS, size: int = SLOW_QUERY_LOG_SIZE,
+                 explain: bool = SLOW_QUERY_EXPLAIN, max_fingerprints: int = SLOW_QUERY_MAX_FINGERPRINTS):
+        self.threshold = threshold_ms / 1000
+        self.explain = explain
+        self.max_fingerprints = max(1, max_fingerprints)
+        self.entries: Deque[Dict[str, Any]] = deque(maxlen=max(1, size))
+        # Fingerprint ID -> SQL and plan, least recently slow first
+        self.fingerprints: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.recorded = 0
+        self._lock = threading.Lock()
+
+    def install(self, engine) -> None:
+        dialect = engine.dialect.name
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def start_timer(conn, cursor, statement, parameters, context, executemany):
+            if context is not None:
+                context._slow_query_start = time.perf_counter()
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def record_slow(conn, cursor, statement, parameters, context, executemany):
+            start = getattr(context, "_slow_query_start", None)
+            if start is None:
+                return
+            duration = time.perf_counter() - start
+            if duration >= self.threshold:
+                self.record(dialect, cursor, statement, parameters, executemany, duration)
+
+    def record(self, dialect: str, cursor, statement: str, parameters: Any, executemany: bool,
+               duration: float) -> None:
+        sql = fingerprint_sql(statement)
+        fingerprint = hashlib.sha1(sql.encode("utf-8")).hexdigest()[:12]
+        entry = {
+            "at": datetime.utcnow().isoformat(),
+            "duration_ms": round(duration * 1000, 2),
+            "fingerprint": fingerprint,
+            "route": get_request_route(),
+            "request_id": get_request_id(),
+            "parameters": parameter_shapes(parameters, executemany),
+        }
+        with self._lock:
+            known = fingerprint in self.fingerprints
+            if known:
+                self.fingerprints.move_to_end(fingerprint)
+            else:
+                self.fingerprints[fingerprint] = {"sql": sql, "plan": None}
+                while len(self.fingerprints) > self.max_fingerprints:
+                    self.fingerprints.popitem(last=False)
+            self.entries.append(entry)
+            self.recorded += 1
+        logger.warning(
+            f"Slow query {fingerprint} took {entry['duration_ms']}ms"
+            f" ({entry['route'] or 'no request'}): {sql[:200]}"
+        )
+        if not known and self.explain and not executemany:
+            plan = self._explain(dialect, cursor, statement, parameters)
+            with self._lock:
+                if fingerprint in self.fingerprints:
+                    self.fingerprints[fingerprint]["plan"] = plan
+
+    def _explain(self, dialect: str, cursor, statement: str, parameters: Any) -> Optional[List[str]]:
+        if not statement.lstrip().lower().startswith(EXPLAINABLE):
+            return None
+        prefix = "EXPLAIN QUERY PLAN " if dialect == "sqlite" else "EXPLAIN "
+        # A separate cursor on the same connection, so the plan sees the same
+        # transaction and the caller's cursor keeps its results
+        explain_cursor = cursor.connection.cursor()
+        # On PostgreSQL a failed statement aborts the whole transaction; a savepoint
+        # keeps a failed EXPLAIN from affecting the caller
+        savepoint = dialect != "sqlite"
+        try:
+            if savepoint:
+                explain_cursor.execute("SAVEPOINT slow_query_explain")
+            explain_cursor.execute(prefix + statement, parameters)
+            rows = explain_cursor.fetchall()
+            if savepoint:
+                explain_cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+        except Exception as e:
+            if savepoint:
+                try:
+                    explain_cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+                except Exception:
+                    pass
+            logger.info(f"Could not explain slow query: {str(e)}")
+            return [f"EXPLAIN failed: {str(e)}"]
+        finally:
+            explain_cursor.close()
+        if dialect == "sqlite":
+            # (id, parent, notused, detail)
+            return [str(row[-1]) for row in rows]
+        return [str(row[0]) for row in rows]
+
+    def report(self, limit: int = 20, sort: str = "total") -> Dict[str, Any]:
+        """Slowest fingerprints in the buffer, with their plans and most recent occurrences"""
+        with self._lock:
+            entries = list(self.entries)
+            fingerprints = {key: dict(value) for key, value in self.fingerprints.items()}
+        groups: Dict[str, Dict[str, Any]] = {}
+        for entry in entries:
+            group = groups.get(entry["fingerprint"])
+            if group is None:
+                known = fingerprints.get(entry["fingerprint"], {})
+                group = groups[entry["fingerprint"]] = {
+                    "fingerprint": entry["fingerprint"],
+                    "sql": known.get("sql"),
+                    "plan": known.get("plan"),
+                    "count": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "routes": {},
+                    "last": None,
+                }
+            group["count"] += 1
+            group["total_ms"] += entry["duration_ms"]
+            group["max_ms"] = max(group["max_ms"], entry["duration_ms"])
+            route = entry["route"] or "(no request)"
+            group["routes"][route] = group["routes"].get(route, 0) + 1
+            group["last"] = entry
+
+        sort_key = {"total": "total_ms", "max": "max_ms", "count": "count"}[sort]
+        offenders = sorted(groups.values(), key=lambda group: group[sort_key], reverse=True)[:limit]
+        for group in offenders:
+            group["total_ms"] = round(group["total_ms"], 2)
+            group["mean_ms"] = round(group["total_ms"] / group["count"], 2)
+        return {
+            "threshold_ms": round(self.threshold * 1000, 2),
+            "buffered": len(entries),
+            "buffer_size": self.entries.maxlen,
+            "recorded": self.recorded,
+            "sort": sort,
+            "offenders": offenders,
+        }
+
+slow_query_log = SlowQueryLog()
+
+def install_slow_query_log(engine) -> None:
+    if SLOW_QUERY_LOG_ENABLED:
+        slow_query_log.install(engine)
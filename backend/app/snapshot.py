@@ -0,0 +1,298 @@
+"""Catalog snapshot shared by all workers through one memory-mapped file.
+
+The unfiltered material and service listings are served from a file that holds
+every material and service already serialized, exactly as the list endpoints would
+send them. Workers map the file read-only, so the catalog sits in the page cache
+once however many workers there are, and a page is a single slice of the file: no
+query for the rows, no ORM objects and no serialization per request.
+
+The file is tagged with the catalog change sequence and its epoch (see
+``app.catalog``). A request first reads the current sequence. If the mapped file
+does not match it, the request is answered from the database and a rebuild starts
+in the background. One worker at a time rebuilds, holding an exclusive ``flock`` on
+a lock file next to the snapshot; the others keep answering from the database until
+the new file appears. The new file is written under a temporary name and renamed
+over the old one, so readers see the old snapshot or the new one, never a partial
+file. Each worker notices the rename with one ``stat`` per request and maps the new
+file.
+
+Layout (little-endian)::
+
+    header    magic, sequence, epoch, then per kind the row count and the
+              position of its offsets table
+    body      each row as JSON followed by a comma, materials then services, by ID
+    offsets   per kind, count + 1 positions of its rows in the body
+
+Snapshots are per machine, like the payment notification sockets. Searched,
+filtered and sorted listings still query the database.
+"""
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+from array import array
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi.responses import Response
+from pydantic import TypeAdapter
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .catalog import current_sequence
+from .database import SessionLocal
+from .models import Material, Service
+from .schemas import Material as MaterialSchema, Service as ServiceSchema
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, every worker may rebuild
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+CATALOG_SNAPSHOT_ENABLED = os.getenv("CATALOG_SNAPSHOT_ENABLED", "true").lower() == "true"
+CATALOG_SNAPSHOT_DIR = os.getenv("CATALOG_SNAPSHOT_DIR", "/tmp/flooring-crm-catalog")
+# Rows read and serialized per step of a rebuild
+CATALOG_SNAPSHOT_BATCH_SIZE = 5000
+
+MAGIC = b"CATSNAP1"
+HEADER = struct.Struct("<8sQ16sQQQQ")
+OFFSET = struct.Struct("<Q")
+SNAPSHOT_KINDS = {
+    "materials": (Material, TypeAdapter(List[MaterialSchema])),
+    "services": (Service, TypeAdapter(List[ServiceSchema])),
+}
+
+def _epoch_bytes(epoch: Optional[str]) -> bytes:
+    return (epoch or "").encode("ascii")[:16].ljust(16, b"\0")
+
+def render_rows(adapter: TypeAdapter, rows) -> List[bytes]:
+    """Rows as the list endpoints send them: validated by the response schema, then
+    encoded the way ``JSONResponse`` does"""
+    items = adapter.dump_python(adapter.validate_python(rows, from_attributes=True), mode="json")
+    return [
+        json.dumps(item, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+        for item in items
+    ]
+
+def write_snapshot(db: Session, path: str) -> Dict[str, Any]:
+    """Serialize the catalog into a new file and rename it over ``path``"""
+    # The sequence is read before the rows, so the rows are at least that recent; a
+    # snapshot is only served while the sequence has not moved, i.e. when it is exact
+    sequence = current_sequence(db)
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".catalog-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(b"\0" * HEADER.size)
+            position = HEADER.size
+            offsets: Dict[str, array] = {}
+            for kind, (model, adapter) in SNAPSHOT_KINDS.items():
+                kind_offsets = offsets[kind] = array("Q", [position])
+                result = db.execute(select(model.__table__).order_by(model.id)).yield_per(CATALOG_SNAPSHOT_BATCH_SIZE)
+                for rows in result.partitions():
+                    for item in render_rows(adapter, rows):
+                        f.write(item)
+                        f.write(b",")
+                        position += len(item) + 1
+                        kind_offsets.append(position)
+            tables = {}
+            for kind, kind_offsets in offsets.items():
+                tables[kind] = (len(kind_offsets) - 1, position)
+                if sys.byteorder != "little":
+                    kind_offsets.byteswap()
+                f.write(kind_offsets.tobytes())
+                position += 8 * len(kind_offsets)
+            f.seek(0)
+            f.write(HEADER.pack(
+                MAGIC, sequence["value"], _epoch_bytes(sequence["epoch"]),
+                *tables["materials"], *tables["services"]
+            ))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    finally:
+        db.rollback()
+    return {
+        "sequence": sequence["value"],
+        "materials": tables["materials"][0],
+        "services": tables["services"][0],
+        "bytes": position,
+    }
+
+def read_header(path: str) -> Optional[Tuple[int, Optional[str]]]:
+    """(sequence, epoch) of the snapshot at ``path``, or ``None`` if there is no valid one"""
+    try:
+        with open(path, "rb") as f:
+            header = f.read(HEADER.size)
+    except FileNotFoundError:
+        return None
+    if len(header) < HEADER.size:
+        return None
+    magic, sequence, epoch, *_ = HEADER.unpack(header)
+    if magic != MAGIC:
+        return None
+    return sequence, epoch.rstrip(b"\0").decode("ascii") or None
+
+class _MappedSnapshot:
+    """One snapshot file mapped read-only"""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self.identity = os.fstat(f.fileno())
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.sequence, epoch, *tables = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            self.map.close()
+            raise ValueError(f"{path} is not a catalog snapshot")
+        self.epoch = epoch.rstrip(b"\0").decode("ascii") or None
+        self.tables = {"materials": tuple(tables[0:2]), "services": tuple(tables[2:4])}
+        self.size = len(self.map)
+
+    def matches(self, sequence: Dict[str, Any]) -> bool:
+        return self.sequence == sequence["value"] and self.epoch == sequence["epoch"]
+
+    def page(self, kind: str, skip: int, limit: int) -> bytes:
+        count, table = self.tables[kind]
+        start = min(skip, count)
+        end = min(skip + limit, count)
+        if start >= end:
+            return b"[]"
+        (first,) = OFFSET.unpack_from(self.map, table + 8 * start)
+        (last,) = OFFSET.unpack_from(self.map, table + 8 * end)
+        # Drop the comma after the last row of the page
+        return b"[" + self.map[first:last - 1] + b"]"
+
+class CatalogSnapshot:
+    def __init__(self, directory: str = CATALOG_SNAPSHOT_DIR, enabled: bool = CATALOG_SNAPSHOT_ENABLED,
+                 session_factory=SessionLocal):
+        self.directory = directory
+        self.path = os.path.join(directory, "catalog.snapshot")
+        self.lock_path = os.path.join(directory, ".catalog.lock")
+        self.enabled = enabled
+        self.session_factory = session_factory
+        self._current: Optional[_MappedSnapshot] = None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="catalog-snapshot")
+        self._build: Optional[Future] = None
+        self.hits = 0
+        self.misses = 0
+        self.builds = 0
+        self.last_build: Optional[Dict[str, Any]] = None
+        self.last_error: Optional[str] = None
+
+    def _load(self) -> Optional[_MappedSnapshot]:
+        """The newest snapshot on disk, remapped if another worker has replaced it"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        current = self._current
+        if current is not None and (current.identity.st_ino, current.identity.st_mtime_ns) == (stat.st_ino, stat.st_mtime_ns):
+            return current
+        try:
+            mapped = _MappedSnapshot(self.path)
+        except (OSError, ValueError, struct.error) as e:
+            logger.warning(f"Could not map catalog snapshot: {str(e)}")
+            return current
+        with self._lock:
+            previous, self._current = self._current, mapped
+            if previous is not None:
+                previous.map.close()
+        return mapped
+
+    def page(self, db: Session, kind: str, skip: int, limit: int) -> Optional[Tuple[int, bytes]]:
+        """(sequence, JSON array) of one page if the snapshot is current, else ``None``"""
+        if not self.enabled or skip < 0 or limit < 0:
+            return None
+        sequence = current_sequence(db)
+        snapshot = self._load()
+        if snapshot is not None and snapshot.matches(sequence):
+            with self._lock:
+                # The map stays open while it is sliced, even if another thread swaps it
+                if not snapshot.map.closed:
+                    self.hits += 1
+                    return snapshot.sequence, snapshot.page(kind, skip, limit)
+        self.misses += 1
+        self.schedule_build()
+        return None
+
+    def response(self, db: Session, kind: str, skip: int, limit: int) -> Optional[Response]:
+        served = self.page(db, kind, skip, limit)
+        if served is None:
+            return None
+        sequence, body = served
+        return Response(content=body, media_type="application/json", headers={"X-Catalog-Snapshot": str(sequence)})
+
+    def schedule_build(self) -> None:
+        """Rebuild in the background unless this worker is already rebuilding"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._build is not None and not self._build.done():
+                return
+            self._build = self._executor.submit(self.build)
+
+    def build(self) -> Optional[Dict[str, Any]]:
+        """Write a snapshot of the current catalog; ``None`` if another worker is writing
+        one or the file on disk is already current"""
+        os.makedirs(self.directory, exist_ok=True)
+        # Closing the lock file releases the flock
+        with open(self.lock_path, "a") as lock_file:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return None
+            db = self.session_factory()
+            try:
+                # Another worker may have written it since this build was scheduled
+                on_disk = read_header(self.path)
+                sequence = current_sequence(db)
+                if on_disk is not None and on_disk == (sequence["value"], sequence["epoch"]):
+                    return None
+                db.rollback()
+                started = time.perf_counter()
+                result = write_snapshot(db, self.path)
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"Could not build catalog snapshot: {str(e)}", exc_info=True)
+                return None
+            finally:
+                db.close()
+        result["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        self.builds += 1
+        self.last_build = result
+        self.last_error = None
+        logger.info(
+            f"Built catalog snapshot at sequence {result['sequence']}: {result['materials']} materials, "
+            f"{result['services']} services, {result['bytes']} bytes in {result['duration_ms']}ms"
+        )
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        snapshot = self._current
+        return {
+            "enabled": self.enabled,
+            "path": self.path,
+            "sequence": snapshot.sequence if snapshot is not None else None,
+            "materials": snapshot.tables["materials"][0] if snapshot is not None else None,
+            "services": snapshot.tables["services"][0] if snapshot is not None else None,
+            "bytes": snapshot.size if snapshot is not None else None,
+            "hits": self.hits,
+            "misses": self.misses,
+            "builds": self.builds,
+            "last_build": self.last_build,
+            "last_error": self.last_error,
+        }
+
+catalog_snapshot = CatalogSnapshot()
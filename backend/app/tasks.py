@@ -0,0 +1,67 @@
+"""Background job handlers, registered with the queue in ``app.jobs``."""
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict
+
+from sqlalchemy.orm import Session
+
+from .archive import PAYMENT_ARCHIVE_AFTER_DAYS, PAYMENT_ARCHIVE_INTERVAL_SECONDS, archive_payments, find_payment
+from .catalog import purge_tombstones
+from .jobs import enqueue, job_handler, maintenance_task
+from .models import Job, User
+
+logger = logging.getLogger(__name__)
+
+@job_handler("payments.completed")
+def payment_completed(db: Session, payload: Dict[str, Any]) -> None:
+    """Follow-up work for a completed payment, run after the response was sent"""
+    payment = find_payment(db, payload["payment_id"])
+    if not payment:
+        # Nothing to do for a payment that no longer exists; retrying will not help
+        logger.warning(f"Skipping follow-up for missing payment {payload['payment_id']}")
+        return
+    user = db.query(User).filter(User.id == payment.user_id).first()
+    
+    # In a real application, notify the payment processor's reconciliation API and
+    # email the customer their receipt here
+    logger.info(
+        f"Payment confirmation for {payment.payment_id} "
+        f"({payment.amount:.2f} {payment.currency}) sent to {user.email if user else 'unknown user'}"
+    )
+
+def queue_payment_archival(db: Session, delay_seconds: float = 0) -> Job:
+    """The queued archival run, moved up to ``delay_seconds`` from now, or a new one.
+
+    Reusing the queued run keeps a single archival cycle however often this is called.
+    """
+    run_at = datetime.utcnow() + timedelta(seconds=delay_seconds)
+    job = db.query(Job).filter(Job.task == "payments.archive", Job.status == "queued").order_by(Job.run_at).first()
+    if job is None:
+        return enqueue(db, "payments.archive", {}, delay_seconds=delay_seconds)
+    if job.run_at > run_at:
+        job.run_at = run_at
+    return job
+
+@job_handler("payments.archive")
+def archive_old_payments(db: Session, payload: Dict[str, Any]) -> None:
+    """Move a bounded number of old completed payments to the archive, then schedule the next run"""
+    if PAYMENT_ARCHIVE_AFTER_DAYS <= 0:
+        # Left over from before archival was disabled; end the cycle here
+        logger.info("Payment archival is disabled; not archiving or scheduling another run")
+        return
+    result = archive_payments(db)
+    # Right away while old payments remain
+    queue_payment_archival(db, 0 if result["remaining"] else PAYMENT_ARCHIVE_INTERVAL_SECONDS)
+
+@maintenance_task
+def schedule_payment_archival(db: Session) -> None:
+    """Start the archival cycle when no run is queued or running, e.g. on first start or after a dead job"""
+    if PAYMENT_ARCHIVE_AFTER_DAYS <= 0:
+        return
+    pending = db.query(Job.id).filter(Job.task == "payments.archive", Job.status.in_(("queued", "running"))).first()
+    if pending is None:
+        queue_payment_archival(db)
+        db.commit()
+
+# Catalog tombstones past CATALOG_TOMBSTONE_RETENTION_DAYS
+maintenance_task(purge_tombstones)
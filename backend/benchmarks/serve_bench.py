@@ -0,0 +1,195 @@
+"""Compare ``app.server`` configurations on the existing routes.
+
+    python benchmarks/serve_bench.py                       # every configuration below
+    python benchmarks/serve_bench.py --duration 5 --connections 32
+
+For each configuration the server is started on a scratch SQLite database, a few
+materials and an employee user are created, and each route is driven by a
+keep-alive HTTP/1.1 load generator for ``--duration`` seconds. Results are printed
+as a Markdown table (see ``README.md`` in this directory).
+
+The load generator runs on the same machine as the server, so absolute numbers
+understate a dedicated host; compare rows with each other.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from typing import Dict, List, Optional, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CONFIGURATIONS: List[Tuple[str, List[str]]] = [
+    ("uvloop + httptools, 1 worker", ["--workers", "1", "--loop", "uvloop", "--http", "httptools"]),
+    ("asyncio + h11, 1 worker", ["--workers", "1", "--loop", "asyncio", "--http", "h11"]),
+    ("uvloop + httptools, 2 workers", ["--workers", "2", "--loop", "uvloop", "--http", "httptools"]),
+    ("uvloop + httptools, 2 workers, preload", ["--workers", "2", "--preload"]),
+    ("uvloop + httptools, 1 worker, recycle every 2000", ["--workers", "1", "--max-requests", "2000"]),
+    ("uvloop + httptools, 2 workers, preload, recycle every 2000", ["--workers", "2", "--preload", "--max-requests", "2000", "--max-requests-jitter", "400"]),
+]
+# (label, path, authenticated, keep the connection open)
+ROUTES = [
+    ("GET /", "/", False, True),
+    ("GET /livez", "/livez", False, True),
+    ("GET /livez, new connection each request", "/livez", False, False),
+    ("GET /api/materials", "/api/materials?skip=0&limit=20", True, True),
+]
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _post(url: str, payload: dict, token: Optional[str] = None) -> dict:
+    headers = {"Content-Type": "application/json"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    request = urllib.request.Request(url, json.dumps(payload).encode(), headers, method="POST")
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return json.loads(response.read())
+
+def _wait_ready(base: str, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"{base}/readyz", timeout=2):
+                return
+        except Exception:
+            time.sleep(0.25)
+    raise RuntimeError(f"server at {base} did not become ready")
+
+def _seed(base: str) -> str:
+    suffix = time.time_ns()
+    token = _post(f"{base}/api/auth/register", {
+        "username": f"bench_{suffix}",
+        "email": f"bench_{suffix}@example.com",
+        "password": "Bench123!@#",
+        "role": "employee",
+    })["access_token"]
+    for i in range(20):
+        _post(f"{base}/api/materials", {
+            "name": f"Bench oak {i}", "description": "Benchmark material",
+            "price_per_unit": 10 + i, "unit": "sqft", "stock": 100 + i,
+        }, token)
+    return token
+
+async def _request(reader, writer, request: bytes) -> Tuple[int, bool]:
+    writer.write(request)
+    head = await reader.readuntil(b"\r\n\r\n")
+    status = int(head.split(b" ", 2)[1])
+    length = 0
+    close = False
+    for line in head.split(b"\r\n")[1:]:
+        name, _, value = line.partition(b":")
+        name = name.strip().lower()
+        if name == b"content-length":
+            length = int(value)
+        elif name == b"connection" and value.strip().lower() == b"close":
+            close = True
+    await reader.readexactly(length)
+    return status, close
+
+async def _connection(host: str, port: int, request: bytes, stop_at: float, latencies: List[float], errors: List[int]):
+    writer = None
+    while time.perf_counter() < stop_at:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            start = time.perf_counter()
+            status, close = await _request(reader, writer, request)
+            latencies.append(time.perf_counter() - start)
+            if status >= 400:
+                errors.append(status)
+        except (OSError, asyncio.IncompleteReadError):
+            # A recycled worker drops its connections; reconnect like a real client would
+            errors.append(0)
+            close = True
+            await asyncio.sleep(0.01)
+        if close and writer is not None:
+            writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+async def _drive(port: int, path: str, token: Optional[str], keep_alive: bool, connections: int,
+                 duration: float) -> Dict[str, float]:
+    headers = f"GET {path} HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\n"
+    if not keep_alive:
+        headers += "Connection: close\r\n"
+    if token:
+        headers += f"Authorization: Bearer {token}\r\n"
+    request = (headers + "\r\n").encode()
+    latencies: List[float] = []
+    errors: List[int] = []
+    stop_at = time.perf_counter() + duration
+    await asyncio.gather(*(
+        _connection("127.0.0.1", port, request, stop_at, latencies, errors) for _ in range(connections)
+    ))
+    latencies.sort()
+    return {
+        "rps": len(latencies) / duration,
+        "p50": statistics.median(latencies) * 1000 if latencies else 0.0,
+        "p99": latencies[int(len(latencies) * 0.99) - 1] * 1000 if latencies else 0.0,
+        "errors": len(errors),
+    }
+
+def run_configuration(label: str, server_args: List[str], args: argparse.Namespace) -> List[str]:
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory() as scratch:
+        env = {
+            **os.environ,
+            "DATABASE_URL": f"sqlite:///{scratch}/bench.db",
+            "SECRET_KEY": "benchmark",
+            "ENV": "test",
+            "RECEIPT_CACHE_DIR": f"{scratch}/receipts",
+        }
+        server = subprocess.Popen(
+            [sys.executable, "-m", "app.server", "--host", "127.0.0.1", "--port", str(port),
+             "--keepalive", str(args.keepalive), "--log-level", "warning", *server_args],
+            cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            _wait_ready(base)
+            token = _seed(base)
+            rows = []
+            for route_label, path, needs_auth, keep_alive in ROUTES:
+                route_token = token if needs_auth else None
+                asyncio.run(_drive(port, path, route_token, keep_alive, args.connections, 1.0))
+                result = asyncio.run(_drive(port, path, route_token, keep_alive, args.connections, args.duration))
+                rows.append(
+                    f"| {label} | {route_label} | {result['rps']:.0f} | {result['p50']:.1f} | "
+                    f"{result['p99']:.1f} | {result['errors']} |"
+                )
+                print(rows[-1], flush=True)
+            return rows
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per route")
+    parser.add_argument("--connections", type=int, default=16, help="concurrent keep-alive connections")
+    parser.add_argument("--keepalive", type=int, default=5, help="server keep-alive seconds")
+    parser.add_argument("--only", help="run only configurations whose label contains this text")
+    args = parser.parse_args()
+
+    print(f"{args.connections} keep-alive connections, {args.duration:.0f}s per route, {os.cpu_count()} CPU(s)\n")
+    print("| Configuration | Route | Requests/s | p50 ms | p99 ms | Errors |")
+    print("|---|---|---:|---:|---:|---:|")
+    for label, server_args in CONFIGURATIONS:
+        if args.only and args.only not in label:
+            continue
+        run_configuration(label, server_args, args)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,39 @@
+"""Shared test setup.
+
+Importing the app needs ``DATABASE_URL`` and ``SECRET_KEY``. Values from the
+environment or ``.env`` are used when present; otherwise the defaults below let
+the unit tests run with no configuration. The unit tests use their own databases
+(see ``engine``), and the endpoint tests talk to a running server.
+"""
+import os
+import tempfile
+
+from dotenv import load_dotenv
+
+load_dotenv()
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.gettempdir(), 'flooring-crm-test.db')}")
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+
+@pytest.fixture
+def engine(tmp_path):
+    """A fresh SQLite database file with every table created"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+@pytest.fixture
+def session_factory(engine):
+    return sessionmaker(bind=engine)
+
+@pytest.fixture
+def db(session_factory):
+    session = session_factory()
+    yield session
+    session.close()
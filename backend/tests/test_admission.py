@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+
+from app.middlewares.admission import ConcurrencyLimiter, Overloaded
+from app.middlewares.routeClasses import classify_request
+
+async def test_queued_requests_are_admitted_in_order():
+    """A released slot goes to the oldest waiter, not to a newcomer."""
+    limiter = ConcurrencyLimiter("test", concurrency=1, queue=4, max_wait_ms=1000)
+    await limiter.acquire()
+    order = []
+
+    async def waiter(name):
+        await limiter.acquire()
+        order.append(name)
+
+    tasks = [asyncio.create_task(waiter(name)) for name in ("first", "second")]
+    await asyncio.sleep(0)
+    limiter.release()
+    await asyncio.sleep(0.01)
+    limiter.release()
+    await asyncio.gather(*tasks)
+    assert order == ["first", "second"]
+    assert limiter.active == 1
+
+async def test_full_queue_is_shed_immediately():
+    limiter = ConcurrencyLimiter("test", concurrency=1, queue=0, max_wait_ms=1000)
+    await limiter.acquire()
+    with pytest.raises(Overloaded):
+        await limiter.acquire()
+    assert limiter.shed == 1
+
+async def test_wait_beyond_budget_is_shed():
+    """A queued request gives up once its wait budget is spent and frees its queue slot."""
+    limiter = ConcurrencyLimiter("test", concurrency=1, queue=1, max_wait_ms=20)
+    await limiter.acquire()
+    with pytest.raises(Overloaded):
+        await limiter.acquire()
+    assert limiter.timed_out == 1
+    limiter.release()
+    assert limiter.active == 0
+
+async def test_slow_service_time_sheds_before_queueing():
+    limiter = ConcurrencyLimiter("test", concurrency=1, queue=10, max_wait_ms=100)
+    await limiter.acquire()
+    limiter.service_time = 1.0
+    with pytest.raises(Overloaded):
+        await limiter.acquire()
+    assert limiter.shed == 1 and limiter.timed_out == 0
+
+def test_route_classification():
+    assert classify_request("POST", "/api/auth/login") == "auth"
+    assert classify_request("GET", "/api/materials") == "catalog_read"
+    assert classify_request("POST", "/api/materials") == "write"
+    assert classify_request("POST", "/api/payments/process") == "payments"
+    assert classify_request("POST", "/api/users/bulk") == "bulk"
+    assert classify_request("GET", "/api/jobs/stats") == "other"
+    # Probes and long-lived streams are never limited
+    assert classify_request("GET", "/readyz") is None
+    assert classify_request("GET", "/api/payments/pay_1/events") is None
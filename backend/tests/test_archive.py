@@ -0,0 +1,56 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import tasks
+from app.analytics import rebuild_rollups
+from app.archive import archive_payments, archive_stats, find_payment, find_payments, find_payments_by_reference
+from app.models import ArchivedPayment, Job, Payment, RevenueDaily, User
+
+@pytest.fixture
+def db(db):
+    db.add(User(id=1, username="buyer", email="buyer@example.com", hashed_password="x", role="customer"))
+    now = datetime.utcnow()
+    for i, (age_days, status) in enumerate([(400, "completed"), (500, "completed"), (600, "completed"),
+                                            (700, "pending"), (10, "completed")]):
+        created = now - timedelta(days=age_days)
+        db.add(Payment(payment_id=f"pay_{i}", amount=10.0 * (i + 1), currency="USD", status=status,
+                       created_at=created, updated_at=created, user_id=1, reference_id=f"INV-{i}",
+                       payment_data={"reference_id": f"INV-{i}"}))
+    db.commit()
+    return db
+
+def test_old_completed_payments_move_in_batches(db):
+    result = archive_payments(db, days=365, batch_size=2, max_batches=1)
+    assert (result["moved"], result["remaining"]) == (2, True)
+    result = archive_payments(db, days=365, batch_size=2, max_batches=5)
+    assert (result["moved"], result["remaining"]) == (1, False)
+
+    assert sorted(p.payment_id for p in db.query(ArchivedPayment)) == ["pay_0", "pay_1", "pay_2"]
+    # Pending payments stay hot whatever their age
+    assert sorted(p.payment_id for p in db.query(Payment)) == ["pay_3", "pay_4"]
+    archived = db.query(ArchivedPayment).filter(ArchivedPayment.payment_id == "pay_1").one()
+    assert (archived.id, archived.amount, archived.payment_data) == (2, 20.0, {"reference_id": "INV-1"})
+    assert archive_stats(db)["archived"] == 3
+
+def test_lookups_span_hot_and_archived_payments(db):
+    rebuild_rollups(db)
+    rollups_before = sorted((r.day, r.status, r.payment_count, r.total_amount) for r in db.query(RevenueDaily))
+    archive_payments(db, days=365)
+
+    assert find_payment(db, "pay_0", user_id=1).status == "completed"
+    assert find_payment(db, "pay_4").payment_id == "pay_4"
+    assert find_payment(db, "pay_0", user_id=2) is None
+    assert [p.payment_id for p in find_payments(db, {"user_id": 1}, limit=3)] == ["pay_4", "pay_0", "pay_1"]
+    assert [p.payment_id for p in find_payments_by_reference(db, ["INV-2", "INV-4"])] == ["pay_2", "pay_4"]
+
+    rebuild_rollups(db)
+    assert sorted((r.day, r.status, r.payment_count, r.total_amount) for r in db.query(RevenueDaily)) == rollups_before
+
+def test_disabled_archival_leaves_payments_and_ends_the_cycle(db, monkeypatch):
+    monkeypatch.setattr(tasks, "PAYMENT_ARCHIVE_AFTER_DAYS", 0)
+    tasks.archive_old_payments(db, {})
+    db.commit()
+    assert db.query(ArchivedPayment).count() == 0
+    assert db.query(Payment).count() == 5
+    assert db.query(Job).filter(Job.task == "payments.archive").count() == 0
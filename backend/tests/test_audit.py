@@ -0,0 +1,67 @@
+import time
+
+from sqlalchemy import create_engine
+
+from app.audit import AuditLog, audit_history
+from app.models import AuditEvent, User
+
+def employee():
+    return User(id=7, username="clerk", role="employee")
+
+def test_events_are_buffered_until_flushed(engine, db):
+    log = AuditLog(engine, flush_size=1000, flush_seconds=60)
+    for material_id in range(250):
+        log.record("material.create", "material", material_id, employee(), {"name": f"Oak {material_id}"})
+    assert db.query(AuditEvent).count() == 0
+    assert log.stats()["pending"] == 250
+
+    assert log.flush() == 250
+    events = db.query(AuditEvent).order_by(AuditEvent.id).all()
+    assert [event.object_id for event in events] == [str(i) for i in range(250)]
+    assert (events[0].actor_id, events[0].actor, events[0].details) == (7, "clerk", {"name": "Oak 0"})
+    assert log.stats()["pending"] == 0 and log.stats()["written"] == 250
+
+def test_flusher_writes_on_size_and_on_shutdown(engine, db):
+    log = AuditLog(engine, flush_size=5, flush_seconds=60)
+    log.start()
+    try:
+        for payment_id in range(5):
+            log.record("payment.process", "payment", f"pay_{payment_id}")
+        for _ in range(100):
+            if log.stats()["written"] == 5:
+                break
+            time.sleep(0.05)
+        assert log.stats()["written"] == 5
+        log.record("payment.verify", "payment", "pay_0")
+    finally:
+        log.stop()
+    assert db.query(AuditEvent).count() == 6
+
+def test_failed_flush_keeps_events_up_to_the_limit(tmp_path):
+    broken = create_engine(f"sqlite:///{tmp_path / 'missing' / 'audit.db'}")
+    log = AuditLog(broken, flush_size=2, flush_seconds=60, max_buffer=3)
+    for service_id in range(4):
+        log.record("service.delete", "service", service_id)
+    assert log.flush() == 0
+    stats = log.stats()
+    assert (stats["pending"], stats["dropped"], stats["failures"]) == (3, 1, 1)
+    assert stats["last_error"]
+
+def test_history_is_filtered_and_paginated_newest_first(engine, db):
+    log = AuditLog(engine)
+    for material_id in range(5):
+        log.record("material.create", "material", material_id, employee())
+    log.record("material.delete", "material", 3, employee())
+    log.record("service.create", "service", 3)
+    log.flush()
+
+    first = audit_history(db, object_type="material", limit=4)
+    assert [e["action"] for e in first["events"]] == ["material.delete"] + ["material.create"] * 3
+    assert [e["object_id"] for e in first["events"]] == ["3", "4", "3", "2"]
+    second = audit_history(db, object_type="material", limit=4, before=first["next_before"])
+    assert [e["object_id"] for e in second["events"]] == ["1", "0"]
+    assert second["next_before"] is None
+
+    history = audit_history(db, object_type="material", object_id="3")
+    assert [e["action"] for e in history["events"]] == ["material.delete", "material.create"]
+    assert audit_history(db, actor_id=7, action="service.create")["events"] == []
@@ -0,0 +1,73 @@
+from app import autocomplete
+from app.autocomplete import PrefixIndex, index_keys
+from app.catalog import next_change_seq, record_deletion
+from app.models import Material, Service
+
+def _names(results):
+    return [result["name"] for result in results]
+
+def test_names_and_later_words_are_keys():
+    assert index_keys("Red  Oak Oak Laminate") == ["red oak oak laminate", "oak", "laminate"]
+
+def test_prefix_search_updates_in_place():
+    index = PrefixIndex()
+    index.add("material", 1, "Red Oak Laminate")
+    index.add("material", 2, "White Oak Plank")
+    index.add("service", 1, "Oak Refinishing")
+
+    assert _names(index.search("oak")) == ["Oak Refinishing", "Red Oak Laminate", "White Oak Plank"]
+    assert _names(index.search("OAK L")) == ["Red Oak Laminate"]
+    assert index.search("oak", kind="service") == [{"kind": "service", "id": 1, "name": "Oak Refinishing"}]
+    assert len(index.search("oak", limit=2)) == 2
+
+    index.remove("material", 1)
+    index.add("material", 2, "White Ash Plank")
+    assert _names(index.search("oak")) == ["Oak Refinishing"]
+    assert index.stats()["keys"] == 5
+
+def test_memory_budget_drops_word_keys_first(db):
+    for i in range(50):
+        db.add(Material(name=f"Maple Plank {i}", change_seq=next_change_seq(db)))
+    db.commit()
+    full = PrefixIndex()
+    full.build(db)
+    # Room for every name, but not every word
+    index = PrefixIndex(max_bytes=full.stats()["memory_bytes"] - 2000)
+    index.build(db)
+    stats = index.stats()
+    assert stats["names"] == 50 and stats["dropped_keys"] > 0
+    assert stats["memory_bytes"] <= stats["max_bytes"]
+    assert len(index.search("maple", limit=50)) == 50
+
+def test_refresh_applies_other_workers_writes(db):
+    index = PrefixIndex()
+    index.build(db)
+    material = Material(name="Cork Tile", change_seq=next_change_seq(db))
+    db.add_all([material, Service(name="Cork Sealing", change_seq=next_change_seq(db))])
+    db.commit()
+    index.refresh(db, force=True)
+    assert _names(index.search("cork")) == ["Cork Sealing", "Cork Tile"]
+
+    db.delete(material)
+    record_deletion(db, "material", material.id)
+    db.commit()
+    index.refresh(db, force=True)
+    assert _names(index.search("cork")) == ["Cork Sealing"]
+    assert index.stats()["catalog_sequence"] == 3
+
+def test_bulk_changes_rebuild_in_the_background(db, session_factory, monkeypatch):
+    monkeypatch.setattr(autocomplete, "REBUILD_AFTER_CHANGES", 1)
+    index = PrefixIndex(session_factory=session_factory)
+    index.build(db)
+    db.add_all([Material(name=f"Slate  Tile {i}", change_seq=next_change_seq(db)) for i in range(3)])
+    db.commit()
+
+    # The lookup is answered from the current index while the new one is built
+    index.refresh(db, force=True)
+    assert index.search("slate") == []
+    index._build.result(timeout=10)
+    index.refresh(db)
+    assert _names(index.search("SLATE T")) == ["Slate Tile 0", "Slate Tile 1", "Slate Tile 2"]
+    assert index.stats()["catalog_sequence"] == 3
+    # Each name is stored once, shared by the sorted list and the lookup table
+    assert all(name is index.names[ref] for name, ref in zip(index.name_keys.keys, index.name_keys.refs))
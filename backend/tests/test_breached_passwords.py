@@ -0,0 +1,66 @@
+import random
+import string
+
+import pytest
+
+from app.middlewares.breachedPasswords import BloomFilter, build_filter, optimal_parameters
+
+@pytest.fixture
+def password_list(tmp_path):
+    rng = random.Random(1234)
+    passwords = [
+        "".join(rng.choices(string.ascii_letters + string.digits, k=12))
+        for _ in range(5000)
+    ]
+    path = tmp_path / "passwords.txt"
+    path.write_text("\n".join(passwords + ["Summer2024!", "Test123!@#"]) + "\n")
+    return path, passwords
+
+def test_filter_has_no_false_negatives(password_list, tmp_path):
+    """Every listed password must be reported as breached."""
+    source, passwords = password_list
+    output = tmp_path / "breached.bloom"
+    assert build_filter(str(source), str(output), fp_rate=0.01) == len(passwords) + 2
+    
+    bloom = BloomFilter(str(output))
+    try:
+        assert all(p in bloom for p in passwords), "Listed password not found in filter"
+        assert "Summer2024!" in bloom
+    finally:
+        bloom.close()
+
+def test_filter_false_positive_rate(password_list, tmp_path):
+    """Unlisted passwords should only match at roughly the configured rate."""
+    source, _ = password_list
+    output = tmp_path / "breached.bloom"
+    build_filter(str(source), str(output), fp_rate=0.01)
+    
+    bloom = BloomFilter(str(output))
+    try:
+        probes = [f"not-in-list-{i}" for i in range(20000)]
+        false_positives = sum(1 for p in probes if p in bloom)
+        assert false_positives / len(probes) < 0.02, "False-positive rate far above target"
+    finally:
+        bloom.close()
+
+def test_optimal_parameters():
+    """Filter sizing follows the standard Bloom filter formulas."""
+    num_bits, num_hashes = optimal_parameters(1_000_000, 0.001)
+    assert 14_000_000 < num_bits < 15_000_000
+    assert num_hashes == 10
+    with pytest.raises(ValueError):
+        optimal_parameters(10, 1.5)
+
+def test_rejects_invalid_file(tmp_path):
+    """Files that are not filters are refused instead of silently matching nothing."""
+    path = tmp_path / "bogus.bloom"
+    path.write_bytes(b"not a filter" * 10)
+    with pytest.raises(ValueError):
+        BloomFilter(str(path))
+
+@pytest.mark.parametrize("content", [b"", b"BLOOM"])
+def test_rejects_empty_or_truncated_file(tmp_path, content):
+    path = tmp_path / "short.bloom"
+    path.write_bytes(content)
+    with pytest.raises(ValueError):
+        BloomFilter(str(path))
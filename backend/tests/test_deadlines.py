@@ -0,0 +1,133 @@
+import asyncio
+import json
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from app.middlewares import deadlines
+from app.middlewares.deadlines import DeadlineExceeded, DeadlineMiddleware, RequestDeadline, install_deadline_hooks
+
+SLOW_QUERY = text(
+    "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 50000000) SELECT count(*) FROM n"
+)
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://")
+    install_deadline_hooks(engine)
+    yield engine
+    engine.dispose()
+
+def test_sqlite_statement_is_interrupted_at_deadline(engine):
+    """A query that outlives its request's budget is interrupted inside SQLite."""
+    state = RequestDeadline("catalog_read", 50)
+    token = deadlines._current.set(state)
+    try:
+        with engine.connect() as conn:
+            with pytest.raises(OperationalError, match="interrupted"):
+                conn.execute(SLOW_QUERY).scalar()
+    finally:
+        deadlines._current.reset(token)
+    assert state.expired
+
+def test_statement_after_deadline_is_refused(engine):
+    state = RequestDeadline("write", 1)
+    state.deadline -= 1
+    token = deadlines._current.set(state)
+    try:
+        with engine.connect() as conn:
+            with pytest.raises(DeadlineExceeded):
+                conn.execute(text("SELECT 1"))
+    finally:
+        deadlines._current.reset(token)
+
+def test_queries_outside_requests_are_not_limited(engine):
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT 1")).scalar() == 1
+
+def test_statement_timeout_is_resent_only_when_budget_moves():
+    state = RequestDeadline("write", 5000)
+    info = {}
+    assert deadlines._statement_timeout_ms(info, state, 5.0) == 5000
+    assert deadlines._statement_timeout_ms(info, state, 4.9) is None
+    assert deadlines._statement_timeout_ms(info, state, 4.7) == 4700
+    # Another request's deadline never reuses the timeout
+    assert deadlines._statement_timeout_ms(info, RequestDeadline("write", 5000), 4.7) == 4700
+
+def test_statement_timeout_is_forgotten_at_transaction_end():
+    engine = create_engine("sqlite://")
+    engine.dialect.name = "postgresql"
+    install_deadline_hooks(engine)
+    engine.dialect.name = "sqlite"
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+            conn.info[deadlines._TIMEOUT_SET] = (RequestDeadline("write", 5000), 5000)
+            conn.commit()
+            assert deadlines._TIMEOUT_SET not in conn.info
+            conn.execute(text("SELECT 1"))
+            conn.info[deadlines._TIMEOUT_SET] = (RequestDeadline("write", 5000), 5000)
+        with engine.connect() as conn:
+            assert deadlines._TIMEOUT_SET not in conn.info
+    finally:
+        engine.dispose()
+
+async def _call(app, path="/api/materials", method="GET"):
+    scope = {"type": "http", "method": method, "path": path, "headers": []}
+    sent = []
+    received = asyncio.Event()
+
+    async def receive():
+        if not received.is_set():
+            received.set()
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await asyncio.Event().wait()
+
+    async def send(message):
+        sent.append(message)
+
+    await DeadlineMiddleware(app)(scope, receive, send)
+    return sent
+
+async def test_expired_request_gets_consistent_timeout_response():
+    """Whatever error a handler produced after its deadline expired, the client sees a 504."""
+    async def handler_returning_500(scope, receive, send):
+        deadlines.current_deadline().expired = True
+        await send({"type": "http.response.start", "status": 500, "headers": []})
+        await send({"type": "http.response.body", "body": b"Error creating material"})
+
+    async def handler_raising(scope, receive, send):
+        deadlines.current_deadline().expired = True
+        raise OperationalError("SELECT", {}, Exception("interrupted"))
+
+    for handler in (handler_returning_500, handler_raising):
+        sent = await _call(handler)
+        assert [m["type"] for m in sent] == ["http.response.start", "http.response.body"]
+        assert sent[0]["status"] == 504
+        assert json.loads(sent[1]["body"])["message"] == "Request timed out"
+
+async def test_responses_within_deadline_pass_through():
+    async def handler(scope, receive, send):
+        message = await receive()
+        assert message["type"] == "http.request"
+        await send({"type": "http.response.start", "status": 500, "headers": []})
+        await send({"type": "http.response.body", "body": b"boom"})
+
+    sent = await _call(handler)
+    assert sent[0]["status"] == 500 and sent[1]["body"] == b"boom"
+
+async def test_bulk_provisioning_outlives_the_write_deadline(engine):
+    """A bulk batch still inserts its users after running longer than a plain write may."""
+    async def bulk_handler(scope, receive, send):
+        state = deadlines.current_deadline()
+        assert state.route_class == "bulk"
+        # Hashing the batch's passwords took longer than the whole write budget
+        state.deadline -= deadlines.DEADLINES_MS["write"] / 1000 + 1
+        with engine.connect() as conn:
+            assert conn.execute(text("SELECT 1")).scalar() == 1
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"{}"})
+
+    sent = await _call(bulk_handler, "/api/users/bulk", method="POST")
+    assert sent[0]["status"] == 200
@@ -32,6 +32,8 @@ def make_request(method: str, endpoint: str, data: Optional[Dict[Any, Any]] = No
                 response = requests.post(url, data=form_data, headers=default_headers)
             else:
                 response = requests.post(url, json=data, headers=default_headers)
+        elif method.upper() == "PUT":
+            response = requests.put(url, json=data, headers=default_headers)
         elif method.upper() == "DELETE":
             response = requests.delete(url, headers=default_headers)
         else:
@@ -88,6 +90,21 @@ def test_health_check():
     assert response.status_code == 200, "Health check failed"
     assert response.json()["status"] == "healthy", "Health check status not healthy"
 
+def test_liveness_and_readiness():
+    """Test the liveness and readiness probes."""
+    live_response = make_request("GET", "/livez")
+    assert live_response.status_code == 200, "Liveness probe failed"
+    assert live_response.json()["status"] == "alive"
+    
+    ready_response = make_request("GET", "/readyz")
+    assert ready_response.status_code == 200, "Readiness probe failed"
+    assert ready_response.json()["status"] == "ready"
+    
+    health = make_request("GET", "/healthz").json()
+    assert health["database"]["type"] in ("sqlite", "postgresql"), "Database type not reported"
+    assert "checkedout" in health["database"]["pool"], "Pool occupancy not reported"
+    assert health["database"]["latency_ms"] is not None, "Probe latency not reported"
+
 def test_password_validation():
     """Test password validation during registration."""
     invalid_data = {
@@ -203,3 +220,686 @@ def test_service_management(auth_token):
         headers=auth_headers
     )
     assert delete_response.status_code == 204, "Failed to delete service"
+
+def test_refresh_token_rotation():
+    """Test refresh token rotation, reuse detection and logout."""
+    suffix = int(time.time() * 1000)
+    register_response = make_request(
+        "POST",
+        "/api/auth/register",
+        data={
+            "username": f"refresh_{suffix}",
+            "email": f"refresh_{suffix}@example.com",
+            "password": "Test123!@#",
+            "role": "customer"
+        },
+        headers={"Content-Type": "application/json"}
+    )
+    assert register_response.ok, "Failed to register test user"
+    first_refresh = register_response.json()["refresh_token"]
+    assert first_refresh, "Refresh token missing from registration response"
+    
+    # Rotate once
+    refresh_response = make_request(
+        "POST",
+        "/api/auth/refresh",
+        data={"refresh_token": first_refresh},
+        headers={"Content-Type": "application/json"}
+    )
+    assert refresh_response.ok, "Failed to refresh access token"
+    second_refresh = refresh_response.json()["refresh_token"]
+    assert second_refresh != first_refresh, "Refresh token was not rotated"
+    
+    me_response = make_request(
+        "GET",
+        "/api/auth/me",
+        headers={"Authorization": f"Bearer {refresh_response.json()['access_token']}"}
+    )
+    assert me_response.ok, "Refreshed access token rejected"
+    
+    # Replaying the rotated token revokes the whole family
+    reuse_response = make_request(
+        "POST",
+        "/api/auth/refresh",
+        data={"refresh_token": first_refresh},
+        headers={"Content-Type": "application/json"}
+    )
+    assert reuse_response.status_code == 401, "Refresh token reuse not detected"
+    revoked_response = make_request(
+        "POST",
+        "/api/auth/refresh",
+        data={"refresh_token": second_refresh},
+        headers={"Content-Type": "application/json"}
+    )
+    assert revoked_response.status_code == 401, "Token family not revoked after reuse"
+
+def test_logout_revokes_refresh_token():
+    """Test that logout revokes the session's refresh token."""
+    suffix = int(time.time() * 1000)
+    register_response = make_request(
+        "POST",
+        "/api/auth/register",
+        data={
+            "username": f"logout_{suffix}",
+            "email": f"logout_{suffix}@example.com",
+            "password": "Test123!@#",
+            "role": "customer"
+        },
+        headers={"Content-Type": "application/json"}
+    )
+    assert register_response.ok, "Failed to register test user"
+    refresh_token = register_response.json()["refresh_token"]
+    
+    logout_response = requests.post(
+        f"{BASE_URL}/api/auth/logout",
+        json={"refresh_token": refresh_token},
+        headers={"Origin": FRONTEND_ORIGIN}
+    )
+    assert logout_response.status_code == 204, "Failed to log out"
+    
+    refresh_response = make_request(
+        "POST",
+        "/api/auth/refresh",
+        data={"refresh_token": refresh_token},
+        headers={"Content-Type": "application/json"}
+    )
+    assert refresh_response.status_code == 401, "Refresh token still valid after logout"
+
+def test_bulk_user_provisioning(auth_token):
+    """Test bulk user provisioning with per-user results."""
+    suffix = int(time.time() * 1000)
+    users = [
+        {"username": f"bulk_a_{suffix}", "email": f"bulk_a_{suffix}@example.com", "password": "Test123!@#"},
+        {"username": f"bulk_b_{suffix}", "email": f"bulk_b_{suffix}@example.com", "password": "Test123!@#", "role": "employee"},
+        {"username": f"bulk_a_{suffix}", "email": f"bulk_c_{suffix}@example.com", "password": "Test123!@#"},
+        {"username": f"bulk_d_{suffix}", "email": f"bulk_d_{suffix}@example.com", "password": "weakpassword"},
+        {"username": "x", "email": "not-an-email", "password": "Test123!@#"},
+        {"username": 123, "email": f"bulk_e_{suffix}@example.com", "password": "Test123!@#"}
+    ]
+    response = make_request(
+        "POST",
+        "/api/users/bulk",
+        data={"users": users},
+        headers={"Authorization": f"Bearer {auth_token}", "Content-Type": "application/json"}
+    )
+    assert response.ok, "Bulk provisioning failed"
+    data = response.json()
+    assert data["created"] == 2, "Expected two users to be created"
+    assert data["failed"] == 4, "Expected four users to fail"
+    statuses = [result["status"] for result in data["results"]]
+    assert statuses == ["created", "created", "error", "error", "error", "error"], "Unexpected per-user results"
+    assert all(result["errors"] for result in data["results"][2:]), "Failed users missing error details"
+    assert data["results"][5]["username"] is None, "Non-string username should not be echoed"
+    
+    # Re-submitting reports existing accounts instead of failing the batch
+    retry = make_request(
+        "POST",
+        "/api/users/bulk",
+        data={"users": users[:2]},
+        headers={"Authorization": f"Bearer {auth_token}", "Content-Type": "application/json"}
+    )
+    assert retry.ok, "Bulk provisioning retry failed"
+    assert retry.json()["created"] == 0, "Existing users were created twice"
+    
+    # Provisioned users can log in
+    login_response = make_request(
+        "POST",
+        "/api/auth/login",
+        data={"username": users[0]["username"], "password": users[0]["password"]},
+        headers={"Content-Type": "application/x-www-form-urlencoded"}
+    )
+    assert login_response.ok, "Provisioned user cannot log in"
+
+def test_payment_follow_up_job(auth_token):
+    """Test that processing a payment enqueues a follow-up job that completes."""
+    auth_headers = {
+        "Authorization": f"Bearer {auth_token}",
+        "Content-Type": "application/json"
+    }
+    payment_response = make_request(
+        "POST",
+        "/api/payments/process",
+        data={"source_id": "test_source", "amount": 25.00, "currency": "USD"},
+        headers=auth_headers
+    )
+    assert payment_response.ok, "Failed to process payment"
+    
+    stats = None
+    for _ in range(20):
+        stats = make_request("GET", "/api/jobs/stats", headers=auth_headers).json()
+        if stats["by_task"].get("payments.completed", {}).get("succeeded"):
+            break
+        time.sleep(0.25)
+    assert stats["by_task"]["payments.completed"]["succeeded"] >= 1, "Follow-up job did not complete"
+    assert stats["depth"]["dead"] == 0, "Follow-up job was dead-lettered"
+    assert stats["recent"]["wait"]["avg_ms"] is not None, "Job latency not reported"
+
+def test_payment_receipt(auth_token):
+    """Test receipt rendering, caching headers and range requests."""
+    auth_headers = {
+        "Authorization": f"Bearer {auth_token}",
+        "Content-Type": "application/json"
+    }
+    payment_response = make_request(
+        "POST",
+        "/api/payments/process",
+        data={"source_id": "test_source", "amount": 42.50, "currency": "EUR", "reference_id": "receipt_test"},
+        headers=auth_headers
+    )
+    assert payment_response.ok, "Failed to process payment"
+    receipt_url = payment_response.json()["receipt_url"]
+    assert receipt_url.endswith("/receipt"), "Receipt URL does not point at the receipt endpoint"
+    path = f"/api/payments/{payment_response.json()['payment_id']}/receipt"
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    
+    html_response = requests.get(f"{BASE_URL}{path}", headers=headers)
+    assert html_response.status_code == 200, "Failed to fetch HTML receipt"
+    assert "42.50 EUR" in html_response.text, "Receipt missing payment amount"
+    etag = html_response.headers["etag"]
+    
+    cached_response = requests.get(f"{BASE_URL}{path}", headers={**headers, "If-None-Match": etag})
+    assert cached_response.status_code == 304, "Unchanged receipt not revalidated"
+    
+    range_response = requests.get(f"{BASE_URL}{path}", headers={**headers, "Range": "bytes=0-14"})
+    assert range_response.status_code == 206, "Range request not honoured"
+    assert range_response.content == b"<!DOCTYPE html>", "Wrong byte range returned"
+    
+    pdf_response = requests.get(f"{BASE_URL}{path}?format=pdf", headers=headers)
+    assert pdf_response.status_code == 200, "Failed to fetch PDF receipt"
+    assert pdf_response.headers["content-type"] == "application/pdf"
+    assert pdf_response.content.startswith(b"%PDF-1.4"), "PDF receipt is not a PDF"
+
+def test_payment_status_stream(auth_token):
+    """Test the Server-Sent Events payment status stream."""
+    auth_headers = {
+        "Authorization": f"Bearer {auth_token}",
+        "Content-Type": "application/json"
+    }
+    payment_response = make_request(
+        "POST",
+        "/api/payments/process",
+        data={"source_id": "test_source", "amount": 10.00, "currency": "USD"},
+        headers=auth_headers
+    )
+    assert payment_response.ok, "Failed to process payment"
+    payment_id = payment_response.json()["payment_id"]
+    
+    # A completed payment produces one status event and the stream ends
+    stream_response = requests.get(
+        f"{BASE_URL}/api/payments/{payment_id}/events",
+        headers={"Authorization": f"Bearer {auth_token}"},
+        stream=True,
+        timeout=10
+    )
+    assert stream_response.status_code == 200, "Failed to open status stream"
+    assert stream_response.headers["content-type"].startswith("text/event-stream")
+    body = stream_response.text
+    assert "event: status" in body, "Status event missing"
+    assert '"status": "completed"' in body, "Completed status missing from stream"
+    
+    missing_response = requests.get(
+        f"{BASE_URL}/api/payments/does_not_exist/events",
+        headers={"Authorization": f"Bearer {auth_token}"},
+        timeout=10
+    )
+    assert missing_response.status_code == 404, "Unknown payment should return 404"
+
+def test_catalog_delta_sync(auth_token):
+    """Test incremental catalog sync with change sequence numbers and tombstones."""
+    auth_headers = {
+        "Authorization": f"Bearer {auth_token}",
+        "Content-Type": "application/json"
+    }
+    full_sync = make_request("GET", "/api/catalog/changes?since=0", headers=auth_headers)
+    assert full_sync.status_code == 200, "Full sync failed"
+    since = full_sync.json()["next_since"]
+    
+    # Nothing changed yet
+    empty = make_request("GET", f"/api/catalog/changes?since={since}", headers=auth_headers)
+    assert empty.status_code == 200
+    assert empty.json()["materials"] == [] and empty.json()["deleted"] == []
+    
+    created = make_request(
+        "POST",
+        "/api/materials",
+        data={
+            "name": f"Delta Oak {time.time_ns()}",
+            "description": "Oak planks for delta sync",
+            "price_per_unit": 4.25,
+            "unit": "sq ft",
+            "stock": 40
+        },
+        headers=auth_headers
+    )
+    assert created.status_code == 200, "Failed to create material"
+    material_id = created.json()["id"]
+    
+    delta = make_request("GET", f"/api/catalog/changes?since={since}", headers=auth_headers).json()
+    assert [m["id"] for m in delta["materials"]] == [material_id], "Delta should contain only the new material"
+    assert delta["next_since"] > since
+    since = delta["next_since"]
+    
+    deleted = make_request("DELETE", f"/api/materials/{material_id}", headers=auth_headers)
+    assert deleted.status_code == 204, "Failed to delete material"
+    
+    delta = make_request("GET", f"/api/catalog/changes?since={since}", headers=auth_headers).json()
+    assert delta["materials"] == []
+    assert [(d["kind"], d["id"]) for d in delta["deleted"]] == [("material", material_id)], "Tombstone missing"
+    
+    # A sequence number from the future means the client synced against another database
+    expired = make_request("GET", f"/api/catalog/changes?since={delta['next_since'] + 1000}", headers=auth_headers)
+    assert expired.status_code == 410, "Unknown sequence should require a full sync"
+
+def test_request_id_header():
+    """Test that every response carries a request ID and echoes a valid caller-supplied one."""
+    response = make_request("GET", "/")
+    assert response.status_code == 200
+    generated = response.headers.get("X-Request-ID")
+    assert generated, "Response is missing X-Request-ID"
+    assert make_request("GET", "/").headers["X-Request-ID"] != generated, "Request IDs should be unique"
+    
+    echoed = make_request("GET", "/", headers={"X-Request-ID": "client-abc.123"})
+    assert echoed.headers["X-Request-ID"] == "client-abc.123"
+    
+    # Unsafe values are replaced rather than copied into logs and headers
+    rejected = make_request("GET", "/", headers={"X-Request-ID": "bad id\twith spaces"})
+    assert rejected.headers["X-Request-ID"] != "bad id\twith spaces"
+
+def test_revenue_analytics(auth_token):
+    """Test revenue rollups and currency normalization."""
+    auth_headers = {
+        "Authorization": f"Bearer {auth_token}",
+        "Content-Type": "application/json"
+    }
+    today = time.strftime("%Y-%m-%d", time.gmtime())
+    report_path = f"/api/analytics/revenue?start={today}&end={today}&group_by=total"
+    
+    before = make_request("GET", report_path, headers=auth_headers)
+    assert before.status_code == 200, "Failed to load revenue report"
+    usd_before = before.json()["totals"].get("USD", {"count": 0, "total": 0})
+    
+    payment_response = make_request(
+        "POST",
+        "/api/payments/process",
+        data={"source_id": "test_source", "amount": 12.50, "currency": "USD"},
+        headers=auth_headers
+    )
+    assert payment_response.ok, "Failed to process payment"
+    
+    after = make_request("GET", report_path, headers=auth_headers).json()
+    assert after["totals"]["USD"]["count"] == usd_before["count"] + 1
+    assert abs(after["totals"]["USD"]["total"] - usd_before["total"] - 12.50) < 0.001
+    # Completed payments no longer count as pending
+    all_statuses = make_request("GET", f"{report_path}&status=all", headers=auth_headers).json()
+    assert all_statuses["by_status"].get("pending", {}).get("USD", {"count": 0})["count"] == 0
+    
+    # Normalizing needs a rate for every currency involved
+    missing_rate = make_request("GET", f"{report_path}&currency=JPY", headers=auth_headers)
+    assert missing_rate.status_code == 400, "Normalization without a rate should fail"
+    
+    rates = {code: 2.0 for code in after["totals"] if code != "USD"}
+    rates["JPY"] = 0.01
+    for code, rate in rates.items():
+        rate_response = make_request("PUT", f"/api/analytics/exchange-rates/{code}", data={"rate_to_usd": rate}, headers=auth_headers)
+        assert rate_response.status_code == 200, "Failed to set exchange rate"
+    # The base currency is fixed at 1, and only ISO codes are accepted
+    for code in ("USD", "EURO", "E1R", "ab"):
+        rate_response = make_request("PUT", f"/api/analytics/exchange-rates/{code}", data={"rate_to_usd": 2.0}, headers=auth_headers)
+        assert rate_response.status_code == 400, f"Exchange rate for {code} should be rejected"
+    rates["USD"] = 1.0
+    normalized = make_request("GET", f"{report_path}&currency=JPY", headers=auth_headers).json()
+    assert list(normalized["totals"]) == ["JPY"]
+    expected = sum(totals["total"] * rates[code] for code, totals in after["totals"].items()) / 0.01
+    assert abs(normalized["totals"]["JPY"]["total"] - expected) < 0.1
+    
+    invalid = make_request("GET", f"/api/analytics/revenue?start={today}&end=2000-01-01", headers=auth_headers)
+    assert invalid.status_code == 400, "End before start should be rejected"
+
+def test_inventory_report(auth_token):
+    """Test inventory valuation and the low-stock report, including cache invalidation."""
+    auth_headers = {
+        "Authorization": f"Bearer {auth_token}",
+        "Content-Type": "application/json"
+    }
+    report_path = "/api/inventory/report?top=5&low_stock_threshold=3"
+    before = make_request("GET", report_path, headers=auth_headers)
+    assert before.status_code == 200, "Failed to load inventory report"
+    before = before.json()
+    assert make_request("GET", report_path, headers=auth_headers).json()["cached"] is True
+    
+    unit = f"crate{time.time_ns() % 10**12}"
+    created = make_request(
+        "POST",
+        "/api/materials",
+        data={
+            "name": f"Report Slate {time.time_ns()}",
+            "description": "Slate tiles for the inventory report",
+            "price_per_unit": 2.5,
+            "unit": unit,
+            "stock": 2
+        },
+        headers=auth_headers
+    )
+    assert created.status_code == 200, "Failed to create material"
+    material_id = created.json()["id"]
+    
+    # The catalog write invalidates the cached report
+    after = make_request("GET", report_path, headers=auth_headers).json()
+    assert after["cached"] is False
+    assert after["totals"]["skus"] == before["totals"]["skus"] + 1
+    assert abs(after["totals"]["valuation"] - before["totals"]["valuation"] - 5.0) < 0.001
+    assert {"unit": unit, "skus": 1, "units_in_stock": 2, "valuation": 5.0} in after["by_unit"]
+    assert material_id in [item["id"] for item in after["low_stock"]["items"]]
+    assert after["low_stock"]["count"] == before["low_stock"]["count"] + 1
+    
+    make_request("DELETE", f"/api/materials/{material_id}", headers=auth_headers)
+    assert make_request("GET", report_path, headers=auth_headers).json()["totals"] == before["totals"]
+
+def test_payment_lookup_and_reconciliation(auth_token):
+    """Test indexed payment lookup and batch reconciliation by reference_id."""
+    auth_headers = {
+        "Authorization": f"Bearer {auth_token}",
+        "Content-Type": "application/json"
+    }
+    reference_id = f"stmt-{time.time_ns()}"
+    payment_response = make_request(
+        "POST",
+        "/api/payments/process",
+        data={
+            "source_id": "test_source",
+            "amount": 30.00,
+            "currency": "USD",
+            "customer_id": "cust-reconcile",
+            "reference_id": reference_id
+        },
+        headers=auth_headers
+    )
+    assert payment_response.ok, "Failed to process payment"
+    assert payment_response.json()["reference_id"] == reference_id
+    
+    lookup = make_request("GET", f"/api/payments/lookup?reference_id={reference_id}", headers=auth_headers)
+    assert lookup.status_code == 200, "Lookup failed"
+    assert [p["payment_id"] for p in lookup.json()] == [payment_response.json()["payment_id"]]
+    assert make_request("GET", "/api/payments/lookup", headers=auth_headers).status_code == 400
+    
+    reconcile_response = make_request(
+        "POST",
+        "/api/payments/reconcile",
+        data={"items": [
+            {"reference_id": reference_id, "amount": 30.00, "currency": "USD"},
+            {"reference_id": reference_id, "amount": 31.00},
+            {"reference_id": f"{reference_id}-unknown"}
+        ]},
+        headers=auth_headers
+    )
+    assert reconcile_response.status_code == 200, "Reconciliation failed"
+    result = reconcile_response.json()
+    assert (result["matched"], result["mismatch"], result["missing"]) == (1, 1, 1)
+    assert [r["status"] for r in result["results"]] == ["matched", "mismatch", "missing"]
+
+def test_request_profiling(auth_token):
+    """Test profiling a request with a profile token, then listing and downloading it."""
+    auth_headers = {
+        "Authorization": f"Bearer {auth_token}",
+        "Content-Type": "application/json"
+    }
+    token_response = make_request("POST", "/api/profiles/token?minutes=5", headers=auth_headers)
+    assert token_response.status_code == 200, "Failed to create profile token"
+    profile_token = token_response.json()["token"]
+    # A profile token is not a login, so it cannot mint more tokens or read anything
+    as_bearer = {"Authorization": f"Bearer {profile_token}", "Content-Type": "application/json"}
+    assert make_request("GET", "/api/profiles", headers=as_bearer).status_code == 401
+    assert make_request("POST", "/api/profiles/token", headers=as_bearer).status_code == 401
+    
+    unprofiled = make_request("GET", "/api/materials", headers=auth_headers)
+    assert "X-Profile-ID" not in unprofiled.headers
+    forged = make_request("GET", "/api/materials", headers={**auth_headers, "X-Profile-Token": auth_token})
+    assert "X-Profile-ID" not in forged.headers
+    
+    profiled = make_request("GET", "/api/materials", headers={**auth_headers, "X-Profile-Token": profile_token})
+    assert profiled.status_code == 200
+    profile_id = profiled.headers["X-Profile-ID"]
+    
+    listed = make_request("GET", "/api/profiles", headers=auth_headers).json()["profiles"]
+    entry = next(p for p in listed if p["id"] == profile_id)
+    assert (entry["method"], entry["path"], entry["status_code"]) == ("GET", "/api/materials", 200)
+    assert entry["trigger"] == "token" and entry["request_id"] == profiled.headers["X-Request-ID"]
+    
+    document = make_request("GET", f"/api/profiles/{profile_id}", headers=auth_headers).json()
+    profile = document["profiles"][0]
+    assert profile["type"] == "sampled"
+    assert len(profile["samples"]) == len(profile["weights"]) == entry["samples"]
+    assert all(index < len(document["shared"]["frames"]) for stack in profile["samples"] for index in stack)
+    assert make_request("GET", "/api/profiles/0000000000000-00000000", headers=auth_headers).status_code == 404
+
+def test_slow_query_report(auth_token):
+    """Test the employee-only slow-query report."""
+    auth_headers = {
+        "Authorization": f"Bearer {auth_token}",
+        "Content-Type": "application/json"
+    }
+    response = make_request("GET", "/api/diagnostics/slow-queries?limit=5&sort=max", headers=auth_headers)
+    assert response.status_code == 200, "Failed to load slow-query report"
+    report = response.json()
+    assert report["sort"] == "max" and report["threshold_ms"] > 0
+    assert len(report["offenders"]) <= 5
+    assert report["buffered"] <= report["buffer_size"]
+    
+    invalid = make_request("GET", "/api/diagnostics/slow-queries?sort=fastest", headers=auth_headers)
+    assert invalid.status_code == 400
+
+def test_material_filters_and_facets(auth_token):
+    """Test material filters, sorting and facet counts."""
+    auth_headers = {
+        "Authorization": f"Bearer {auth_token}",
+        "Content-Type": "application/json"
+    }
+    unit = f"pallet{time.time_ns() % 10**12}"
+    material_ids = []
+    for price, stock in ((3.0, 0), (12.0, 40), (60.0, 5)):
+        created = make_request(
+            "POST",
+            "/api/materials",
+            data={
+                "name": f"Facet Oak {price} {time.time_ns()}",
+                "description": "Oak planks for the facet test",
+                "price_per_unit": price,
+                "unit": unit,
+                "stock": stock
+            },
+            headers=auth_headers
+        )
+        assert created.status_code == 200, "Failed to create material"
+        material_ids.append(created.json()["id"])
+    
+    by_price = make_request("GET", f"/api/materials?unit={unit}&sort=-price", headers=auth_headers).json()
+    assert [m["id"] for m in by_price] == material_ids[::-1]
+    in_stock = make_request("GET", f"/api/materials?unit={unit}&in_stock=true&sort=stock", headers=auth_headers).json()
+    assert [m["id"] for m in in_stock] == [material_ids[2], material_ids[1]]
+    ranged = make_request("GET", f"/api/materials?unit={unit}&min_price=10&max_price=60&min_stock=10", headers=auth_headers).json()
+    assert [m["id"] for m in ranged] == [material_ids[1]]
+    
+    facets = make_request("GET", f"/api/materials/facets?unit={unit}&max_price=20", headers=auth_headers).json()
+    assert facets["total"] == 2
+    # Each facet ignores its own filter: all three prices, and the unit count within the price range
+    assert sum(bucket["count"] for bucket in facets["price_buckets"]) == 3
+    assert {"unit": unit, "count": 2} in facets["units"]
+    
+    assert make_request("GET", "/api/materials?sort=colour", headers=auth_headers).status_code == 400
+    assert make_request("GET", "/api/materials?min_price=5&max_price=1", headers=auth_headers).status_code == 400
+    for material_id in material_ids:
+        make_request("DELETE", f"/api/materials/{material_id}", headers=auth_headers)
+
+def test_catalog_autocomplete(auth_token):
+    """Test name autocomplete, including materials created and deleted since startup."""
+    auth_headers = {
+        "Authorization": f"Bearer {auth_token}",
+        "Content-Type": "application/json"
+    }
+    word = f"zebrawood{time.time_ns() % 10**9}"
+    created = make_request(
+        "POST",
+        "/api/materials",
+        data={
+            "name": f"Striped {word.capitalize()} Plank",
+            "description": "Exotic planks for the autocomplete test",
+            "price_per_unit": 9.5,
+            "unit": "sqft",
+            "stock": 12
+        },
+        headers=auth_headers
+    )
+    assert created.status_code == 200, "Failed to create material"
+    material_id = created.json()["id"]
+    
+    response = make_request("GET", f"/api/catalog/autocomplete?q={word[:8].upper()}&limit=50", headers=auth_headers)
+    assert response.status_code == 200, "Failed to autocomplete"
+    assert {"kind": "material", "id": material_id, "name": f"Striped {word.capitalize()} Plank"} in response.json()["results"]
+    services_only = make_request("GET", f"/api/catalog/autocomplete?q={word}&kind=service", headers=auth_headers)
+    assert services_only.json()["results"] == []
+    assert make_request("GET", f"/api/catalog/autocomplete?q={word}&kind=tile", headers=auth_headers).status_code == 400
+    
+    make_request("DELETE", f"/api/materials/{material_id}", headers=auth_headers)
+    assert make_request("GET", f"/api/catalog/autocomplete?q={word}", headers=auth_headers).json()["results"] == []
+    stats = make_request("GET", "/api/diagnostics/autocomplete", headers=auth_headers).json()
+    assert stats["memory_bytes"] <= stats["max_bytes"]
+
+def test_payment_archive(auth_token):
+    """Test the employee-only payment archive report and on-demand run."""
+    auth_headers = {
+        "Authorization": f"Bearer {auth_token}",
+        "Content-Type": "application/json"
+    }
+    stats = make_request("GET", "/api/payments/archive", headers=auth_headers)
+    assert stats.status_code == 200, "Failed to load archive stats"
+    assert {"hot", "archived", "due", "after_days"} <= set(stats.json())
+    
+    run = make_request("POST", "/api/payments/archive", headers=auth_headers)
+    assert run.status_code == 202, "Failed to queue archival"
+    assert run.json()["job_id"] > 0
+
+def test_audit_log(auth_token):
+    """Test that catalog and payment mutations show up in the audit history."""
+    auth_headers = {
+        "Authorization": f"Bearer {auth_token}",
+        "Content-Type": "application/json"
+    }
+    created = make_request(
+        "POST",
+        "/api/materials",
+        data={
+            "name": f"Audit Oak {time.time_ns()}",
+            "description": "Oak planks for the audit test",
+            "price_per_unit": 9.5,
+            "unit": "sqft",
+            "stock": 10
+        },
+        headers=auth_headers
+    )
+    assert created.status_code == 200, "Failed to create material"
+    material_id = created.json()["id"]
+    deleted = make_request("DELETE", f"/api/materials/{material_id}", headers=auth_headers)
+    assert deleted.status_code == 204, "Failed to delete material"
+    
+    history = make_request(
+        "GET", f"/api/audit?object_type=material&object_id={material_id}", headers=auth_headers
+    )
+    assert history.status_code == 200, "Failed to load audit history"
+    # Newest first; SQLite may have reused the ID of an earlier test's material
+    events = history.json()["events"][:2]
+    assert [e["action"] for e in events] == ["material.delete", "material.create"]
+    assert events[1]["details"]["price_per_unit"] == 9.5
+    assert events[0]["actor"] and events[0]["request_id"]
+    
+    page = make_request("GET", "/api/audit?limit=1", headers=auth_headers).json()
+    assert len(page["events"]) == 1 and page["next_before"] is not None
+    
+    stats = make_request("GET", "/api/diagnostics/audit", headers=auth_headers)
+    assert stats.status_code == 200
+    assert stats.json()["written"] >= 2
+
+def test_catalog_snapshot(auth_token):
+    """Test that plain catalog listings are served from the shared snapshot once it is current."""
+    auth_headers = {
+        "Authorization": f"Bearer {auth_token}",
+        "Content-Type": "application/json"
+    }
+    created = make_request(
+        "POST",
+        "/api/materials",
+        data={
+            "name": f"Snapshot Maple {time.time_ns()}",
+            "description": "Maple planks for the snapshot test",
+            "price_per_unit": 7.25,
+            "unit": "sqft",
+            "stock": 3
+        },
+        headers=auth_headers
+    )
+    assert created.status_code == 200, "Failed to create material"
+    
+    # The first listing after a change is answered from the database and starts a rebuild
+    for _ in range(40):
+        listing = make_request("GET", "/api/materials?limit=1000", headers=auth_headers)
+        assert listing.status_code == 200
+        if "X-Catalog-Snapshot" in listing.headers:
+            break
+        time.sleep(0.05)
+    assert "X-Catalog-Snapshot" in listing.headers, "Snapshot was never served"
+    # A filter bypasses the snapshot; the response must be byte-for-byte the same
+    from_db = make_request("GET", "/api/materials?limit=1000&min_price=0", headers=auth_headers)
+    assert "X-Catalog-Snapshot" not in from_db.headers
+    assert listing.content == from_db.content
+    assert created.json()["id"] in [m["id"] for m in listing.json()]
+    
+    stats = make_request("GET", "/api/diagnostics/catalog-snapshot", headers=auth_headers).json()
+    assert stats["hits"] >= 1 and stats["sequence"] == int(listing.headers["X-Catalog-Snapshot"])
+
+def test_sparse_fieldsets(auth_token):
+    """Test that fields= returns only the requested keys of materials, services and payments."""
+    auth_headers = {
+        "Authorization": f"Bearer {auth_token}",
+        "Content-Type": "application/json"
+    }
+    created = make_request(
+        "POST",
+        "/api/materials",
+        data={
+            "name": f"Picker Walnut {time.time_ns()}",
+            "description": "Walnut planks with a long description. " * 12,
+            "price_per_unit": 11.5,
+            "unit": "sqft",
+            "stock": 8
+        },
+        headers=auth_headers
+    )
+    assert created.status_code == 200, "Failed to create material"
+    material_id = created.json()["id"]
+    
+    full = make_request("GET", "/api/materials?limit=1000", headers=auth_headers)
+    picker = make_request("GET", "/api/materials?limit=1000&fields=id,name,price_per_unit", headers=auth_headers)
+    assert picker.status_code == 200
+    row = next(m for m in picker.json() if m["id"] == material_id)
+    assert row == {"name": created.json()["name"], "price_per_unit": 11.5, "id": material_id}
+    full_row = next(m for m in full.json() if m["id"] == material_id)
+    assert len(json.dumps(row)) * 5 < len(json.dumps(full_row))
+    
+    services = make_request("GET", "/api/services?fields=id,name", headers=auth_headers)
+    assert services.status_code == 200
+    assert all(set(service) == {"id", "name"} for service in services.json())
+    
+    invalid = make_request("GET", "/api/materials?fields=id,secret", headers=auth_headers)
+    assert invalid.status_code == 400
+    
+    payment = make_request(
+        "POST",
+        "/api/payments/process",
+        data={"amount": 20.0, "currency": "USD", "source_id": "cnon:card-nonce-ok", "reference_id": f"FS-{time.time_ns()}"},
+        headers=auth_headers
+    ).json()
+    detail = make_request("GET", f"/api/payments/{payment['payment_id']}?fields=payment_id,status", headers=auth_headers)
+    assert detail.json() == {"payment_id": payment["payment_id"], "status": "completed"}
+    lookup = make_request(
+        "GET", f"/api/payments/lookup?reference_id={payment['reference_id']}&fields=amount,payment_data", headers=auth_headers
+    )
+    assert lookup.json() == [{"amount": 20.0, "payment_data": payment["payment_data"]}]
@@ -0,0 +1,15 @@
+import pytest
+
+from app.fieldsets import MATERIAL_FIELDS, PAYMENT_FIELDS, parse_fields
+
+def test_fields_come_back_in_response_order():
+    assert parse_fields(None, MATERIAL_FIELDS) is None
+    assert parse_fields("price_per_unit, id,name,id", MATERIAL_FIELDS) == ["name", "price_per_unit", "id"]
+    # The response key, not the schema attribute behind its alias
+    assert parse_fields("payment_data", PAYMENT_FIELDS) == ["payment_data"]
+
+@pytest.mark.parametrize("fields", ["", " , ", "id,hashed_password", "payment_metadata"])
+def test_unknown_or_empty_fields_are_rejected(fields):
+    allowed = PAYMENT_FIELDS if "payment" in fields else MATERIAL_FIELDS
+    with pytest.raises(ValueError):
+        parse_fields(fields, allowed)
@@ -0,0 +1,40 @@
+import asyncio
+import time
+
+from app.middlewares.profiling import ProfileStore, RequestSampler
+
+def _busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+async def test_sampler_only_records_its_own_task():
+    """Time the loop spends on other requests' tasks is left out of a profile."""
+    async def profiled():
+        sampler = RequestSampler(asyncio.get_running_loop(), asyncio.current_task(), 0.001)
+        sampler.start()
+        _busy(0.05)
+        await asyncio.sleep(0)
+        await other
+        sampler.stop()
+        return sampler
+
+    async def unrelated():
+        await asyncio.sleep(0)
+        _busy(0.1)
+
+    other = asyncio.ensure_future(unrelated())
+    sampler = await profiled()
+    names = {key[0] for key in sampler.frames}
+    assert sampler.samples and "_busy" in names
+    assert "unrelated" not in names
+    assert sum(sampler.weights) < 90
+
+def test_store_keeps_newest_profiles(tmp_path):
+    store = ProfileStore(str(tmp_path), max_files=2)
+    for i in range(3):
+        profile_id = f"{1700000000000 + i}-0000000{i}"
+        store.save(profile_id, {"profiles": []}, {"id": profile_id})
+    assert [p["id"] for p in store.list()] == ["1700000000002-00000002", "1700000000001-00000001"]
+    assert store.profile_path("1700000000000-00000000") is None
+    assert store.profile_path("../../etc/passwd") is None
@@ -0,0 +1,62 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import create_engine, func, text
+from sqlalchemy.orm import sessionmaker
+
+from app.catalog import changes_since, current_sequence
+from app.database import Base
+from app.models import Material, Payment, RevenueDaily, User
+from app.seed import seed
+
+def _load(engine, session_factory, **counts):
+    return seed(engine, session_factory, seed=3, end_date=date(2026, 1, 1), days=90, password_hashes=1, **counts)
+
+def test_seed_loads_consistent_rows(engine, session_factory):
+    loaded = _load(engine, session_factory, users=50, materials=200, services=10, payments=500)
+    assert loaded == {"users": 50, "materials": 200, "services": 10, "payments": 500}
+
+    db = session_factory()
+    try:
+        seqs = [seq for (seq,) in db.query(Material.change_seq).order_by(Material.id)]
+        assert None not in seqs and len(set(seqs)) == 200
+        assert db.query(Payment).filter(~Payment.user_id.in_(db.query(User.id))).count() == 0
+        first, last = db.query(func.min(Payment.created_at), func.max(Payment.created_at)).one()
+        assert first.date() >= date(2025, 10, 3) and last.date() < date(2026, 1, 1)
+        assert db.query(RevenueDaily).count() > 0
+        assert db.get(Payment, 1).payment_data["reference_id"] == db.get(Payment, 1).reference_id
+    finally:
+        db.close()
+
+def test_same_seed_gives_the_same_rows(tmp_path, engine, session_factory):
+    _load(engine, session_factory, users=20, materials=50, payments=100)
+    other = create_engine(f"sqlite:///{tmp_path / 'other.db'}")
+    Base.metadata.create_all(bind=other)
+    seed(other, sessionmaker(bind=other), seed=3, end_date=date(2026, 1, 1), days=90, password_hashes=1,
+         users=20, materials=50, payments=100)
+
+    query = text("SELECT id, username, email, phone FROM users UNION ALL "
+                 "SELECT id, name, description, price_per_unit FROM materials UNION ALL "
+                 "SELECT id, payment_id, created_at, amount FROM payments")
+    with engine.connect() as a, other.connect() as b:
+        assert a.execute(query).all() == b.execute(query).all()
+    other.dispose()
+
+def test_catalog_sequence_moves_with_the_seeded_rows(engine, session_factory):
+    # Payments without users fail after the materials were loaded
+    with pytest.raises(ValueError):
+        _load(engine, session_factory, materials=20, payments=10)
+    db = session_factory()
+    try:
+        assert current_sequence(db)["value"] == 0
+        assert db.query(Material).count() == 0
+    finally:
+        db.close()
+
+    _load(engine, session_factory, materials=20)
+    db = session_factory()
+    try:
+        assert current_sequence(db)["value"] == 20
+        assert len(changes_since(db, 0)["materials"]) == 20
+    finally:
+        db.close()
@@ -0,0 +1,22 @@
+from app.server import TunedUvicornWorker, build_parser, server_options
+
+def test_options_come_from_the_environment(monkeypatch):
+    monkeypatch.setenv("WEB_CONCURRENCY", "3")
+    monkeypatch.setenv("SERVER_KEEPALIVE", "15")
+    monkeypatch.setenv("SERVER_PRELOAD", "true")
+    monkeypatch.setenv("SERVER_MAX_REQUESTS", "5000")
+    options = server_options(build_parser().parse_args([]))
+    assert options["workers"] == 3
+    assert options["keepalive"] == 15
+    assert options["preload_app"] is True
+    assert options["max_requests"] == 5000
+    assert options["worker_class"] is TunedUvicornWorker
+
+def test_command_line_overrides_the_environment(monkeypatch):
+    monkeypatch.delenv("HOST", raising=False)
+    monkeypatch.setenv("SERVER_PRELOAD", "true")
+    args = build_parser().parse_args(["--port", "9000", "--no-preload", "--loop", "asyncio", "--http", "h11"])
+    options = server_options(args)
+    assert options["bind"] == "0.0.0.0:9000"
+    assert options["preload_app"] is False
+    assert (args.loop, args.http) == ("asyncio", "h11")
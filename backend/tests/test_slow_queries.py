@@ -0,0 +1,48 @@
+import pytest
+from sqlalchemy import create_engine, text
+
+from app.slowqueries import SlowQueryLog, fingerprint_sql, parameter_shapes
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE items (id INTEGER PRIMARY KEY, sku TEXT, qty INTEGER)"))
+        conn.execute(text("CREATE INDEX ix_items_sku ON items (sku)"))
+    yield engine
+    engine.dispose()
+
+def test_fingerprint_groups_queries_that_differ_only_in_values():
+    a = fingerprint_sql("SELECT * FROM items WHERE sku = 'OAK-1' AND qty > 5 AND id IN (?, ?, ?)")
+    b = fingerprint_sql("SELECT *  FROM items\n WHERE sku = 'PINE''s' AND qty > 12 AND id IN (?, ?)")
+    assert a == b == "SELECT * FROM items WHERE sku = ? AND qty > ? AND id IN (?)"
+    assert fingerprint_sql("INSERT INTO t (a, b) VALUES (%(a)s, %(b)s), (%(a_1)s, %(b_1)s)") == "INSERT INTO t (a, b) VALUES (?)"
+    assert fingerprint_sql("SELECT payload::text FROM t WHERE id = $1") == "SELECT payload::text FROM t WHERE id = ?"
+
+def test_parameter_shapes_hide_values():
+    assert parameter_shapes({"sku": "OAK", "ids": [1, 2]}, False) == {"sku": "str", "ids": "list[2]"}
+    assert parameter_shapes([("OAK", 1), ("ASH", 2)], True) == {"rows": 2, "row": ["str", "int"]}
+
+def test_slow_statements_are_recorded_with_one_plan_per_fingerprint(engine):
+    log = SlowQueryLog(threshold_ms=0, size=3)
+    log.install(engine)
+    with engine.connect() as conn:
+        for sku in ("OAK", "ASH", "ELM", "FIR"):
+            conn.execute(text("SELECT * FROM items WHERE sku = :sku"), {"sku": sku}).all()
+        conn.execute(text("SELECT count(*) FROM items")).scalar()
+
+    report = log.report(sort="count")
+    assert report["recorded"] == 5 and report["buffered"] == 3
+    top = report["offenders"][0]
+    assert top["sql"] == "SELECT * FROM items WHERE sku = ?"
+    assert top["count"] == 2
+    assert any("ix_items_sku" in line for line in top["plan"])
+    assert top["last"]["parameters"] == ["str"]
+    assert top["routes"] == {"(no request)": 2}
+
+def test_fast_statements_are_not_recorded(engine):
+    log = SlowQueryLog(threshold_ms=10_000)
+    log.install(engine)
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    assert log.report()["recorded"] == 0
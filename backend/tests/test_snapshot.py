@@ -0,0 +1,81 @@
+import json
+
+import pytest
+
+from app.catalog import initialize_catalog_sequence, next_change_seq, record_deletion
+from app.models import CatalogSequence, Material, Service
+from app.snapshot import CatalogSnapshot, read_header
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+@pytest.fixture
+def sessions(session_factory, db):
+    initialize_catalog_sequence(db)
+    for i in range(1, 8):
+        db.add(Material(name=f"Oak {i} é", description="Oak planks", price_per_unit=2.5 * i,
+                        unit="sq ft", stock=i, change_seq=next_change_seq(db)))
+    db.add(Service(name="Installation", description="Fitting", base_price=45.0, change_seq=next_change_seq(db)))
+    db.commit()
+    return session_factory
+
+@pytest.fixture
+def snapshot(tmp_path, sessions):
+    return CatalogSnapshot(directory=str(tmp_path / "snapshots"), enabled=True, session_factory=sessions)
+
+def test_pages_match_the_rows(sessions, snapshot):
+    db = sessions()
+    assert snapshot.page(db, "materials", 0, 100) is None
+    built = snapshot._build.result()
+    assert (built["materials"], built["services"]) == (7, 1)
+
+    sequence, body = snapshot.page(db, "materials", 2, 3)
+    assert sequence == built["sequence"]
+    assert json.loads(body) == [
+        {"name": f"Oak {i} é", "description": "Oak planks", "price_per_unit": 2.5 * i,
+         "unit": "sq ft", "stock": i, "id": i}
+        for i in (3, 4, 5)
+    ]
+    assert json.loads(snapshot.page(db, "materials", 6, 10)[1])[0]["id"] == 7
+    assert snapshot.page(db, "materials", 50, 10)[1] == b"[]"
+    assert snapshot.page(db, "materials", 0, 0)[1] == b"[]"
+    assert json.loads(snapshot.page(db, "services", 0, 10)[1])[0]["name"] == "Installation"
+    db.close()
+
+def test_catalog_change_swaps_the_snapshot(sessions, snapshot):
+    snapshot.build()
+    db = sessions()
+    material = db.get(Material, 7)
+    db.delete(material)
+    record_deletion(db, "material", 7)
+    db.commit()
+
+    # Stale: answered from the database while a new snapshot is written
+    assert snapshot.page(db, "materials", 0, 100) is None
+    snapshot._build.result()
+    _, body = snapshot.page(db, "materials", 0, 100)
+    assert [row["id"] for row in json.loads(body)] == [1, 2, 3, 4, 5, 6]
+    assert snapshot.stats()["builds"] == 2
+    db.close()
+
+def test_snapshot_of_another_database_is_not_served(sessions, snapshot):
+    snapshot.build()
+    db = sessions()
+    # Same sequence value, different database
+    db.query(CatalogSequence).update({CatalogSequence.epoch: "0" * 16})
+    db.commit()
+    assert snapshot.page(db, "materials", 0, 100) is None
+    snapshot._build.result()
+    assert read_header(snapshot.path)[1] == "0" * 16
+    db.close()
+
+@pytest.mark.skipif(fcntl is None, reason="needs flock")
+def test_one_builder_at_a_time(snapshot):
+    snapshot.build()
+    with open(snapshot.lock_path, "a") as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        assert snapshot.build() is None
+    # Current already, so nothing to write
+    assert snapshot.build() is None
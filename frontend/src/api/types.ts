@@ -13,6 +13,7 @@ export interface LoginRequest {
 export interface LoginResponse {
   access_token: string;
   token_type: string;
+  refresh_token?: string;
 }
 
 export interface UserResponse {
@@ -37,6 +38,22 @@ export interface Service {
   base_price: number;
 }
 
+export interface CatalogTombstone {
+  kind: 'material' | 'service';
+  id: number;
+  change_seq: number;
+  deleted_at: string;
+}
+
+export interface CatalogChanges {
+  since: number;
+  next_since: number;
+  has_more: boolean;
+  materials: (Material & { change_seq: number })[];
+  services: (Service & { change_seq: number })[];
+  deleted: CatalogTombstone[];
+}
+
 export interface HealthCheckResponse {
   status: string;
   message: string;